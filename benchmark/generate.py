@@ -0,0 +1,137 @@
+"""
+Generates a synthetic photo library for benchmarks: a tree of small but valid JPEG (with or without
+EXIF dates) and MP4 (with mvhd dates) files, named the way cameras and phones name them:
+
+    date        20230101_120000.jpg
+    whatsapp    IMG-20190203-WA0001.jpg
+    video       20210704_100000.mp4
+    garbage     DSC01234.JPG, Scan (3).jpg, 8f3ac2e1.jpeg...
+
+Files are spread over nested directories of --fanout files (and up to --fanout subdirectories) each.
+The same seed gives the same tree.
+"""
+
+import os
+import sys
+import time
+import random
+import struct
+import argparse
+import datetime
+
+PATTERNS = {"date": 50, "whatsapp": 25, "video": 10, "garbage": 15}     # default mix, in percent
+EPOCH_1904 = datetime.datetime(1904, 1, 1)
+
+
+def jpeg(date=None):
+    """A minimal JPEG, with ModifyDate, DateTimeOriginal and CreateDate set to date ("yyyy:mm:dd hh:mm:ss") if given."""
+    app0 = b"\xff\xe0" + struct.pack(">H", 16) + b"JFIF\x00\x01\x01\x00\x00\x01\x00\x01\x00\x00"
+    scan = b"\xff\xda\x00\x02" + b"\x00" * 64 + b"\xff\xd9"
+    if date is None:
+        return b"\xff\xd8" + app0 + scan
+    value = date.encode() + b"\x00"
+    ifd0 = 8
+    exif_ifd = ifd0 + 2 + 2 * 12 + 4
+    data = exif_ifd + 2 + 2 * 12 + 4
+    tiff = b"II*\x00" + struct.pack("<I", ifd0) \
+        + struct.pack("<H", 2) + struct.pack("<HHII", 0x0132, 2, 20, data) \
+        + struct.pack("<HHII", 0x8769, 4, 1, exif_ifd) + struct.pack("<I", 0) \
+        + struct.pack("<H", 2) + struct.pack("<HHII", 0x9003, 2, 20, data + 20) \
+        + struct.pack("<HHII", 0x9004, 2, 20, data + 40) + struct.pack("<I", 0) \
+        + value * 3
+    app1 = b"Exif\x00\x00" + tiff
+    return b"\xff\xd8" + app0 + b"\xff\xe1" + struct.pack(">H", len(app1) + 2) + app1 + scan
+
+
+def _box(box_type, payload):
+    return struct.pack(">I", 8 + len(payload)) + box_type + payload
+
+
+def mp4(when):
+    """A minimal MP4 with its mvhd creation and modification time set to the datetime when (UTC)."""
+    seconds = int((when - EPOCH_1904).total_seconds())
+    mvhd = _box(b"mvhd", b"\x00\x00\x00\x00" + struct.pack(">IIII", seconds, seconds, 1000, 0) + b"\x00" * 80)
+    return _box(b"ftyp", b"isom\x00\x00\x02\x00isommp41") + _box(b"mdat", b"\x00" * 256) + _box(b"moov", mvhd)
+
+
+def _name(pattern, when, i, rng):
+    if pattern == "date":
+        return when.strftime("%Y%m%d_%H%M%S") + f"_{i}.jpg"
+    if pattern == "whatsapp":
+        return when.strftime("IMG-%Y%m%d") + f"-WA{i % 10000:04d}_{i}.jpg"
+    if pattern == "video":
+        return when.strftime("%Y%m%d_%H%M%S") + f"_{i}.mp4"
+    return rng.choice(("DSC{:05d}_{}.JPG", "Scan ({1}).jpg", "{0:08x}{1}.jpeg", "P{0:07d}_{1}.JPG")).format(
+        rng.randrange(1 << 24), i)
+
+
+def directory_of(i, fanout):
+    """Relative directory of file number i: the leaf index i // fanout written in base fanout."""
+    leaf = i // fanout
+    parts = []
+    while leaf:
+        leaf, digit = divmod(leaf, fanout)
+        parts.append(f"d{digit:03d}")
+    return os.path.join(*reversed(parts)) if parts else ""
+
+
+def generate_tree(root, files, fanout=1000, patterns=PATTERNS, exif_ratio=0.6, upper_ratio=0.3, seed=1):
+    """Write files files below root, returns the number of bytes written."""
+    rng = random.Random(seed)
+    names = list(patterns)
+    weights = [patterns[name] for name in names]
+    start = datetime.datetime(2005, 1, 1)
+    span = int((datetime.datetime(2024, 12, 31) - start).total_seconds())
+    made = set()
+    written = 0
+    for i in range(files):
+        directory = os.path.join(root, directory_of(i, fanout))
+        if directory not in made:
+            os.makedirs(directory, exist_ok=True)
+            made.add(directory)
+        pattern = rng.choices(names, weights)[0]
+        when = start + datetime.timedelta(seconds=rng.randrange(span))
+        name = _name(pattern, when, i, rng)
+        if rng.random() < upper_ratio:
+            stem, ext = os.path.splitext(name)
+            name = stem + ext.upper()
+        if pattern == "video":
+            data = mp4(when)
+        else:
+            data = jpeg(when.strftime("%Y:%m:%d %H:%M:%S") if rng.random() < exif_ratio else None)
+        with open(os.path.join(directory, name), "wb") as f:
+            f.write(data)
+        written += len(data)
+    return written
+
+
+def parse_patterns(text):
+    """"date=50,whatsapp=25" -> {"date": 50, "whatsapp": 25}"""
+    patterns = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        if name not in PATTERNS:
+            raise argparse.ArgumentTypeError(f"unknown pattern {name}, valid patterns: {', '.join(PATTERNS)}")
+        patterns[name] = float(weight or 1)
+    return patterns
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate a synthetic photo library for benchmarks.")
+    parser.add_argument("directory", help="root of the tree to generate")
+    parser.add_argument("files", type=int, help="number of files")
+    parser.add_argument("--fanout", type=int, default=1000, help="number of files per directory")
+    parser.add_argument("--patterns", type=parse_patterns, default=PATTERNS,
+                        help="filename patterns and their weights, eg. date=50,whatsapp=25,video=10,garbage=15")
+    parser.add_argument("--exif-ratio", type=float, default=0.6, help="fraction of the JPEG files with EXIF dates")
+    parser.add_argument("--upper-ratio", type=float, default=0.3, help="fraction of the files with an uppercase extension")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    if args.fanout < 2:
+        print("Error, the fanout must be at least 2")
+        sys.exit(2)
+    start = time.time()
+    size = generate_tree(args.directory, args.files, args.fanout, args.patterns, args.exif_ratio, args.upper_ratio,
+                         args.seed)
+    print(f"Generated {args.files} files ({size} bytes) in {args.directory} in {time.time() - start:.1f} seconds")
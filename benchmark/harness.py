@@ -0,0 +1,137 @@
+"""
+Runs the five scripts on generated trees of 10k, 100k and 1M files (see generate.py) and reports
+files/s, peak RSS of the script process (from the rusage of os.wait4) and, with --strace when strace
+is installed, the number of system calls in a separate run (strace slows the script down too much
+to time it in the same run). Every script gets a freshly generated tree, namebasedexif runs against
+fakeexiftool.py with the configured latency.
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import tempfile
+import argparse
+import subprocess
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.join(HERE, "..")
+sys.path.insert(0, HERE)
+import generate
+
+FAKE_EXIFTOOL = os.path.join(ROOT, "common", "fakeexiftool.py")
+SCRIPTS = ["listfiletypes", "renamelowercase", "namebasedexif", "changemodificationdate", "orderbydate"]
+SIZES = [10_000, 100_000, 1_000_000]
+
+
+def command(script, tree, workdir):
+    """The command line of one script on a generated tree."""
+    path = os.path.join(ROOT, script, script + ".py")
+    if script == "namebasedexif":
+        return [sys.executable, path, tree, "--exiftool", FAKE_EXIFTOOL, "--no-cache", "--no-progress"]
+    if script == "orderbydate":
+        destination = os.path.join(workdir, "sorted")
+        exceptions = os.path.join(workdir, "exceptions")
+        os.makedirs(destination, exist_ok=True)
+        os.makedirs(exceptions, exist_ok=True)
+        return [sys.executable, path, tree, destination, exceptions, "1990-2030", "--no-progress"]
+    return [sys.executable, path, tree, "--no-progress"]
+
+
+def run(cmd, env):
+    """Run a command, returns (seconds, peak RSS in KB or None, exit status)."""
+    start = time.perf_counter()
+    proc = subprocess.Popen(cmd, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    if hasattr(os, "wait4"):
+        _, status, rusage = os.wait4(proc.pid, 0)
+        proc.returncode = os.waitstatus_to_exitcode(status)
+        rss = rusage.ru_maxrss      # KB on Linux
+    else:
+        proc.wait()
+        rss = None
+    return time.perf_counter() - start, rss, proc.returncode
+
+
+def count_syscalls(cmd, env, workdir):
+    """Returns (total number of system calls, {syscall: calls} of the top ten) from strace -c."""
+    output = os.path.join(workdir, "strace.txt")
+    subprocess.run(["strace", "-f", "-c", "-o", output] + cmd, env=env,
+                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    calls = {}
+    total = None
+    with open(output) as f:
+        for line in f:
+            fields = line.split()
+            # % time, seconds, usecs/call, calls, [errors], syscall
+            if len(fields) >= 5 and fields[3].isdigit():
+                if fields[-1] == "total":
+                    total = int(fields[3])
+                else:
+                    calls[fields[-1]] = int(fields[3])
+    top = dict(sorted(calls.items(), key=lambda item: -item[1])[:10])
+    return total, top
+
+
+def benchmark(script, files, args, workdir):
+    tree = os.path.join(workdir, "tree")
+    generate.generate_tree(tree, files, args.fanout, seed=args.seed)
+    env = dict(os.environ, FAKE_EXIFTOOL_DB=os.path.join(workdir, "fakeexiftool-db"),
+               FAKE_EXIFTOOL_LATENCY=str(args.exiftool_latency),
+               FAKE_EXIFTOOL_FILE_LATENCY=str(args.exiftool_file_latency))
+    cmd = command(script, tree, workdir)
+    seconds, rss, status = run(cmd, env)
+    result = {"script": script, "files": files, "seconds": round(seconds, 3),
+              "files_per_second": round(files / seconds), "peak_rss_kb": rss, "exit_status": status}
+    if args.strace:
+        shutil.rmtree(workdir)
+        os.makedirs(workdir)
+        generate.generate_tree(tree, files, args.fanout, seed=args.seed)
+        cmd = command(script, tree, workdir)
+        result["syscalls"], result["top_syscalls"] = count_syscalls(cmd, env, workdir)
+    return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the scripts on generated photo libraries.")
+    parser.add_argument("--sizes", default=",".join(str(size) for size in SIZES),
+                        help="comma separated numbers of files (default 10000,100000,1000000)")
+    parser.add_argument("--scripts", default=",".join(SCRIPTS), help="comma separated scripts to run")
+    parser.add_argument("--fanout", type=int, default=1000, help="number of files per generated directory")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--exiftool-latency", type=float, default=0.0,
+                        help="seconds the fake exiftool waits per command")
+    parser.add_argument("--exiftool-file-latency", type=float, default=0.0,
+                        help="seconds the fake exiftool waits per file of a command")
+    parser.add_argument("--strace", action="store_true", help="also count the system calls (needs strace)")
+    parser.add_argument("--workdir", help="directory for the generated trees (default a temp directory)")
+    parser.add_argument("--output", default="benchmark.json", help="file the results are written to as json")
+    args = parser.parse_args()
+
+    scripts = [name.strip() for name in args.scripts.split(",") if name.strip()]
+    unknown = [name for name in scripts if name not in SCRIPTS]
+    if unknown:
+        print(f"Error, unknown scripts: {', '.join(unknown)}. Valid scripts: {', '.join(SCRIPTS)}")
+        sys.exit(1)
+    if args.strace and shutil.which("strace") is None:
+        print("Error, --strace needs strace on the PATH")
+        sys.exit(2)
+    sizes = [int(size) for size in args.sizes.split(",")]
+
+    results = []
+    print(f"{'script':<24}{'files':>10}{'seconds':>10}{'files/s':>10}{'peak RSS MB':>13}{'syscalls':>12}")
+    for files in sizes:
+        for script in scripts:
+            workdir = tempfile.mkdtemp(prefix=f"bench-{script}-", dir=args.workdir)
+            try:
+                result = benchmark(script, files, args, workdir)
+            finally:
+                shutil.rmtree(workdir, ignore_errors=True)
+            results.append(result)
+            rss = f"{result['peak_rss_kb'] / 1024:.1f}" if result["peak_rss_kb"] else "-"
+            failed = "" if result["exit_status"] == 0 else f"  (exit status {result['exit_status']})"
+            print(f"{script:<24}{files:>10}{result['seconds']:>10.2f}{result['files_per_second']:>10}{rss:>13}"
+                  f"{result.get('syscalls') or '-':>12}{failed}")
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=1)
+    print(f"\nResults written to {args.output}")
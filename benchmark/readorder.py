@@ -0,0 +1,97 @@
+"""
+Compares reading the heads of the files of a tree in walk order with physical order (see
+common/physorder.py), the way namebasedexif --physical-order and listfiletypes --sniff --physical-order
+read them. Before every run the files are dropped from the page cache with posix_fadvise(DONTNEED),
+so the reads go to the disk; the orders are run alternately to even out drift. The difference only
+shows on spinning disks, on an SSD physical order is slower (the sorting costs more than it saves),
+which is why the scripts only reorder on devices /sys reports as rotational.
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, "..", "common"))
+sys.path.insert(0, HERE)
+import treewalker
+import generate
+from physorder import PhysicalOrder
+
+
+def drop_cache(paths):
+    """Evict the pages of the files from the page cache, as far as the kernel lets an unprivileged process."""
+    for path in paths:
+        try:
+            fd = os.open(path, os.O_RDONLY)
+        except OSError:
+            continue
+        try:
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+        finally:
+            os.close(fd)
+
+
+def read_heads(paths, size):
+    for path in paths:
+        try:
+            with open(path, "rb") as f:
+                f.read(size)
+        except OSError:
+            pass
+
+
+def run(paths, order, window, size):
+    """Seconds to read the heads of all paths in walk order or in physical order per window."""
+    drop_cache(paths)
+    start = time.perf_counter()
+    if order == "walk":
+        read_heads(paths, size)
+    else:
+        scheduler = PhysicalOrder(size, rotational_only=False)     # measured on any disk
+        for i in range(0, len(paths), window):
+            read_heads(scheduler.order(paths[i:i + window]), size)
+    return time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark reading file heads in walk order and in physical order.")
+    parser.add_argument("directory", help="tree to read, generated first with --generate")
+    parser.add_argument("--generate", type=int, metavar="FILES", help="first generate a tree of this many files")
+    parser.add_argument("--window", type=int, default=200,
+                        help="files ordered at once (namebasedexif: batch size * sessions, listfiletypes: 1000)")
+    parser.add_argument("--head", type=int, default=128 * 1024, help="bytes read of every file")
+    parser.add_argument("--runs", type=int, default=3, help="runs of each order")
+    parser.add_argument("--output", help="file the results are written to as json")
+    args = parser.parse_args()
+
+    if args.generate:
+        generate.generate_tree(args.directory, args.generate)
+    if not os.path.isdir(args.directory):
+        print(f"Error, '{args.directory}' is not a valid directory. Exiting...")
+        sys.exit(2)
+    paths = [entry.path for entry in treewalker.walk_files(args.directory)]
+    if not hasattr(os, "posix_fadvise"):
+        print("Error, this benchmark needs posix_fadvise")
+        sys.exit(2)
+
+    times = {"walk": [], "physical": []}
+    for _ in range(args.runs):
+        for order in times:
+            times[order].append(run(paths, order, args.window, args.head))
+    scheduler = PhysicalOrder(args.head, rotational_only=False)
+    scheduler.order(paths[:args.window])
+
+    results = {"files": len(paths), "window": args.window, "head": args.head}
+    print(f"{len(paths)} files, windows of {args.window}, {args.head} bytes per file")
+    print(scheduler.summary().strip() + " (first window)")
+    for order, seconds in times.items():
+        best = min(seconds)
+        results[order] = {"seconds": [round(s, 3) for s in seconds], "files_per_second": round(len(paths) / best)}
+        print(f"  {order:<10} best {best:8.2f} s  {len(paths) / best:10.0f} files/s")
+    print(f"  speedup of physical order: {min(times['walk']) / min(times['physical']):.2f}x")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=1)
@@ -4,128 +4,226 @@ based on the first 8 characters of their filenames. (thanks Gemini for the initi
 """
 
 import os
-import datetime
+import math
 import time
 import platform
 import sys
+import argparse
+from concurrent.futures import ThreadPoolExecutor
 
-def modify_creation_date(directory):
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "common"))
+import treewalker
+import filenamedate
+import instrument
+from reporter import Reporter, BufferedLog, add_report_arguments, report_options
+from shards import ShardEntry, add_worker_arguments, walk_shards, run_shards, interrupted_summary, failed_summary
 
-    start = time.time()
-    log = open(os.path.join(directory, "./changemodificationdate.rep"), 'w') 
-
-    message = "\n===================== changemodificationdate.py =====================\n" \
-                        + "\n     Processing directory: " + directory +"\n"
-    log.write(message)
-    print(message)
-    for root, _, files in os.walk(directory):
-        for filename in files:
-            log.write(f"\n\n  » processing file: {filename}")
-            f = filename.replace("-", "")
-            f=f.replace("_","")
-            f=f.replace(".", "")
-            year = 0
-            month = 1
-            day = 1
-            hour = 0
-            minute = 0
-            second = 0
-
-            if len(f) > 4:      # year
-                tmp = f[:4]
-                if tmp.isdigit():
-                    tmp = int(tmp)
-                    if tmp < 1970:
-                        year = 1970
-                    elif tmp >= 1970 and tmp <= datetime.date.today().year:
-                        year = tmp
-
-            if year == 0:   # no valid year found -> no mutations to the file
-                log.write("\n  ...no valid dates found, skipping file.")
-                continue
-
-            if len(f) > 6:      # month
-                tmp = f[4:6]
-                if tmp.isdigit():
-                    tmp = int(tmp)
-                    if tmp >= 1 and tmp <= 12:
-                        month = tmp
-            if len(f) > 8:      # day
-                tmp = f[6:8]
-                if tmp.isdigit():
-                    tmp = int(tmp)
-                    if tmp >= 1 and tmp <= 31:
-                        day = tmp
-            if len(f) > 10:      # hour
-                tmp = f[8:10]
-                if tmp.isdigit():
-                    tmp = int(tmp)
-                    if tmp >= 0 and tmp <= 23:
-                        hour = tmp
-            if len(f) > 12:      # minute
-                tmp = f[10:12]
-                if tmp.isdigit():
-                    tmp = int(tmp)
-                    if tmp >= 0 and tmp <= 59:
-                        minute = tmp
-            if len(f) > 14:      # seconds
-                tmp = f[12:14]
-                if tmp.isdigit():
-                    tmp = int(tmp)
-                    if tmp >= 0 and tmp <= 59:
-                        second = tmp
-
-            message = f"\n  ...year: {year}"  \
-                                + f"\n  ...month: {month}" \
-                                + f"\n  ...day: {day}" \
-                                + f"\n  ...hour: {hour}" \
-                                + f"\n  ...minute: {minute}" \
-                                + f"\n  ...second: {second}"
-            log.write(message)
+CHUNK_SIZE = 1000
+_executor = None        # the utime thread pool of a worker process
+
+
+def date_message(filename, fields):
+    """The report text of the date read from a filename, fields is None when there is none."""
+    message = f"\n\n  » processing file: {filename}"
+    if fields is None:   # no valid year found -> no mutations to the file
+        return message + "\n  ...no valid dates found, skipping file."
+    year, month, day, hour, minute, second = fields
+    return message + f"\n  ...year: {year}"  \
+                        + f"\n  ...month: {month}" \
+                        + f"\n  ...day: {day}" \
+                        + f"\n  ...hour: {hour}" \
+                        + f"\n  ...minute: {minute}" \
+                        + f"\n  ...second: {second}"
+
+
+def parse_file_date(filename):
+    """Returns (timestamp, report text) for one filename, the timestamp is None when the file is to be skipped."""
+    t = instrument.start()
+    fields = filenamedate.parse_name(filename, filenamedate.SEPARATORS)
+    instrument.stop("filename.parse", t)
+    message = date_message(filename, fields)
+    if fields is None:
+        return None, message
+    try:
+        return filenamedate.to_timestamp(fields), message
+    except ValueError:
+        return None, message + f"\n  ...invalid date format in filename: {filename}"
+    except Exception as e:
+        return None, message + f"\n  ...error processing file {filename}: {e}"
+
+
+def is_unchanged(st, timestamp):
+    """True if a stat result already carries the timestamp, so setting it again would only dirty the inode."""
+    target = round(timestamp * 1_000_000_000)
+    if st.st_mtime_ns != target:
+        return False
+    if platform.system() == 'Windows':
+        # the creation time is set as well on Windows
+        return getattr(st, "st_birthtime_ns", st.st_ctime_ns) == target
+    return True
+
+
+def apply_timestamp(filepath, timestamp):
+    """Set the dates of one file, returns (status, report text), status is "applied" or "failed"."""
+    message = ""
+    t = instrument.start()
+    try:
+        if platform.system() == 'Windows':
+            # Windows: Modification and creation times are set together
+            os.utime(filepath, (timestamp, timestamp))
 
+            # Set creation time directly (Windows specific, requires pywin32 module):
             try:
-                dt = datetime.datetime(year, month, day, hour, minute,second)
-                timestamp = time.mktime(dt.timetuple())
-                filepath = os.path.join(root, filename)
-                if platform.system() == 'Windows':
-                    # Windows: Modification and creation times are set together
-                    os.utime(filepath, (timestamp, timestamp))
-
-                    # Set creation time directly (Windows specific, requires pywin32 module):
-                    try:
-                        import win32_setctime
-                        win32_setctime.setctime(filepath, timestamp)
-                    except ImportError:
-                        log.write("\n  ...warning: pywin32 module not found. Creation time may not be set on Windows.")
-                    except Exception as e:
-                        log.write(f"\n  ...error setting creation time on windows: {e}")
-                else:
-                    # Unix-like systems (Linux, macOS): Modification and access times are set.
-                    os.utime(filepath, (timestamp, timestamp))
-                    #setting the birthtime is more complex and system dependent, and often requires root.
-            except ValueError:
-                log.write(f"\n  ...invalid date format in filename: {filename}")
+                import win32_setctime
+                win32_setctime.setctime(filepath, timestamp)
+            except ImportError:
+                message += "\n  ...warning: pywin32 module not found. Creation time may not be set on Windows."
             except Exception as e:
-                log.write(f"\n  ...error processing file {filename}: {e}")
+                message += f"\n  ...error setting creation time on windows: {e}"
+        else:
+            # Unix-like systems (Linux, macOS): Modification and access times are set.
+            os.utime(filepath, (timestamp, timestamp))
+            #setting the birthtime is more complex and system dependent, and often requires root.
+    except Exception as e:
+        return "failed", message + f"\n  ...error processing file {os.path.basename(filepath)}: {e}"
+    instrument.stop("utime", t)
+    return "applied", message
+
 
-    message = f"\n\n    Script runtime: {round(time.time()-start)} seconds" \
-                        + "\n======================= end of script =======================\n"
-    log.write(message)
-    print(message)
-    log.close()
+def report_file(log, filepath, status, message):
+    """Write the report text of one file, failures also end up in an errors-only report."""
+    if status == "failed":
+        log.error(message, path=filepath)
+    else:
+        log.write(message)
+    log.file(filepath, status)
 
 
-if __name__ == "__main__":
-    if len(sys.argv) != 2:
-        print("Error, provide a targed directory as argument.")
-        sys.exit(1)
+def process_file(filepath, log, st=None):
+    """
+    Set the modification date of one file from the date in its filename, skipped if the
+    (cached) stat result st shows it already has it. Returns "applied", "unchanged", "failed" or "skipped".
+    """
+    timestamp, message = parse_file_date(os.path.basename(filepath))
+    if timestamp is None:
+        status = "skipped"
+    elif st is not None and is_unchanged(st, timestamp):
+        status = "unchanged"
+        message += "\n  ...unchanged, the file already has this date."
     else:
-        target_directory = sys.argv[1]
-        if not os.path.isdir(target_directory):
-            print(f"Error, '{target_directory}' is not a valid directory. Exiting...")
-            sys.exit(2)
+        status, result = apply_timestamp(filepath, timestamp)
+        message += result
+    report_file(log, filepath, status, message)
+    return status
+
+
+def process_chunk(entries, executor, log, counts):
+    """Parse a chunk of files in one go, run the utime calls on the executor, report in walk order."""
+    results = []
+    fields = []
+    t = instrument.start()
+    timestamps = filenamedate.parse_batch([entry.name for entry in entries], filenamedate.SEPARATORS, fields)
+    instrument.stop("filename.parse_batch", t)
+    for entry, timestamp, parsed in zip(entries, timestamps, fields):
+        if math.isnan(timestamp):
+            # why a parsed date has no timestamp (eg. a day the month lacks) is reported by the single name parser
+            message = date_message(entry.name, None) if parsed is None else parse_file_date(entry.name)[1]
+            results.append((message, "skipped"))
+            continue
+        message = date_message(entry.name, parsed)
+        try:
+            unchanged = is_unchanged(entry.stat(), timestamp)
+        except OSError as e:        # gone (or unreadable) since the walk
+            results.append((message + f"\n  ...error processing file {entry.name}: {e}", "failed"))
+            continue
+        if unchanged:
+            results.append((message + "\n  ...unchanged, the file already has this date.", "unchanged"))
         else:
-            modify_creation_date(target_directory)
+            results.append((message, executor.submit(apply_timestamp, entry.path, timestamp)))
+    for entry, (message, status) in zip(entries, results):
+        if not isinstance(status, str):
+            status, result = status.result()
+            message += result
+        counts[status] += 1
+        report_file(log, entry.path, status, message)
+    log.tick(len(entries))
+
+
+def _init_worker(threads):
+    global _executor
+    _executor = ThreadPoolExecutor(max_workers=threads)
+
+
+def process_shard(directory, names, report_options):
+    """Process the files of one shard in a worker process, returns the result of its BufferedLog."""
+    log = BufferedLog(**report_options)
+    counts = {"applied": 0, "unchanged": 0, "failed": 0, "skipped": 0}
+    process_chunk([ShardEntry(directory, name) for name in names], _executor, log, counts)
+    return log.result()
+
+
+def modify_creation_date(directory, walk_options={}, threads=8, report_options={}, workers=0):
+
+    start = time.time()
+    # closed even when the run fails halfway, so the report written so far is not lost
+    with Reporter(os.path.join(directory, "./changemodificationdate.rep"), **report_options) as log:
+
+        message = "\n===================== changemodificationdate.py =====================\n" \
+                            + "\n     Processing directory: " + directory +"\n"
+        log.summary(message)
+
+        counts = {"applied": 0, "unchanged": 0, "failed": 0, "skipped": 0}
+        if workers:
+            run = run_shards(walk_shards(directory, walk_options), process_shard, (report_options,), log, workers,
+                             walk_options.get("ordered", False), _init_worker, (threads,))
+            counts.update(run.statuses)
+            if run.interrupted:
+                log.summary(interrupted_summary(run))
+            if run.failed:
+                log.summary(failed_summary(run))
+        else:
+            # utime is a round trip per file on NFS, so the calls are spread over a thread pool
+            with ThreadPoolExecutor(max_workers=threads) as executor:
+                chunk = []
+                # the stat results come cached from the walker threads for the no-op check
+                for entry in treewalker.walk_files(directory, stat=True, **walk_options):
+                    chunk.append(entry)
+                    if len(chunk) >= CHUNK_SIZE:
+                        process_chunk(chunk, executor, log, counts)
+                        chunk = []
+                if chunk:
+                    process_chunk(chunk, executor, log, counts)
+
+        message = f"\n\n  Script finished, processed {sum(counts.values())} files:" \
+                            + f"\n   .......... dates applied: {counts['applied']}" \
+                            + f"\n   .......... already up to date: {counts['unchanged']}" \
+                            + f"\n   .......... failed: {counts['failed']}" \
+                            + f"\n   .......... no valid date in filename: {counts['skipped']}"
+        log.summary(message)
+
+        message = f"\n\n    Script runtime: {round(time.time()-start)} seconds" \
+                            + "\n======================= end of script =======================\n"
+        log.summary(message)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Set the modification date of files from the date in their filename.")
+    parser.add_argument("directory", help="targed directory")
+    parser.add_argument("--threads", type=int, default=8,
+                        help="number of threads setting file dates (per worker with --workers)")
+    add_worker_arguments(parser, "setting file dates")
+    treewalker.add_walk_arguments(parser)
+    add_report_arguments(parser)
+    instrument.add_instrument_arguments(parser)
+    args = parser.parse_args()
+    instrument.start_run(args)
+
+    if not os.path.isdir(args.directory):
+        print(f"Error, '{args.directory}' is not a valid directory. Exiting...")
+        sys.exit(2)
+    else:
+        modify_creation_date(args.directory, treewalker.walk_options(args), args.threads, report_options(args),
+                             args.workers)
 
 
 
@@ -0,0 +1,217 @@
+"""
+Persistent catalog of a photo library (stdlib sqlite3): path, extension, size, mtime and resolved
+date of every file, indexed on date and extension, so questions like "how many .heic files from
+2019" are answered without walking the tree.
+
+The catalog is refreshed incrementally by directory mtimes: adding, removing or renaming an entry
+changes the mtime of its directory, so a refresh costs one stat per directory and only lists the
+directories that changed. The subdirectories of unchanged directories come from the catalog.
+A file rewritten in place (same name) does not change its directory, its size and mtime are only
+updated when its directory changes for another reason or on a rebuild.
+
+The resolved date is the date of the yyyy/mm directory a file is in (the tree orderbydate builds),
+refined by the date in the file name where that agrees, or else the date in the file name.
+"""
+
+import os
+import time
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+
+import treewalker
+import filenamedate
+
+CATALOG_FILE = "library.catalog"
+RACY_SECONDS = 2        # a directory changed this recently may change again within the same mtime tick
+# names are read like changemodificationdate reads them, but a year before 1900 is no date instead of
+# 1970: counters like 0001.jpg or 1234.jpg are not dates
+NAME_DATES = filenamedate.Profile("catalog", filenamedate.SEPARATORS.normalize, follow=True, clamp_year=None,
+                                  min_year=1900)
+
+
+def resolve_date(directory, name):
+    """"yyyy-mm-dd hh:mm:ss", "yyyy-mm" or None for a file name in a directory (relative to the library root)."""
+    parts = directory.split(os.sep)[-2:]
+    folder = None
+    if len(parts) == 2 and len(parts[0]) == 4 and parts[0].isdigit() and len(parts[1]) == 2 and parts[1].isdigit() \
+            and 1 <= int(parts[1]) <= 12:
+        folder = (int(parts[0]), int(parts[1]))
+    fields = filenamedate.parse_name(name, NAME_DATES)
+    if fields is not None and (folder is None or fields[:2] == folder):
+        return "{:04d}-{:02d}-{:02d} {:02d}:{:02d}:{:02d}".format(*fields)
+    if folder is not None:
+        return "{:04d}-{:02d}".format(*folder)
+    return None
+
+
+def date_range(prefix):
+    """The [low, high) range of stored dates matching a prefix like 2019, 2021-07 or 2021/07."""
+    prefix = prefix.replace("/", "-")
+    return prefix, prefix + "~"     # "~" sorts after the digits and separators of a date
+
+
+def _check(path, known_mtime):
+    """Returns (path, mtime_ns, listing): listing is None when the directory is unchanged or gone (mtime None)."""
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except OSError:
+        return path, None, None
+    if mtime == known_mtime:
+        return path, mtime, None
+    files = []
+    dirs = []
+    try:
+        with os.scandir(path) as it:
+            for entry in it:
+                try:
+                    if entry.is_dir():
+                        if not entry.is_symlink():
+                            dirs.append(entry.path)
+                    elif entry.is_file() and entry.name not in treewalker.REPORT_FILES:
+                        st = entry.stat()
+                        files.append((entry.name, st.st_size, st.st_mtime_ns))
+                except OSError:
+                    continue
+    except OSError:
+        return path, None, None
+    return path, mtime, (files, dirs)
+
+
+class Catalog:
+
+    def __init__(self, path, root, rebuild=False):
+        self.path = path
+        self.root = os.path.abspath(root)
+        self.db = sqlite3.connect(path)
+        if rebuild:
+            self.db.execute("DROP TABLE IF EXISTS files")
+            self.db.execute("DROP TABLE IF EXISTS dirs")
+        self.db.execute("CREATE TABLE IF NOT EXISTS dirs (path TEXT PRIMARY KEY, parent TEXT, mtime_ns INTEGER)")
+        self.db.execute("CREATE TABLE IF NOT EXISTS files ("
+                        "path TEXT PRIMARY KEY, dir TEXT, ext TEXT, size INTEGER, mtime_ns INTEGER, date TEXT)")
+        self.db.execute("CREATE INDEX IF NOT EXISTS files_dir ON files (dir)")
+        self.db.execute("CREATE INDEX IF NOT EXISTS files_date ON files (date)")
+        self.db.execute("CREATE INDEX IF NOT EXISTS files_ext ON files (ext COLLATE NOCASE)")
+        self.db.commit()
+        self._touched = set()       # directories record() added files to
+
+    def _relative(self, path):
+        relative = os.path.relpath(path, self.root)
+        return "" if relative == "." else relative
+
+    def _store_dir(self, relative, files, mtime):
+        self.db.execute("DELETE FROM files WHERE dir=?", (relative,))
+        self.db.executemany("INSERT INTO files VALUES (?, ?, ?, ?, ?, ?)",
+                            [(os.path.join(relative, name), relative, os.path.splitext(name)[1], size, mtime_ns,
+                              resolve_date(relative, name)) for name, size, mtime_ns in files])
+        self.db.execute("INSERT OR REPLACE INTO dirs VALUES (?, ?, ?)",
+                        (relative, os.path.dirname(relative) if relative else None, mtime))
+
+    def refresh(self, threads=treewalker.DEFAULT_THREADS):
+        """Bring the catalog in line with the tree, returns (directories checked, directories listed)."""
+        known = {}
+        children = {}
+        for path, parent, mtime in self.db.execute("SELECT path, parent, mtime_ns FROM dirs"):
+            known[path] = mtime
+            if parent is not None:
+                children.setdefault(parent, []).append(path)
+        seen = set()
+        listed = 0
+        racy = time.time_ns() - RACY_SECONDS * 1_000_000_000
+        level = [""]
+        # breadth first, the directories of one level are checked on the pool at once
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            while level:
+                results = executor.map(_check, [os.path.join(self.root, path) for path in level],
+                                       [known.get(path) for path in level])
+                next_level = []
+                for path, mtime, listing in results:
+                    if mtime is None:
+                        continue        # gone, its rows are dropped below
+                    relative = self._relative(path)
+                    seen.add(relative)
+                    if listing is None:
+                        next_level.extend(children.get(relative, ()))
+                        continue
+                    files, dirs = listing
+                    listed += 1
+                    # a directory that changed just now is listed again next time, its mtime may not show the next change
+                    self._store_dir(relative, files, mtime if mtime < racy else None)
+                    next_level.extend(self._relative(subdir) for subdir in dirs)
+                level = next_level
+        gone = [(path,) for path in known if path not in seen]
+        self.db.executemany("DELETE FROM files WHERE dir=?", gone)
+        self.db.executemany("DELETE FROM dirs WHERE path=?", gone)
+        self.db.commit()
+        return len(seen), listed
+
+    def record(self, path):
+        """Add a file that was just moved into the tree, its directory is listed again by settle()."""
+        path = os.path.abspath(path)
+        if not path.startswith(self.root + os.sep):
+            return
+        try:
+            st = os.stat(path)
+        except OSError:
+            return
+        relative = self._relative(path)
+        directory, name = os.path.split(relative)
+        self.db.execute("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?)",
+                        (relative, directory, os.path.splitext(name)[1], st.st_size, st.st_mtime_ns,
+                         resolve_date(directory, name)))
+        self._touched.add(directory)
+
+    def settle(self):
+        """
+        List the directories record() added files to again (and their parents, which changed when they
+        were created), with the mtime seen before the listing, so files another process added during the
+        run are cataloged as well. As in refresh(), a directory that changed just now keeps no mtime and
+        is listed again by the next refresh; so is a parent with a subdirectory the catalog does not know.
+        """
+        directories = set()
+        for directory in self._touched:
+            while directory not in directories:
+                directories.add(directory)
+                if not directory:
+                    break
+                directory = os.path.dirname(directory)
+        known = {path for path, in self.db.execute("SELECT path FROM dirs")} | directories
+        racy = time.time_ns() - RACY_SECONDS * 1_000_000_000
+        for directory in sorted(directories):
+            _, mtime, listing = _check(os.path.join(self.root, directory), None)
+            if listing is None:
+                continue        # gone meanwhile, the next refresh drops it
+            files, dirs = listing
+            if mtime >= racy or any(self._relative(subdir) not in known for subdir in dirs):
+                mtime = None
+            self._store_dir(directory, files, mtime)
+        self._touched = set()
+        self.db.commit()
+
+    def extensions(self, date=None, ext=None):
+        """[(extension, files, bytes)] of the files matching a date prefix and/or extension, largest first."""
+        where, params = self._filter(date, ext)
+        return self.db.execute(f"SELECT ext, COUNT(*), SUM(size) FROM files {where} GROUP BY ext "
+                               "ORDER BY SUM(size) DESC", params).fetchall()
+
+    def files(self, date=None, ext=None):
+        """(path, size, date) of the files matching a date prefix and/or extension, by date."""
+        where, params = self._filter(date, ext)
+        for path, size, file_date in self.db.execute(f"SELECT path, size, date FROM files {where} "
+                                                     "ORDER BY date, path", params):
+            yield os.path.join(self.root, path), size, file_date
+
+    def _filter(self, date, ext):
+        conditions = []
+        params = []
+        if date:
+            conditions.append("date >= ? AND date < ?")
+            params.extend(date_range(date))
+        if ext:
+            conditions.append("ext = ? COLLATE NOCASE")
+            params.append(ext if ext.startswith(".") else "." + ext)
+        return ("WHERE " + " AND ".join(conditions)) if conditions else "", params
+
+    def close(self):
+        self.db.commit()
+        self.db.close()
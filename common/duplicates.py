@@ -0,0 +1,192 @@
+"""
+Duplicate detection in stages, every stage only looks at the files the previous one could not tell apart:
+
+    1. size             from the directory walk, no reads
+    2. edge hash        blake2b of the first and last 64 KB, which is the whole file up to 128 KB
+    3. full hash        blake2b of the whole file through mmap, on a process pool
+
+HashIndex keeps the sizes of an archive tree in sqlite and its hashes once they were needed, so new
+files can be checked against the archive without hashing it again. It is refreshed by a stat-only
+walk of the tree: rows of files that are gone or changed (size, mtime) are dropped. A readonly index
+works on a copy of the file in memory, so a dry run refreshes and hashes as usual but writes nothing.
+The hashes find_duplicate_groups() stores are committed by the caller, with close().
+"""
+
+import os
+import mmap
+import sqlite3
+import hashlib
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+import treewalker
+
+EDGE_SIZE = 64 * 1024
+
+
+def edge_hash(path):
+    """Hash of the first and last EDGE_SIZE bytes, None if the file can't be read."""
+    h = hashlib.blake2b(digest_size=16)
+    try:
+        with open(path, "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            h.update(f.read(EDGE_SIZE))
+            if size > EDGE_SIZE:
+                f.seek(max(EDGE_SIZE, size - EDGE_SIZE))
+                h.update(f.read(EDGE_SIZE))
+    except OSError:
+        return None
+    return h.hexdigest()
+
+
+def full_hash(path):
+    """Hash of the whole file, None if the file can't be read."""
+    h = hashlib.blake2b(digest_size=32)
+    try:
+        with open(path, "rb") as f:
+            if os.fstat(f.fileno()).st_size:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+                    if hasattr(m, "madvise"):
+                        m.madvise(mmap.MADV_SEQUENTIAL)
+                    h.update(m)
+    except (OSError, ValueError):
+        return None
+    return h.hexdigest()
+
+
+class HashIndex:
+
+    def __init__(self, path, root, readonly=False):
+        self.path = path
+        self.root = os.path.abspath(root)
+        if readonly:
+            self.db = sqlite3.connect(":memory:")
+            if os.path.isfile(path):
+                uri = "file:" + urllib.request.pathname2url(os.path.abspath(path)) + "?mode=ro"
+                source = sqlite3.connect(uri, uri=True)
+                source.backup(self.db)
+                source.close()
+        else:
+            self.db = sqlite3.connect(path)
+        self.db.execute("CREATE TABLE IF NOT EXISTS files ("
+                        "path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, edge TEXT, full TEXT)")
+        self.db.execute("CREATE INDEX IF NOT EXISTS files_size ON files (size)")
+        self.db.commit()
+
+    def refresh(self, walk_options={}):
+        """Bring the index in line with the tree, returns the number of files in it."""
+        self.db.execute("CREATE TEMP TABLE walked (path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER)")
+        rows = []
+        for entry in treewalker.walk_files(self.root, stat=True, **walk_options):
+            st = entry.stat()
+            rows.append((entry.path, st.st_size, st.st_mtime_ns))
+            if len(rows) >= 10000:
+                self.db.executemany("INSERT INTO walked VALUES (?, ?, ?)", rows)
+                rows = []
+        self.db.executemany("INSERT INTO walked VALUES (?, ?, ?)", rows)
+        # the merge happens in sqlite, so memory does not grow with the size of the archive
+        self.db.execute("DELETE FROM files WHERE path NOT IN (SELECT path FROM walked)")
+        self.db.execute("DELETE FROM files WHERE path IN (SELECT f.path FROM files f JOIN walked w ON f.path = w.path "
+                        "WHERE f.size != w.size OR f.mtime_ns != w.mtime_ns)")
+        self.db.execute("INSERT OR IGNORE INTO files (path, size, mtime_ns) SELECT path, size, mtime_ns FROM walked")
+        count = self.db.execute("SELECT COUNT(*) FROM walked").fetchone()[0]
+        self.db.execute("DROP TABLE walked")
+        self.db.commit()
+        return count
+
+    def sizes(self, sizes):
+        """The subset of sizes that files in the index have."""
+        sizes = list(sizes)
+        found = set()
+        for i in range(0, len(sizes), 500):
+            part = sizes[i:i + 500]
+            found.update(row[0] for row in self.db.execute(
+                f"SELECT DISTINCT size FROM files WHERE size IN ({','.join('?' * len(part))})", part))
+        return found
+
+    def lookup(self, size):
+        """[path, edge hash, full hash] of the archive files of a size, hashes are None until stored."""
+        return [list(row) for row in self.db.execute("SELECT path, edge, full FROM files WHERE size=?", (size,))]
+
+    def store(self, path, column, digest):
+        self.db.execute(f"UPDATE files SET {column}=? WHERE path=?", (digest, path))
+
+    def close(self):
+        self.db.commit()
+        self.db.close()
+
+
+def find_duplicate_groups(files, workers=4, index=None):
+    """
+    Group files by content. files is a list of (path, size). Returns a list of (archive paths, paths) of
+    every set of identical files that has more than one member, archive paths are the matching files
+    in the index (when given), paths the matching files of the list, in list order.
+    """
+    by_size = {}
+    for path, size in files:
+        by_size.setdefault(size, []).append(path)
+    archive_sizes = index.sizes(by_size) if index is not None else set()
+    by_size = {size: paths for size, paths in by_size.items() if len(paths) > 1 or size in archive_sizes}
+    own = {os.path.abspath(path) for paths in by_size.values() for path in paths}     # listed files inside the archive
+    archive = {size: [row for row in index.lookup(size) if row[0] not in own]
+               for size in by_size if size in archive_sizes}
+
+    # stage 2, small reads on threads
+    todo = [path for paths in by_size.values() for path in paths]
+    todo += [row[0] for rows in archive.values() for row in rows if row[1] is None]
+    with ThreadPoolExecutor(max_workers=workers * 2) as executor:
+        edges = dict(zip(todo, executor.map(edge_hash, todo)))
+    groups = {}     # (size, edge) -> ([archive paths], [paths])
+    for size, paths in by_size.items():
+        for row in archive.get(size, ()):
+            if row[1] is None:
+                row[1] = edges.get(row[0])
+                if row[1] is not None:
+                    index.store(row[0], "edge", row[1])
+            if row[1] is not None:
+                groups.setdefault((size, row[1]), ([], []))[0].append(row)
+        for path in paths:
+            if edges[path] is not None:
+                groups.setdefault((size, edges[path]), ([], []))[1].append(path)
+    groups = {key: group for key, group in groups.items() if len(group[0]) + len(group[1]) > 1 and group[1]}
+
+    # stage 3, the edge hash already covers files up to 2 * EDGE_SIZE
+    todo = []
+    for (size, _), (rows, paths) in groups.items():
+        if size > 2 * EDGE_SIZE:
+            todo += paths + [row[0] for row in rows if row[2] is None]
+    fulls = {}
+    if todo:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            fulls = dict(zip(todo, executor.map(full_hash, todo, chunksize=16)))
+
+    result = []
+    for (size, edge), (rows, paths) in groups.items():
+        if size <= 2 * EDGE_SIZE:
+            result.append(([row[0] for row in rows], paths))
+            continue
+        split = {}
+        for row in rows:
+            if row[2] is None:
+                row[2] = fulls.get(row[0])
+                if row[2] is not None:
+                    index.store(row[0], "full", row[2])
+            if row[2] is not None:
+                split.setdefault(row[2], ([], []))[0].append(row[0])
+        for path in paths:
+            if fulls.get(path) is not None:
+                split.setdefault(fulls[path], ([], []))[1].append(path)
+        result += [group for group in split.values() if len(group[0]) + len(group[1]) > 1 and group[1]]
+    return result
+
+
+def originals(groups):
+    """{duplicate path: path of the file it duplicates}, the first archive file or else the first listed file."""
+    duplicates = {}
+    for archive_paths, paths in groups:
+        if archive_paths:
+            original = sorted(archive_paths)[0]
+            duplicates.update((path, original) for path in paths)
+        else:
+            duplicates.update((path, paths[0]) for path in paths[1:])
+    return duplicates
@@ -0,0 +1,149 @@
+"""
+Minimal in-process EXIF date reader for JPEG and TIFF(-based) files.
+Only the IFD0 and ExifIFD directories are visited, so just the first few KB of a file are read.
+Tags are returned under the names exiftool uses for them:
+
+    ModifyDate          IFD0 0x0132 DateTime
+    DateTimeOriginal    ExifIFD 0x9003
+    CreateDate          ExifIFD 0x9004 DateTimeDigitized
+"""
+
+import os
+import struct
+
+DATE_TAGS = {0x0132: "ModifyDate", 0x9003: "DateTimeOriginal", 0x9004: "CreateDate"}
+DATE_LENGTH = 20            # "YYYY:MM:DD HH:MM:SS" plus the terminating NUL
+EXIF_IFD_POINTER = 0x8769
+ASCII = 2
+MAX_ENTRIES = 1000          # sanity limit, a corrupt count should not make us read megabytes
+MAX_JPEG_SCAN = 256 * 1024  # stop looking for the APP1 segment after this many bytes
+
+
+def is_exif_container(head):
+    """True if the first bytes of a file look like JPEG or TIFF."""
+    return head[:3] == b"\xff\xd8\xff" or head[:4] in (b"II*\x00", b"MM\x00*")
+
+
+def _jpeg_tiff_offset(f):
+    """Walk the JPEG markers up to the Exif APP1 segment, returns the file offset of its TIFF header."""
+    f.seek(2)
+    while f.tell() < MAX_JPEG_SCAN:
+        marker = f.read(2)
+        while marker[:1] == b"\xff" and marker[1:] == b"\xff":     # fill bytes
+            marker = b"\xff" + f.read(1)
+        if len(marker) < 2 or marker[0] != 0xFF or marker[1] in (0xD9, 0xDA):   # EOI or start of scan
+            return None
+        length = f.read(2)
+        if len(length) < 2:
+            return None
+        length = struct.unpack(">H", length)[0]
+        if marker[1] == 0xE1 and length >= 8:
+            if f.read(6) == b"Exif\x00\x00":
+                return f.tell()
+            length -= 6
+        f.seek(length - 2, 1)
+    raise ValueError("no Exif segment within the scan limit")
+
+
+def _read_ifd(f, base, offset, endian):
+    """Returns {tag: (type, count, value bytes, offset of the value field)} of one IFD."""
+    f.seek(base + offset)
+    data = f.read(2)
+    if len(data) < 2:
+        return {}
+    count = struct.unpack(endian + "H", data)[0]
+    if count > MAX_ENTRIES:
+        return {}
+    data = f.read(12 * count)
+    entries = {}
+    for i in range(len(data) // 12):
+        tag, typ, n, value = struct.unpack_from(endian + "HHI4s", data, i * 12)
+        entries[tag] = (typ, n, value, base + offset + 2 + i * 12 + 8)
+    return entries
+
+
+def find_date_entries(f):
+    """
+    Returns {name: (value, file offset of the value, count)} for the date tags found,
+    or None if the file is not a JPEG/TIFF this reader understands.
+    """
+    f.seek(0)
+    head = f.read(4)
+    if head[:3] == b"\xff\xd8\xff":
+        base = _jpeg_tiff_offset(f)
+        if base is None:
+            return {}       # a valid JPEG without EXIF
+        f.seek(base)
+        head = f.read(4)
+    elif head in (b"II*\x00", b"MM\x00*"):
+        base = 0
+    else:
+        return None
+    if head == b"II*\x00":
+        endian = "<"
+    elif head == b"MM\x00*":
+        endian = ">"
+    else:
+        return None
+    ifd0 = struct.unpack(endian + "I", f.read(4))[0]
+
+    found = {}
+    entries = _read_ifd(f, base, ifd0, endian)
+    directories = [entries]
+    if EXIF_IFD_POINTER in entries:
+        _, _, value, _ = entries[EXIF_IFD_POINTER]
+        directories.append(_read_ifd(f, base, struct.unpack(endian + "I", value)[0], endian))
+    for entries in directories:
+        for tag, name in DATE_TAGS.items():
+            if tag not in entries:
+                continue
+            typ, count, value, value_offset = entries[tag]
+            if typ != ASCII or count == 0:
+                continue
+            if count > 4:
+                value_offset = base + struct.unpack(endian + "I", value)[0]
+                f.seek(value_offset)
+                value = f.read(count)
+            text = value[:count].split(b"\x00", 1)[0].decode("ascii", "replace").strip()
+            if text:
+                found[name] = (text, value_offset, count)
+    return found
+
+
+def read_exif_dates(f):
+    """
+    Returns {name: date string} like exiftool would report them, an empty dict for a JPEG/TIFF
+    without date tags, or None if the format is not supported (so exiftool should be asked).
+    """
+    try:
+        entries = find_date_entries(f)
+    except (struct.error, OSError, ValueError):
+        return None
+    if entries is None:
+        return None
+    return {name: value for name, (value, _, _) in entries.items()}
+
+
+def patch_exif_dates(filepath, date_string):
+    """
+    Overwrite the ModifyDate, DateTimeOriginal and CreateDate values in place, returns False
+    (without touching the file) when one of them is missing or not a 20-byte ASCII entry,
+    then exiftool has to rewrite the file instead.
+    """
+    value = date_string.encode("ascii") + b"\x00"
+    if len(value) != DATE_LENGTH:
+        return False
+    with open(filepath, "r+b") as f:
+        try:
+            entries = find_date_entries(f)
+        except (struct.error, ValueError):
+            return False
+        if not entries or any(name not in entries or entries[name][2] != DATE_LENGTH
+                              for name in DATE_TAGS.values()):
+            return False
+        for _, offset, _ in entries.values():
+            f.seek(offset)
+            f.write(value)
+        f.flush()
+        os.fsync(f.fileno())
+    return True
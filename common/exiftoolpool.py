@@ -0,0 +1,229 @@
+"""
+Keeps a small pool of exiftool processes alive in "-stay_open True -@ -" mode, so that
+the Perl interpreter only starts once per session instead of twice per file.
+Reads and writes are batched: one "-json" command covers many files, and many write
+commands are sent in one go before the "{readyNNN}" sentinels are collected.
+"""
+
+import os
+import sys
+import json
+import queue
+import threading
+import subprocess
+import platform
+from concurrent.futures import ThreadPoolExecutor
+
+import instrument
+
+
+def default_exiftool_path():
+    if platform.system() == "Windows":
+        return "exiftool.exe"
+    return "exiftool"
+
+
+def _command_line(exiftool_path):
+    # allow a python stand-in (eg. common/fakeexiftool.py) to be used as exiftool
+    if exiftool_path.endswith(".py"):
+        return [sys.executable, exiftool_path]
+    return [exiftool_path]
+
+
+class ExifToolError(Exception):
+    pass
+
+
+class ExifToolSession:
+    """One long-running exiftool process, commands are sent as argument lines on stdin."""
+
+    def __init__(self, exiftool_path=None):
+        self.exiftool_path = exiftool_path or default_exiftool_path()
+        self.process = subprocess.Popen(_command_line(self.exiftool_path)
+                                        + ["-stay_open", "True", "-@", "-"],
+                                        stdin=subprocess.PIPE,
+                                        stdout=subprocess.PIPE,
+                                        stderr=subprocess.PIPE)
+        self._counter = 0
+        self._stderr_lines = queue.Queue()
+        self._stderr_thread = threading.Thread(target=self._drain_stderr, daemon=True)
+        self._stderr_thread.start()
+
+    def _drain_stderr(self):
+        # stderr is read on its own thread so a chatty file can never fill the pipe and block us
+        for line in self.process.stderr:
+            self._stderr_lines.put(line.decode("utf-8", "replace").rstrip("\r\n"))
+        self._stderr_lines.put(None)
+
+    def _send(self, commands):
+        """Send a list of argument lists in one write, returns the sequence numbers used."""
+        numbers = []
+        lines = []
+        for args in commands:
+            self._counter += 1
+            numbers.append(self._counter)
+            lines.extend(args)
+            lines.append("-echo4")
+            lines.append(f"{{ready{self._counter}}}")
+            lines.append(f"-execute{self._counter}")
+        data = ("\n".join(lines) + "\n").encode("utf-8")
+        try:
+            self.process.stdin.write(data)
+            self.process.stdin.flush()
+        except (BrokenPipeError, OSError) as e:
+            raise ExifToolError(f"exiftool session died: {e}")
+        return numbers
+
+    def _collect(self, number):
+        """Read stdout and stderr up to the {readyNNN} sentinel of one command."""
+        sentinel = f"{{ready{number}}}".encode("ascii")
+        out = []
+        while True:
+            line = self.process.stdout.readline()
+            if not line:
+                raise ExifToolError("exiftool session closed its output unexpectedly")
+            if line.rstrip(b"\r\n") == sentinel:
+                break
+            out.append(line)
+        err = []
+        sentinel = sentinel.decode("ascii")
+        while True:
+            line = self._stderr_lines.get()
+            if line is None or line == sentinel:
+                break
+            err.append(line)
+        return b"".join(out).decode("utf-8", "replace"), "\n".join(err)
+
+    def execute_many(self, commands):
+        """Run several commands back to back, returns a list of (stdout, stderr) tuples."""
+        numbers = self._send(commands)
+        return [self._collect(n) for n in numbers]
+
+    def execute(self, *args):
+        return self.execute_many([list(args)])[0]
+
+    def read_metadata(self, paths):
+        """Returns a dict {path: metadata dict} for all files exiftool could read."""
+        t = instrument.start()
+        stdout, stderr = self.execute("-json", *paths)
+        instrument.stop("exiftool.read", t, histogram=True)
+        instrument.count("exiftool.read.files", len(paths))
+        result = {}
+        if stdout.strip():
+            by_name = {os.path.normcase(os.path.abspath(p)): p for p in paths}
+            for metadata in json.loads(stdout):
+                source = metadata.get("SourceFile", "")
+                key = os.path.normcase(os.path.abspath(source))
+                result[by_name.get(key, source)] = metadata
+        return result, stderr
+
+    def write_dates(self, jobs):
+        """jobs is a list of (path, exif date string), returns a list of (path, ok, message)."""
+        commands = []
+        for path, date_string in jobs:
+            commands.append([f"-ModifyDate={date_string}",
+                             f"-DateTimeOriginal={date_string}",
+                             f"-DateTimeDigitized={date_string}",
+                             "-overwrite_original",
+                             path])
+        results = []
+        t = instrument.start()
+        outputs = self.execute_many(commands)
+        instrument.stop("exiftool.write", t, histogram=True)
+        instrument.count("exiftool.write.files", len(jobs))
+        for (path, _), (stdout, stderr) in zip(jobs, outputs):
+            ok = "1 image files updated" in stdout
+            results.append((path, ok, (stderr or stdout).strip()))
+        return results
+
+    def close(self):
+        if self.process.poll() is None:
+            try:
+                self.process.stdin.write(b"-stay_open\nFalse\n")
+                self.process.stdin.flush()
+                self.process.stdin.close()
+                self.process.wait(timeout=10)
+            except (OSError, subprocess.TimeoutExpired):
+                self.process.kill()
+        self._stderr_thread.join(timeout=1)
+        self.process.stdout.close()
+
+
+class ExifToolPool:
+    """
+    Up to a fixed number of ExifToolSession's, batches are spread over the sessions by a thread pool.
+    Use as a context manager so the sessions are always shut down.
+    """
+
+    def __init__(self, exiftool_path=None, sessions=2, batch_size=100):
+        self.exiftool_path = exiftool_path or default_exiftool_path()
+        self.batch_size = batch_size
+        self._sessions = []
+        self._idle = queue.Queue()
+        for _ in range(sessions):
+            self._idle.put(None)    # sessions are only started once they are needed
+        self._executor = ThreadPoolExecutor(max_workers=sessions)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _batches(self, items):
+        for i in range(0, len(items), self.batch_size):
+            yield items[i:i + self.batch_size]
+
+    def _with_session(self, method, batch, retry=True):
+        session = self._idle.get()
+        if session is None:
+            try:
+                session = ExifToolSession(self.exiftool_path)
+            except OSError as e:
+                self._idle.put(None)
+                raise ExifToolError(f"could not start exiftool: {e}")
+            self._sessions.append(session)
+        try:
+            result = getattr(session, method)(batch)
+        except ExifToolError:
+            # the process died (crashed, killed): drop it, a fresh one is started in its place and the
+            # batch is tried once more (reading and writing the same dates again is harmless)
+            self._sessions.remove(session)
+            session.close()
+            self._idle.put(None)
+            if retry:
+                return self._with_session(method, batch, retry=False)
+            raise
+        except BaseException:
+            self._idle.put(session)
+            raise
+        self._idle.put(session)
+        return result
+
+    def read_metadata(self, paths):
+        """Returns ({path: metadata}, [stderr messages]) for a list of paths."""
+        metadata = {}
+        errors = []
+        futures = [self._executor.submit(self._with_session, "read_metadata", batch)
+                   for batch in self._batches(list(paths))]
+        for future in futures:
+            result, stderr = future.result()
+            metadata.update(result)
+            if stderr:
+                errors.append(stderr)
+        return metadata, errors
+
+    def write_dates(self, jobs):
+        """jobs is a list of (path, exif date string), returns a list of (path, ok, message)."""
+        results = []
+        # write batches are kept small enough that the per file output never fills the stdout pipe
+        futures = [self._executor.submit(self._with_session, "write_dates", batch)
+                   for batch in self._batches(list(jobs))]
+        for future in futures:
+            results.extend(future.result())
+        return results
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+        for session in self._sessions:
+            session.close()
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+Stand-in for exiftool, so the exiftool driver and the scripts using it can be exercised
+without the real binary. It understands the small subset of exiftool that these scripts use:
+
+    fakeexiftool.py -json FILE...
+    fakeexiftool.py -ModifyDate=... -DateTimeOriginal=... -DateTimeDigitized=... -overwrite_original FILE
+    fakeexiftool.py -stay_open True -@ -      (commands on stdin, ended by -executeNNN)
+
+Written tags are kept in a directory of json files (FAKE_EXIFTOOL_DB, default a temp dir),
+one per source file, so separate sessions see each others writes.
+FAKE_EXIFTOOL_STARTUP adds a startup delay in seconds to mimic the Perl interpreter start,
+FAKE_EXIFTOOL_LATENCY a delay per command and FAKE_EXIFTOOL_FILE_LATENCY a delay per file of a
+command, to mimic exiftool parsing (and rewriting) files, for benchmarks.
+"""
+
+import os
+import sys
+import time
+import json
+import hashlib
+import tempfile
+import datetime
+
+DB_DIR = os.environ.get("FAKE_EXIFTOOL_DB", os.path.join(tempfile.gettempdir(), "fakeexiftool-db"))
+WRITABLE_TAGS = {"ModifyDate", "DateTimeOriginal", "DateTimeDigitized"}
+LATENCY = float(os.environ.get("FAKE_EXIFTOOL_LATENCY", "0"))
+FILE_LATENCY = float(os.environ.get("FAKE_EXIFTOOL_FILE_LATENCY", "0"))
+
+
+def _db_path(filepath):
+    key = hashlib.sha1(os.path.abspath(filepath).encode("utf-8", "surrogateescape")).hexdigest()
+    return os.path.join(DB_DIR, key + ".json")
+
+
+def _load_tags(filepath):
+    try:
+        with open(_db_path(filepath)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _read(filepath):
+    st = os.stat(filepath)
+    modify = datetime.datetime.fromtimestamp(st.st_mtime).astimezone()
+    metadata = {"SourceFile": filepath,
+                "FileName": os.path.basename(filepath),
+                "FileSize": st.st_size,
+                "FileModifyDate": modify.strftime("%Y:%m:%d %H:%M:%S%z")}
+    tags = _load_tags(filepath)
+    if "DateTimeDigitized" in tags:
+        # exiftool reports the EXIF DateTimeDigitized tag as CreateDate
+        metadata["CreateDate"] = tags.pop("DateTimeDigitized")
+    metadata.update(tags)
+    return metadata
+
+
+def _run(args, out, err):
+    """Run one exiftool command, returns the exit status like exiftool would."""
+    files = [a for a in args if not a.startswith("-")]
+    options = [a for a in args if a.startswith("-")]
+    if LATENCY or FILE_LATENCY:
+        time.sleep(LATENCY + FILE_LATENCY * len(files))
+    if "-json" in options:
+        found = []
+        for filepath in files:
+            if os.path.isfile(filepath):
+                found.append(_read(filepath))
+            else:
+                err.write(f"Error: File not found - {filepath}\n")
+        if found:
+            out.write(json.dumps(found, indent=1) + "\n")
+        return 0 if len(found) == len(files) else 1
+
+    tags = {}
+    for option in options:
+        if "=" in option:
+            name, value = option[1:].split("=", 1)
+            if name in WRITABLE_TAGS:
+                tags[name] = value
+    updated = 0
+    for filepath in files:
+        if not os.path.isfile(filepath):
+            err.write(f"Error: File not found - {filepath}\n")
+            continue
+        stored = _load_tags(filepath)
+        stored.update(tags)
+        os.makedirs(DB_DIR, exist_ok=True)
+        tmp = _db_path(filepath) + f".{os.getpid()}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(stored, f)
+        os.replace(tmp, _db_path(filepath))
+        os.utime(filepath)      # like exiftool, writing touches the file
+        updated += 1
+    if updated:
+        out.write(f"    {updated} image files updated\n")
+    if updated < len(files):
+        out.write(f"    {len(files) - updated} files weren't updated due to errors\n")
+    return 0 if updated == len(files) else 1
+
+
+def _stay_open(stdin, out, err):
+    args = []
+    echo = []
+    for line in stdin:
+        line = line.rstrip("\r\n")
+        if line.startswith("-execute"):
+            _run(args, out, err)
+            number = line[len("-execute"):]
+            for stream, text in echo:
+                (out if stream == "3" else err).write(text + "\n")
+            err.flush()
+            out.write(f"{{ready{number}}}\n")
+            out.flush()
+            args = []
+            echo = []
+        elif line == "-stay_open":
+            args.append(line)
+        elif args and args[-1] == "-stay_open":
+            args.pop()
+            if line.lower() == "false":
+                return
+        elif args and args[-1] in ("-echo3", "-echo4"):
+            echo.append((args.pop()[-1], line))
+        else:
+            args.append(line)
+
+
+def main(argv):
+    time.sleep(float(os.environ.get("FAKE_EXIFTOOL_STARTUP", "0")))
+    if argv[:2] == ["-stay_open", "True"] and argv[2:4] == ["-@", "-"]:
+        _stay_open(sys.stdin, sys.stdout, sys.stderr)
+        return 0
+    return _run(argv, sys.stdout, sys.stderr)
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
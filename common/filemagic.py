@@ -0,0 +1,134 @@
+"""
+File type detection from the first bytes of a file (magic numbers), for the file types a photo and
+video archive is made of. Only HEAD_SIZE bytes are read per file.
+
+TIFF based raw formats (NEF, DNG, ARW, PEF...) carry their maker in IFD0, beyond the head, so they
+are reported as "TIFF/raw"; CR2, ORF, RW2 and RAF have a signature of their own.
+"""
+
+import os
+
+HEAD_SIZE = 64
+
+# the extensions that are not a mismatch for a detected type
+EXTENSIONS = {
+    "JPEG": {".jpg", ".jpeg", ".jpe", ".jfif", ".thm"},
+    "PNG": {".png"},
+    "GIF": {".gif"},
+    "BMP": {".bmp"},
+    "WEBP": {".webp"},
+    "HEIC/HEIF": {".heic", ".heif", ".hif"},
+    "AVIF": {".avif"},
+    "MP4": {".mp4", ".m4v", ".mp4v", ".lrv"},
+    "MOV": {".mov", ".qt"},
+    "3GP": {".3gp", ".3g2"},
+    "M4A": {".m4a", ".m4b"},
+    "CR2": {".cr2"},
+    "CR3": {".cr3"},
+    "ORF": {".orf"},
+    "RW2": {".rw2"},
+    "RAF": {".raf"},
+    "TIFF/raw": {".tif", ".tiff", ".nef", ".nrw", ".dng", ".arw", ".srf", ".sr2", ".pef", ".srw", ".3fr",
+                 ".erf", ".kdc", ".mef", ".mos", ".iiq", ".rwl"},
+    "PSD": {".psd", ".psb"},
+    "AVI": {".avi"},
+    "WAV": {".wav"},
+    "MKV/WEBM": {".mkv", ".webm", ".mka"},
+    "MPEG-PS": {".mpg", ".mpeg", ".vob", ".mod", ".tod"},
+    "MP3": {".mp3"},
+    "PDF": {".pdf"},
+    "ZIP": {".zip", ".docx", ".xlsx", ".pptx", ".odt", ".ods", ".jar", ".apk", ".epub", ".kmz"},
+}
+
+_SIGNATURES = (         # (offset, bytes, type), checked in order
+    (0, b"\xff\xd8\xff", "JPEG"),
+    (0, b"\x89PNG\r\n\x1a\n", "PNG"),
+    (0, b"GIF87a", "GIF"),
+    (0, b"GIF89a", "GIF"),
+    (0, b"IIRO", "ORF"),
+    (0, b"IIRS", "ORF"),
+    (0, b"IIU\x00", "RW2"),
+    (0, b"FUJIFILMCCD-RAW", "RAF"),
+    (0, b"8BPS", "PSD"),
+    (0, b"\x1a\x45\xdf\xa3", "MKV/WEBM"),
+    (0, b"\x00\x00\x01\xba", "MPEG-PS"),
+    (0, b"ID3", "MP3"),
+    (0, b"%PDF", "PDF"),
+    (0, b"PK\x03\x04", "ZIP"),
+)
+_RIFF_TYPES = {b"WEBP": "WEBP", b"AVI ": "AVI", b"WAVE": "WAV"}
+_HEIF_BRANDS = {b"heic", b"heix", b"hevc", b"hevx", b"heim", b"heis", b"hevm", b"hevs", b"mif1", b"msf1"}
+_QUICKTIME_TYPES = {b"moov", b"mdat", b"wide", b"free", b"skip", b"pnot"}
+# sizes of the DIB headers (BITMAPCOREHEADER, OS/2 v2 short, BITMAPINFOHEADER, V2, V3, OS/2 v2, V4, V5)
+_DIB_HEADER_SIZES = {12, 16, 40, 52, 56, 64, 108, 124}
+
+
+def _ftyp_type(head):
+    """Type of an ISO-BMFF file from the major and compatible brands in its ftyp box."""
+    size = int.from_bytes(head[:4], "big")
+    major = head[8:12]
+    brands = {major} | {head[i:i + 4] for i in range(16, min(size, len(head)) - 3, 4)}
+    if major == b"crx ":
+        return "CR3"
+    if major == b"qt  ":
+        return "MOV"
+    if b"avif" in brands or b"avis" in brands:
+        return "AVIF"
+    if brands & _HEIF_BRANDS:
+        return "HEIC/HEIF"
+    if major.startswith(b"3g"):
+        return "3GP"
+    if major in (b"M4A ", b"M4B "):
+        return "M4A"
+    return "MP4"
+
+
+def _is_bmp(head):
+    """
+    "BM" alone is two letters any text file can start with: the DIB header that follows the 14 byte
+    BITMAPFILEHEADER must have a known size, and the pixel data must start after it.
+    """
+    if len(head) < 18 or head[:2] != b"BM":
+        return False
+    dib_size = int.from_bytes(head[14:18], "little")
+    pixel_offset = int.from_bytes(head[10:14], "little")
+    return dib_size in _DIB_HEADER_SIZES and pixel_offset >= 14 + dib_size
+
+
+def sniff(head):
+    """The type of a file from its first bytes, None when it is not recognised."""
+    if head[4:8] == b"ftyp":
+        return _ftyp_type(head)
+    if head[4:8] in _QUICKTIME_TYPES:      # old QuickTime files start without ftyp
+        return "MOV"
+    if head[:4] in (b"II*\x00", b"MM\x00*"):
+        return "CR2" if head[8:10] == b"CR" else "TIFF/raw"
+    if head[:4] == b"RIFF":
+        return _RIFF_TYPES.get(head[8:12])
+    for offset, signature, name in _SIGNATURES:
+        if head.startswith(signature, offset):
+            return name
+    if _is_bmp(head):
+        return "BMP"
+    if head[:2] in (b"\xff\xfb", b"\xff\xf3", b"\xff\xf2"):    # MPEG audio frame sync without ID3 tag
+        return "MP3"
+    return None
+
+
+def is_mismatch(ext, filetype):
+    """True if a file of the detected type has an extension that does not belong to it."""
+    return filetype is not None and ext.lower() not in EXTENSIONS[filetype]
+
+
+def read_head(path, size=HEAD_SIZE):
+    """Returns (first bytes, file size) with one open, read and fstat, or (None, error) on failure."""
+    try:
+        fd = os.open(path, os.O_RDONLY | getattr(os, "O_BINARY", 0))
+    except OSError as e:
+        return None, e
+    try:
+        return os.read(fd, size), os.fstat(fd).st_size
+    except OSError as e:
+        return None, e
+    finally:
+        os.close(fd)
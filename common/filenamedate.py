@@ -0,0 +1,133 @@
+"""
+Shared parser for dates at the start of filenames (yyyy mm dd hh mm ss, with or without separators),
+used by changemodificationdate and namebasedexif. The two scripts always read names slightly
+differently, both readings are kept as explicit profiles:
+
+    SEPARATORS  "-", "_" and "." are removed, the rest is sliced by position, so a field holding
+                letters keeps its default; years before 1970 are clamped to 1970
+                (changemodificationdate, whose dates end up as epoch timestamps)
+    DIGITS      every non-digit is removed first; no lower bound on the year (namebasedexif)
+
+A field is only read when a character follows it in the SEPARATORS profile,
+or when it is complete in the DIGITS profile (so "20230101.jpg" gives a day, "20230101" in the
+SEPARATORS profile does not), a year after the current year means no date at all, and a month,
+day, hour, minute or second out of range keeps its default (1, 1, 0, 0, 0).
+
+Neither script profile has a lower bound on the year (min_year); only the profile the catalog
+defines for itself uses it, so counters like 0001.jpg are no dates there.
+
+parse_batch() parses a list of names into an array of epoch timestamps, nan where there is no date.
+"""
+
+import re
+import math
+import time
+import array
+import datetime
+import functools
+
+
+class Profile:
+    def __init__(self, name, normalize, follow, clamp_year, min_year=None):
+        self.name = name
+        self.normalize = normalize
+        # one pattern slices all six fields: a field is captured when it is two digits, skipped
+        # (keeping its default) when it holds anything else, each followed by the required trailer
+        trailer = "(?=.)" if follow else ""
+        self.fields = re.compile(r"(\d{4})" + trailer + (r"(?:(?:(\d\d)|..)" + trailer + ")?") * 5, re.DOTALL)
+        self.clamp_year = clamp_year
+        self.min_year = min_year        # an earlier year means no date at all (the catalog's profile only)
+
+
+_non_digits = re.compile(r"\D")
+SEPARATORS = Profile("separators", lambda name: name.replace("-", "").replace("_", "").replace(".", ""),
+                     follow=True, clamp_year=1970)
+DIGITS = Profile("digits", lambda name: _non_digits.sub("", name), follow=False, clamp_year=None)
+
+_year_cache = [0.0, 0]
+
+
+def current_year():
+    """datetime.date.today().year, refreshed at most once a minute instead of per file."""
+    now = time.time()
+    if now >= _year_cache[0]:
+        _year_cache[0] = now + 60
+        _year_cache[1] = datetime.date.today().year
+    return _year_cache[1]
+
+
+def normalize(filename, profile=SEPARATORS):
+    """The characters of a filename the profile slices the date fields from."""
+    return profile.normalize(filename)
+
+
+def parse_name(filename, profile=SEPARATORS, max_year=None):
+    """Returns (year, month, day, hour, minute, second) from a filename, or None without a valid year."""
+    match = profile.fields.match(profile.normalize(filename))
+    if match is None:
+        return None
+    year, month, day, hour, minute, second = match.groups()
+    year = int(year)
+    if profile.clamp_year is not None and year < profile.clamp_year:
+        year = profile.clamp_year
+    elif year > (max_year or current_year()) or year == 0:
+        return None
+    elif profile.min_year is not None and year < profile.min_year:
+        return None
+    month = int(month) if month else 1
+    if not 1 <= month <= 12:
+        month = 1
+    day = int(day) if day else 1
+    if not 1 <= day <= 31:
+        day = 1
+    hour = int(hour) if hour else 0
+    if hour > 23:
+        hour = 0
+    minute = int(minute) if minute else 0
+    if minute > 59:
+        minute = 0
+    second = int(second) if second else 0
+    if second > 59:
+        second = 0
+    return year, month, day, hour, minute, second
+
+
+@functools.lru_cache(maxsize=65536)
+def _hour_start(year, month, day, hour):
+    """
+    (timestamp of the start of the hour, whether the UTC offset is the same for the whole hour). Most
+    offset changes fall on whole hours, but not all (Australia/Lord_Howe moves by half an hour, old
+    local mean times by odd minutes), so the first and the last second of the hour are compared.
+    """
+    start = time.mktime((year, month, day, hour, 0, 0, 0, 0, -1))
+    end = time.mktime((year, month, day, hour, 59, 59, 0, 0, -1))
+    return start, end - start == 3599
+
+
+def to_timestamp(fields):
+    """Local epoch timestamp of parsed fields, like time.mktime(); ValueError for a day the month doesn't have."""
+    year, month, day, hour, minute, second = fields
+    datetime.date(year, month, day)         # validates the day of the month
+    start, uniform = _hour_start(year, month, day, hour)
+    if uniform:
+        return start + minute * 60 + second
+    # the offset changes within this hour
+    return time.mktime((year, month, day, hour, minute, second, 0, 0, -1))
+
+
+def parse_batch(filenames, profile=SEPARATORS, fields=None):
+    """
+    Returns an array('d') of epoch timestamps for a list of filenames, nan where no valid date is found.
+    When a list is passed as fields, the parsed fields of every name (or None) are appended to it.
+    """
+    max_year = current_year()
+    timestamps = array.array("d")
+    for filename in filenames:
+        parsed = parse_name(filename, profile, max_year)
+        if fields is not None:
+            fields.append(parsed)
+        try:
+            timestamps.append(math.nan if parsed is None else to_timestamp(parsed))
+        except (ValueError, OverflowError):
+            timestamps.append(math.nan)
+    return timestamps
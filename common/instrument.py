@@ -0,0 +1,201 @@
+"""
+Opt-in instrumentation of the hot paths: perf_counter_ns timers and counters per stage, latency
+histograms (p50/p95/p99, and the exact maximum) for the stages that keep samples, a json summary at
+the end of the run and an optional cProfile dump. While disabled, start() returns 0 and stop() returns
+at once, so the instrumented code pays one function call per measured operation.
+
+Worker processes (--workers, see shards.py) measure into their own copy of this module: take() hands
+over what a worker measured with every shard, merge() adds it to the main process. The profile covers
+every thread of the main process (the walker, copy and writer threads too), not the worker processes.
+
+    t = instrument.start()
+    ...
+    instrument.stop("metadata.read", t)
+"""
+
+import sys
+import json
+import atexit
+import time
+import random
+import threading
+
+MAX_SAMPLES = 100_000       # per histogram, beyond that a reservoir sample is kept
+
+_enabled = False
+_lock = threading.Lock()
+_timers = {}        # name -> [count, total ns, max ns]
+_samples = {}       # name -> [latencies in ns], only for the stages with a histogram
+_seen = {}          # name -> number of latencies offered to the sample, it is a reservoir beyond MAX_SAMPLES
+_counters = {}
+_started = 0
+_profiler = None
+_thread_profilers = []      # the profilers of the other threads, before Python 3.12
+
+
+def add_instrument_arguments(parser):
+    parser.add_argument("--instrument", metavar="JSON",
+                        help="time the stages of the run and write a json summary to this file")
+    parser.add_argument("--profile", metavar="FILE",
+                        help="run under cProfile and dump the statistics to this file (all threads of the main "
+                             "process, not the --workers processes)")
+
+
+def start_run(args):
+    """Enable what the command line asked for, the summary and profile are written when the script exits."""
+    global _enabled, _started, _profiler
+    if args.instrument:
+        _enabled = True
+        _started = time.perf_counter_ns()
+    if args.profile:
+        import cProfile
+        _profiler = cProfile.Profile()
+        _profiler.enable()
+        if sys.version_info < (3, 12):
+            # a profiler only sees the thread that enabled it, the threads started from now on get their own;
+            # from 3.12 on cProfile is built on sys.monitoring and sees every thread by itself
+            threading.setprofile(_profile_thread)
+    if args.instrument or args.profile:
+        atexit.register(finish_run, args)
+
+
+def _profile_thread(frame, event, arg):
+    """Profile hook of a new thread: enables a profiler for it, which replaces this hook."""
+    import cProfile
+    profiler = cProfile.Profile()
+    with _lock:
+        _thread_profilers.append(profiler)
+    profiler.enable()
+
+
+def finish_run(args):
+    if _profiler is not None:
+        import pstats
+        threading.setprofile(None)
+        _profiler.disable()
+        stats = pstats.Stats(_profiler)
+        with _lock:
+            for profiler in _thread_profilers:
+                stats.add(profiler)
+        stats.dump_stats(args.profile)
+    if args.instrument:
+        with open(args.instrument, "w") as f:
+            json.dump(summary(), f, indent=1)
+
+
+def enabled():
+    return _enabled
+
+
+def enable():
+    """Start measuring in a worker process of a run that was started with --instrument."""
+    global _enabled
+    _enabled = True
+
+
+def start():
+    return time.perf_counter_ns() if _enabled else 0
+
+
+def stop(name, t, histogram=False):
+    """Add the time since start() to the timer of a stage, with histogram=True also keep it as a sample."""
+    if not t:
+        return
+    elapsed = time.perf_counter_ns() - t
+    with _lock:
+        timer = _timers.get(name)
+        if timer is None:
+            timer = _timers[name] = [0, 0, 0]
+        timer[0] += 1
+        timer[1] += elapsed
+        if elapsed > timer[2]:
+            timer[2] = elapsed
+        if histogram:
+            _sample(name, elapsed)
+
+
+def _sample(name, elapsed):
+    """Keep a latency in the sample of a stage, a uniform reservoir sample once it is full. Holds _lock."""
+    samples = _samples.setdefault(name, [])
+    seen = _seen[name] = _seen.get(name, 0) + 1
+    if len(samples) < MAX_SAMPLES:
+        samples.append(elapsed)
+    else:
+        i = random.randrange(seen)
+        if i < MAX_SAMPLES:
+            samples[i] = elapsed
+
+
+def count(name, n=1):
+    if _enabled:
+        with _lock:
+            _counters[name] = _counters.get(name, 0) + n
+
+
+def timed_iter(name, iterable):
+    """The iterable itself when disabled, else a wrapper timing every wait for the next item."""
+    if not _enabled:
+        return iterable
+    return _timed_iter(name, iterable)
+
+
+def _timed_iter(name, iterable):
+    it = iter(iterable)
+    try:
+        while True:
+            t = start()
+            try:
+                item = next(it)
+            except StopIteration:
+                return
+            stop(name, t)
+            yield item
+    finally:
+        if hasattr(it, "close"):
+            it.close()      # a consumer stopping early also stops the walker threads
+
+
+def take():
+    """The measurements since the last take(), which are cleared; a worker returns them with a shard."""
+    global _timers, _samples, _seen, _counters
+    with _lock:
+        measurements = {"timers": _timers, "samples": _samples, "counters": _counters}
+        _timers, _samples, _seen, _counters = {}, {}, {}, {}
+    return measurements
+
+
+def merge(measurements):
+    """Add the measurements a worker process took() to the ones of this process."""
+    with _lock:
+        for name, (calls, total, longest) in measurements["timers"].items():
+            timer = _timers.setdefault(name, [0, 0, 0])
+            timer[0] += calls
+            timer[1] += total
+            timer[2] = max(timer[2], longest)
+        for name, samples in measurements["samples"].items():
+            for elapsed in samples:
+                _sample(name, elapsed)
+        for name, n in measurements["counters"].items():
+            _counters[name] = _counters.get(name, 0) + n
+
+
+def _percentile(ordered, fraction):
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def summary():
+    """The measurements so far, times in milliseconds."""
+    with _lock:
+        timers = {}
+        for name, (calls, total, longest) in sorted(_timers.items()):
+            timer = {"count": calls, "total_ms": round(total / 1e6, 3), "mean_us": round(total / calls / 1e3, 3)}
+            if name in _samples:
+                ordered = sorted(_samples[name])
+                for label, fraction in (("p50_ms", 0.50), ("p95_ms", 0.95), ("p99_ms", 0.99)):
+                    timer[label] = round(_percentile(ordered, fraction) / 1e6, 3)
+                timer["max_ms"] = round(longest / 1e6, 3)
+            timers[name] = timer
+        return {"command": sys.argv,
+                "wall_ms": round((time.perf_counter_ns() - _started) / 1e6, 3) if _started else None,
+                "timers": timers,
+                "counters": dict(sorted(_counters.items()))}
@@ -0,0 +1,50 @@
+"""
+Append-only journal of file operations, one json object per line, so an interrupted run can be
+resumed and a finished one undone. A line cut short by a crash is ignored when reading.
+"""
+
+import os
+import json
+import threading
+
+
+class Journal:
+
+    def __init__(self, path, append=True, sync_every=1000):
+        self.path = path
+        self.file = open(path, "a" if append else "w", encoding="utf-8")
+        self.sync_every = sync_every
+        self._unsynced = 0
+        self._lock = threading.Lock()      # records may come from worker threads
+
+    def write(self, op, **fields):
+        fields["op"] = op
+        line = json.dumps(fields, ensure_ascii=False) + "\n"
+        with self._lock:
+            self.file.write(line)
+            self._unsynced += 1
+            if self._unsynced >= self.sync_every:
+                self._sync()
+
+    def _sync(self):
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self._unsynced = 0
+
+    def sync(self):
+        with self._lock:
+            self._sync()
+
+    def close(self):
+        self.sync()
+        self.file.close()
+
+
+def read_journal(path):
+    """Yield the records of a journal."""
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                yield json.loads(line)
+            except ValueError:
+                continue        # torn last line of a crashed run
@@ -0,0 +1,116 @@
+"""
+Persistent metadata cache for namebasedexif (stdlib sqlite3).
+
+Rows are keyed by file identity (device, inode, size, mtime_ns) rather than by path, so moved files
+still hit, and any change to a file by another program is a miss. A row holds the date fields that
+were extracted, the date the tool last wrote to the file and the file name: a row is only used for a
+file of the same name, so a reused inode or a renamed file is read again. On Windows the stat results
+of a directory listing have no inode number, file_stat() gets the full stat for those; a file without
+an identity (st_ino 0) is never cached.
+
+Invalidation of our own writes: writing dates changes the file (an in-place patch changes mtime,
+an exiftool rewrite also gives a new inode), so after every write the row of the old identity is
+dropped and a row for the post-write identity is stored, holding the written date.
+A later run then finds the file unchanged and skips it with just the stat from the directory walk.
+"""
+
+import os
+import json
+import sqlite3
+
+# the metadata fields the date resolution looks at, nothing else is stored
+DATE_FIELDS = ("CreateDate", "ModifyDate", "DateTimeOriginal", "QuickTime:CreateDate", "QuickTime:ModifyDate")
+
+
+def identity(st):
+    """The key of a stat result, None when the filesystem gives no inode number."""
+    if not st.st_ino:
+        return None
+    return (st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns)
+
+
+def file_stat(entry):
+    """The stat result of a walked entry with its identity: DirEntry.stat() on Windows leaves st_ino and st_dev 0."""
+    st = entry.stat()
+    if not st.st_ino:
+        st = os.stat(entry.path)
+    return st
+
+
+class MetadataCache:
+
+    def __init__(self, path, rebuild=False, timeout=5.0):
+        self.path = path
+        # worker processes (namebasedexif --workers) share the file, timeout is how long a write waits for the lock
+        self.db = sqlite3.connect(path, timeout=timeout)
+        if rebuild:
+            self.db.execute("DROP TABLE IF EXISTS files")
+            self.db.execute("DROP TABLE IF EXISTS counters")
+        self.db.execute("CREATE TABLE IF NOT EXISTS files ("
+                        "dev INTEGER, ino INTEGER, size INTEGER, mtime_ns INTEGER,"
+                        "name TEXT, metadata TEXT, written TEXT,"
+                        "PRIMARY KEY (dev, ino, size, mtime_ns))")
+        self.db.execute("CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER)")
+        self.db.commit()
+        self.hits = 0
+        self.misses = 0
+
+    def lookup(self, st, name):
+        """Returns (date fields, written date or None) for a stat result and file name, or None on a miss."""
+        key = identity(st)
+        row = None
+        if key is not None:
+            row = self.db.execute("SELECT metadata, written, name FROM files "
+                                  "WHERE dev=? AND ino=? AND size=? AND mtime_ns=?", key).fetchone()
+        if row is None or row[2] != name:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return json.loads(row[0]), row[1]
+
+    def store(self, st, name, metadata, written=None):
+        key = identity(st)
+        if key is None:
+            return
+        fields = {field: metadata[field] for field in DATE_FIELDS if field in metadata}
+        self.db.execute("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?, ?)",
+                        key + (name, json.dumps(fields), written))
+
+    def record_write(self, old_st, new_st, name, written):
+        """The tool wrote dates to a file: replace the row of its old identity by one for the new identity."""
+        key = identity(old_st)
+        if key is not None:
+            self.db.execute("DELETE FROM files WHERE dev=? AND ino=? AND size=? AND mtime_ns=?", key)
+        fields = {"CreateDate": written, "ModifyDate": written, "DateTimeOriginal": written}
+        self.store(new_st, name, fields, written)
+
+    def commit(self):
+        self.db.commit()
+
+    def _counter(self, name):
+        row = self.db.execute("SELECT value FROM counters WHERE name=?", (name,)).fetchone()
+        return row[0] if row else 0
+
+    def summary(self):
+        """Statistics of the cache file over all runs."""
+        entries = self.db.execute("SELECT COUNT(*), COUNT(written) FROM files").fetchone()
+        hits = self._counter("hits")
+        misses = self._counter("misses")
+        rate = 100 * hits / (hits + misses) if hits + misses else 0
+        return f"     cache file: {self.path}" \
+            + f"\n     ...entries: {entries[0]} ({entries[1]} with dates written by this tool)" \
+            + f"\n     ...lookups over all runs: {hits + misses}, hits: {hits}, misses: {misses}, hit rate: {rate:.1f}%"
+
+    def run_summary(self):
+        """Statistics of this run."""
+        lookups = self.hits + self.misses
+        rate = 100 * self.hits / lookups if lookups else 0
+        return f"     cache lookups: {lookups}, hits: {self.hits}, misses: {self.misses}, hit rate: {rate:.1f}%"
+
+    def close(self):
+        for name, value in (("hits", self.hits), ("misses", self.misses)):
+            # added in one statement, other processes may close their cache at the same time
+            if self.db.execute("UPDATE counters SET value = value + ? WHERE name=?", (value, name)).rowcount == 0:
+                self.db.execute("INSERT INTO counters VALUES (?, ?)", (name, value))
+        self.db.commit()
+        self.db.close()
@@ -0,0 +1,286 @@
+"""
+Move engine for orderbydate: files are renamed when source and destination are on the same device,
+otherwise copied in the kernel (copy_file_range, sendfile) on a pool of workers, verified and only then
+deleted: the copy is read back (from the disk, its cached pages are dropped first where the platform
+allows it) and compared byte for byte with the source. The copies in flight are bounded by a byte budget, so a card dump keeps both disks busy
+without queueing gigabytes in memory. Destination directories are created once and remembered.
+An existing destination is never replaced: every way of moving raises FileExistsError instead.
+
+In the staging modes the source stays where it is and the destination becomes a hard link ("link"),
+a symbolic link to the absolute source path ("symlink") or a copy-on-write clone ("reflink", the
+FICLONE ioctl of btrfs and XFS). Where the filesystem cannot clone, a reflink fails, unless a full
+(verified kernel) copy is explicitly allowed.
+"""
+
+import os
+import errno
+import queue
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import fcntl
+except ImportError:     # Windows
+    fcntl = None
+
+import instrument
+
+COPY_CHUNK = 64 * 1024 * 1024
+# errors after which the next copy method is tried
+FALLBACK_ERRNOS = {errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP, errno.EBADF, errno.ENOTSUP}
+FICLONE = 0x40049409
+
+
+class MoveError(Exception):
+    pass
+
+
+def no_clobber_rename(src, dst):
+    """
+    os.rename that never replaces dst (on Linux os.rename silently overwrites it): a hard link that
+    fails when dst exists, then the source name is removed. Where the filesystem has no hard links
+    (FAT, exFAT, some network shares) dst is checked first, then renamed.
+    """
+    if os.name == "nt":
+        os.rename(src, dst)     # refuses an existing dst on Windows
+        return
+    try:
+        os.link(src, dst, follow_symlinks=False)
+    except OSError as e:
+        if e.errno not in (errno.EPERM, errno.EOPNOTSUPP, errno.ENOTSUP, errno.EMLINK, errno.ENOSYS):
+            raise       # FileExistsError, EXDEV...
+        if os.path.lexists(dst):
+            raise FileExistsError(errno.EEXIST, "File exists", dst)
+        os.rename(src, dst)
+        return
+    os.unlink(src)
+
+
+def kernel_copy(src_fd, dst_fd, size):
+    """Copy size bytes between two file descriptors, in the kernel where the platform allows it."""
+    offset = 0
+    if hasattr(os, "copy_file_range"):
+        try:
+            while offset < size:
+                n = os.copy_file_range(src_fd, dst_fd, min(size - offset, COPY_CHUNK), offset, offset)
+                if n == 0:
+                    break
+                offset += n
+        except OSError as e:
+            if e.errno not in FALLBACK_ERRNOS:
+                raise
+    if offset < size and hasattr(os, "sendfile"):
+        try:
+            os.lseek(dst_fd, offset, os.SEEK_SET)
+            while offset < size:
+                n = os.sendfile(dst_fd, src_fd, offset, min(size - offset, COPY_CHUNK))
+                if n == 0:
+                    break
+                offset += n
+        except OSError as e:
+            if e.errno not in FALLBACK_ERRNOS:
+                raise
+    os.lseek(src_fd, offset, os.SEEK_SET)
+    os.lseek(dst_fd, offset, os.SEEK_SET)
+    while offset < size:
+        data = os.read(src_fd, min(size - offset, 1024 * 1024))
+        if not data:
+            break
+        os.write(dst_fd, data)
+        offset += len(data)
+    return offset
+
+
+def same_content(src_fd, dst_fd, size):
+    """True if dst holds the size bytes of src, dst is read back from the device where posix_fadvise allows it."""
+    t = instrument.start()
+    if hasattr(os, "posix_fadvise"):
+        os.posix_fadvise(dst_fd, 0, 0, os.POSIX_FADV_DONTNEED)
+    os.lseek(src_fd, 0, os.SEEK_SET)
+    os.lseek(dst_fd, 0, os.SEEK_SET)
+    offset = 0
+    try:
+        while offset < size:
+            n = min(size - offset, 1024 * 1024)
+            data = os.read(src_fd, n)
+            if not data or os.read(dst_fd, len(data)) != data:
+                return False
+            offset += len(data)
+        return not os.read(dst_fd, 1)
+    finally:
+        instrument.stop("copy.verify", t)
+
+
+def copy_and_delete(src, dst, size):
+    """Copy src to dst with its timestamps, verify the copy and delete src. A partial dst is removed on failure."""
+    if os.path.islink(src):
+        os.symlink(os.readlink(src), dst)       # fails if dst exists
+        os.unlink(src)
+        return
+    with open(src, "rb") as fsrc:
+        # never truncates an existing dst; read and write, the copy is read back before src goes
+        fd = os.open(dst, os.O_RDWR | os.O_CREAT | os.O_EXCL | getattr(os, "O_BINARY", 0), 0o666)
+        try:
+            with open(fd, "wb") as fdst:
+                copied = kernel_copy(fsrc.fileno(), fdst.fileno(), size)
+                os.fsync(fdst.fileno())
+                if copied != size:
+                    raise MoveError(f"copy verification failed, {copied} of {size} bytes written")
+                if not same_content(fsrc.fileno(), fdst.fileno(), size):
+                    raise MoveError("copy verification failed, the copy differs from the source")
+            shutil.copystat(src, dst)
+        except BaseException:
+            try:
+                os.unlink(dst)
+            except OSError:
+                pass
+            raise
+    os.unlink(src)
+
+
+def clone_file(src, dst, size, allow_copy=False):
+    """
+    Clone src to a new dst with FICLONE. Where the filesystem cannot clone it raises MoveError, or with
+    allow_copy copies the data instead. Keeps src and the timestamps, returns "reflink" or "copy".
+    A partial dst is removed on failure.
+    """
+    with open(src, "rb") as fsrc:
+        fd = os.open(dst, os.O_RDWR | os.O_CREAT | os.O_EXCL | getattr(os, "O_BINARY", 0), 0o666)
+        try:
+            with open(fd, "wb") as fdst:
+                method = "copy"
+                if fcntl is not None:
+                    try:
+                        fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+                        method = "reflink"
+                    except OSError as e:
+                        if e.errno not in FALLBACK_ERRNOS and e.errno != errno.ENOTTY:
+                            raise
+                if method == "copy" and not allow_copy:
+                    raise MoveError("the filesystem cannot clone this file, no data copied")
+                if method == "copy":
+                    copied = kernel_copy(fsrc.fileno(), fdst.fileno(), size)
+                    os.fsync(fdst.fileno())
+                    if copied != size:
+                        raise MoveError(f"copy verification failed, {copied} of {size} bytes written")
+                    if not same_content(fsrc.fileno(), fdst.fileno(), size):
+                        raise MoveError("copy verification failed, the copy differs from the source")
+            shutil.copystat(src, dst)
+        except BaseException:
+            try:
+                os.unlink(dst)
+            except OSError:
+                pass
+            raise
+    return method
+
+
+class MoveEngine:
+    """
+    Use as a context manager, move() queues a move and completed() yields the finished ones as
+    (source, destination, method, error) tuples, method is "rename" or "copy", error None on success.
+    With a staging mode ("link", "symlink", "reflink") move() leaves the source alone, the method is then
+    the mode, or "copy" where reflink_copy allows a reflink to fall back to copying.
+    """
+
+    def __init__(self, workers=4, max_inflight_bytes=256 * 1024 * 1024, mode="move", reflink_copy=False):
+        self.mode = mode
+        self.reflink_copy = reflink_copy
+        self.max_inflight_bytes = max_inflight_bytes
+        self._created = set()       # directories known to exist
+        self._devices = {}          # st_dev per destination directory
+        self._executor = ThreadPoolExecutor(max_workers=workers)
+        self._budget = threading.Condition()
+        self._inflight = 0
+        self._done = queue.Queue()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self._executor.shutdown(wait=True)
+
+    def ensure_dir(self, path):
+        """os.makedirs, but only the first time a directory is seen."""
+        if path not in self._created:
+            t = instrument.start()
+            os.makedirs(path, exist_ok=True)
+            instrument.stop("makedirs", t)
+            self._created.add(path)
+
+    def _device(self, path):
+        if path not in self._devices:
+            self._devices[path] = os.stat(path).st_dev
+        return self._devices[path]
+
+    def move(self, src, dst, st=None):
+        """Move src to dst, st is the stat result of src if the caller has it cached."""
+        try:
+            dst_dir = os.path.dirname(dst)
+            self.ensure_dir(dst_dir)
+            if st is None:
+                st = os.stat(src)
+            if self.mode in ("link", "symlink"):
+                # metadata only, done right here
+                t = instrument.start()
+                if self.mode == "link":
+                    os.link(src, dst)
+                else:
+                    os.symlink(os.path.abspath(src), dst)
+                instrument.stop("move." + self.mode, t, histogram=True)
+                self._done.put((src, dst, self.mode, None))
+                return
+            if self.mode == "move" and st.st_dev == self._device(dst_dir):
+                try:
+                    t = instrument.start()
+                    no_clobber_rename(src, dst)
+                    instrument.stop("move.rename", t, histogram=True)
+                    self._done.put((src, dst, "rename", None))
+                    return
+                except OSError as e:
+                    if e.errno != errno.EXDEV:      # bind mounts can share st_dev, then copy anyway
+                        raise
+        except OSError as e:
+            self._done.put((src, dst, None, e))
+            return
+
+        size = st.st_size
+        with self._budget:
+            # a file bigger than the whole budget is still copied, just on its own
+            while self._inflight and self._inflight + size > self.max_inflight_bytes:
+                self._budget.wait()
+            self._inflight += size
+        self._executor.submit(self._copy, src, dst, size)
+
+    def _copy(self, src, dst, size):
+        try:
+            t = instrument.start()
+            if self.mode == "reflink":
+                method = clone_file(src, dst, size, self.reflink_copy)
+            else:
+                copy_and_delete(src, dst, size)
+                method = "copy"
+            instrument.stop("move." + method, t, histogram=True)
+            if method == "copy":
+                instrument.count("move.copy.bytes", size)
+            self._done.put((src, dst, method, None))
+        except Exception as e:
+            self._done.put((src, dst, "copy", e))
+        finally:
+            with self._budget:
+                self._inflight -= size
+                self._budget.notify_all()
+
+    def completed(self):
+        """Yield the moves finished so far, without waiting."""
+        while True:
+            try:
+                yield self._done.get_nowait()
+            except queue.Empty:
+                return
+
+    def finish(self):
+        """Wait for all queued moves and yield the remaining results."""
+        self._executor.shutdown(wait=True)
+        yield from self.completed()
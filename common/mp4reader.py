@@ -0,0 +1,89 @@
+"""
+Seeking QuickTime/MP4 (ISO-BMFF) creation date reader.
+Only box headers are read while walking to moov/mvhd, so a multi-GB clip costs a handful of
+small reads, also when the moov box is written after the media data at the end of the file.
+Dates are returned like exiftool reports them: "QuickTime:CreateDate"/"QuickTime:ModifyDate" in UTC.
+"""
+
+import os
+import struct
+import datetime
+
+EPOCH_1904 = datetime.datetime(1904, 1, 1)
+TOP_LEVEL_TYPES = {b"ftyp", b"moov", b"mdat", b"free", b"skip", b"wide", b"pnot", b"uuid", b"meta"}
+MAX_BOXES = 10000       # sanity limit for corrupt files
+
+
+def is_mp4(head):
+    """True if the first bytes of a file look like an ISO-BMFF/QuickTime box."""
+    return len(head) >= 8 and head[4:8] in TOP_LEVEL_TYPES
+
+
+def _boxes(f, start, end):
+    """Yield (type, payload offset, box end) of the boxes between start and end, seeking over the payloads."""
+    offset = start
+    for _ in range(MAX_BOXES):
+        if end is not None and offset + 8 > end:
+            return
+        f.seek(offset)
+        header = f.read(8)
+        if len(header) < 8:
+            return
+        size, box_type = struct.unpack(">I4s", header)
+        payload = offset + 8
+        if size == 1:       # 64-bit largesize follows the type
+            large = f.read(8)
+            if len(large) < 8:
+                return
+            size = struct.unpack(">Q", large)[0]
+            payload += 8
+        elif size == 0:     # box extends to the end of the file
+            size = (end if end is not None else os.fstat(f.fileno()).st_size) - offset
+        if size < payload - offset:
+            return
+        yield box_type, payload, offset + size
+        offset += size
+
+
+def _find(f, box_type, start, end):
+    for found_type, payload, box_end in _boxes(f, start, end):
+        if found_type == box_type:
+            return payload, box_end
+    return None
+
+
+def _format(seconds):
+    if seconds == 0:    # not set
+        return None
+    try:
+        return (EPOCH_1904 + datetime.timedelta(seconds=seconds)).strftime("%Y:%m:%d %H:%M:%S")
+    except OverflowError:
+        return None
+
+
+def read_mp4_dates(f):
+    """
+    Returns {"QuickTime:CreateDate": ..., "QuickTime:ModifyDate": ...} from the mvhd box,
+    an empty dict if the movie has no dates set, or None if the file can not be parsed.
+    """
+    try:
+        moov = _find(f, b"moov", 0, None)
+        if moov is None:
+            return None
+        mvhd = _find(f, b"mvhd", moov[0], moov[1])
+        if mvhd is None:
+            return None
+        f.seek(mvhd[0])
+        data = f.read(20)
+        if data[:1] == b"\x01":     # version 1: 64-bit times
+            created, modified = struct.unpack_from(">QQ", data, 4)
+        else:
+            created, modified = struct.unpack_from(">II", data, 4)
+    except (struct.error, OSError, ValueError):
+        return None
+    dates = {}
+    if _format(created):
+        dates["QuickTime:CreateDate"] = _format(created)
+    if _format(modified):
+        dates["QuickTime:ModifyDate"] = _format(modified)
+    return dates
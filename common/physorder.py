@@ -0,0 +1,142 @@
+"""
+Physical-order scheduling of small reads (metadata headers, magic numbers) for spinning disks.
+
+A window of files is ordered by where their data starts on the disk: the physical address of the
+first extent from the FIEMAP ioctl (Linux), or the inode number where FIEMAP is not available (other
+platforms, filesystems without it, files without extents). The reads ahead are then requested in
+that order with posix_fadvise(WILLNEED), so the disk sweeps across the window once instead of
+seeking back and forth in walk order, and the reads that follow come from the page cache.
+
+On an SSD the sorting only costs time (benchmark/readorder.py), so a window is only reordered when
+its device is rotational according to /sys/dev/block (Linux); elsewhere it keeps the walk order.
+"""
+
+import os
+import sys
+import errno
+import struct
+
+FS_IOC_FIEMAP = 0xC020660B
+FIEMAP_MAX_OFFSET = 0xFFFFFFFFFFFFFFFF
+FIEMAP_EXTENT_UNKNOWN = 0x00000002      # location not known yet (delayed allocation)
+FIEMAP_HEADER = struct.Struct("=QQIIII")        # fm_start, fm_length, fm_flags, fm_mapped_extents, fm_extent_count, fm_reserved
+FIEMAP_EXTENT = struct.Struct("=QQQQQIIII")     # fe_logical, fe_physical, fe_length, 2 reserved, fe_flags, 3 reserved
+READAHEAD = 128 * 1024          # bytes read ahead of every file, covers the EXIF and MP4 headers the readers need
+UNSUPPORTED = {errno.ENOTTY, errno.EOPNOTSUPP, errno.EINVAL, errno.ENOSYS}
+
+try:
+    import fcntl
+except ImportError:     # Windows
+    fcntl = None
+
+
+def first_extent(fd):
+    """Physical byte address of the first extent of an open file, None without one; OSError if FIEMAP fails."""
+    request = bytearray(FIEMAP_HEADER.size + FIEMAP_EXTENT.size)
+    FIEMAP_HEADER.pack_into(request, 0, 0, FIEMAP_MAX_OFFSET, 0, 0, 1, 0)
+    fcntl.ioctl(fd, FS_IOC_FIEMAP, request, True)
+    if FIEMAP_HEADER.unpack_from(request, 0)[3] == 0:
+        return None     # empty or inline file
+    fields = FIEMAP_EXTENT.unpack_from(request, FIEMAP_HEADER.size)
+    if fields[5] & FIEMAP_EXTENT_UNKNOWN:      # fe_flags
+        return None
+    return fields[1]
+
+
+def is_rotational(dev):
+    """
+    True if the block device of st_dev is a spinning disk, from /sys/dev/block/MAJOR:MINOR (a partition
+    has the queue of its disk); False for solid state, and where it cannot be told (btrfs and network
+    filesystems have no block device of their own, other platforms no /sys).
+    """
+    if not sys.platform.startswith("linux"):
+        return False
+    path = os.path.realpath(f"/sys/dev/block/{os.major(dev)}:{os.minor(dev)}")
+    for directory in (path, os.path.dirname(path)):
+        try:
+            with open(os.path.join(directory, "queue", "rotational")) as f:
+                return f.read().strip() == "1"
+        except OSError:
+            continue
+    return False
+
+
+class PhysicalOrder:
+    """
+    Orders windows of paths by their location on disk and reads them ahead, see order(). With
+    rotational_only (the default) windows on other devices are left in walk order.
+    """
+
+    def __init__(self, readahead=READAHEAD, rotational_only=True):
+        self.readahead = readahead
+        self.rotational_only = rotational_only
+        self.fiemap = fcntl is not None and sys.platform.startswith("linux")
+        self.unsupported = set()        # devices whose filesystem has no FIEMAP
+        self.rotational = {}            # st_dev -> spinning disk
+        self.by_extent = 0
+        self.by_inode = 0
+        self.unordered = 0              # files left in walk order, not on a spinning disk
+
+    def _key(self, path):
+        try:
+            fd = os.open(path, os.O_RDONLY)
+        except OSError:
+            return (2, 0, 0)        # unreadable, last; the reader reports it
+        try:
+            st = os.fstat(fd)
+            if self.fiemap and st.st_dev not in self.unsupported:
+                try:
+                    physical = first_extent(fd)
+                except OSError as e:
+                    if e.errno in UNSUPPORTED:
+                        self.unsupported.add(st.st_dev)
+                    physical = None
+                if physical is not None:
+                    self.by_extent += 1
+                    return (0, st.st_dev, physical)
+            self.by_inode += 1
+            return (1, st.st_dev, st.st_ino)
+        finally:
+            os.close(fd)
+
+    def _read_ahead(self, path):
+        try:
+            fd = os.open(path, os.O_RDONLY)
+        except OSError:
+            return
+        try:
+            os.posix_fadvise(fd, 0, self.readahead, os.POSIX_FADV_WILLNEED)
+        except OSError:
+            pass
+        finally:
+            os.close(fd)
+
+    def _on_rotational(self, paths):
+        """Whether the window is on a spinning disk, told by its first file (a window is one directory)."""
+        try:
+            dev = os.stat(paths[0]).st_dev
+        except OSError:
+            return False
+        if dev not in self.rotational:
+            self.rotational[dev] = is_rotational(dev)
+        return self.rotational[dev]
+
+    def order(self, paths):
+        """
+        The paths in physical order, with their first bytes already requested from the disk in that order;
+        as they are if the window is not on a spinning disk.
+        """
+        if not paths:
+            return paths
+        if self.rotational_only and not self._on_rotational(paths):
+            self.unordered += len(paths)
+            return paths
+        ordered = sorted(paths, key=self._key)
+        if hasattr(os, "posix_fadvise"):
+            for path in ordered:
+                self._read_ahead(path)
+        return ordered
+
+    def summary(self):
+        return f"     physical order: {self.by_extent} files by first extent, {self.by_inode} by inode number, " \
+               f"{self.unordered} not on a spinning disk (walk order)"
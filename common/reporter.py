@@ -0,0 +1,255 @@
+"""
+Shared reporter of the scripts. Report text is handed in chunks to a background thread that writes
+the .rep file (and optionally the same events as json lines in <report>.jsonl), so the scripts never
+wait on the disk or the terminal per file. Instead of a print per file, a progress line with
+files/s (and the ETA when the total is known) is redrawn at most twice a second.
+
+Worker processes (see shards.py) report into a BufferedLog, which is merged into the Reporter
+of the main process once their shard is done.
+
+If the writer thread fails (a full disk), the error is raised by the next call that hands it
+text and by close(), instead of the script blocking on the full queue.
+
+Levels of the .rep file:
+    summary     only the header and the totals
+    errors      also the messages of files that failed
+    files       everything, the report the scripts always wrote (default)
+"""
+
+import os
+import sys
+import json
+import time
+import queue
+import threading
+
+LEVELS = ("summary", "errors", "files")
+FLUSH_EVERY = 256           # report lines per chunk handed to the writer thread
+PROGRESS_INTERVAL = 0.5     # seconds between redraws of the progress line
+
+
+def add_report_arguments(parser):
+    parser.add_argument("--report-level", choices=LEVELS, default="files",
+                        help="what goes into the report file: summary, errors or files (default, everything)")
+    parser.add_argument("--report-json", action="store_true",
+                        help="also write the report as json lines, next to the report file with .jsonl appended")
+    parser.add_argument("--no-progress", action="store_true", help="do not show a progress line on the terminal")
+
+
+def report_options(args):
+    """The keyword arguments of Reporter from the parsed command line."""
+    return {"level": args.report_level, "json_lines": args.report_json, "progress": not args.no_progress}
+
+
+def _format_seconds(seconds):
+    seconds = int(seconds)
+    return f"{seconds // 3600}:{seconds // 60 % 60:02d}:{seconds % 60:02d}"
+
+
+class Reporter:
+    """
+    File-like: write() takes the per-file report text the scripts always wrote, file() records
+    the outcome of one file as a json event and counts it in statuses, error() the text of a failure,
+    summary() text that is both printed and written at every level, tick() advances the progress line.
+    Use as a context manager or call close().
+    """
+
+    def __init__(self, path, level="files", json_lines=False, progress=True, append=False, total=None,
+                 stream=None):
+        self.level = LEVELS.index(level)
+        mode = "a" if append else "w"
+        self._rep = open(path, mode)
+        self._json = open(path + ".jsonl", mode, encoding="utf-8") if json_lines else None
+        self._stream = stream or sys.stderr
+        self._progress = progress and self._stream.isatty()
+        self._pending = []
+        self._lock = threading.Lock()
+        self._queue = queue.Queue(maxsize=64)       # bounded, a slow disk slows the script instead of eating memory
+        self._failed = None         # exception of the writer thread
+        self._print = True          # False once stdout is a closed pipe
+        self._writer = threading.Thread(target=self._write_chunks, daemon=True)
+        self._writer.start()
+        self.total = total
+        self.files = 0
+        self.statuses = {}          # status -> files, of the file() calls (merged shards count their own)
+        self._start = time.monotonic()
+        self._next_draw = self._start + PROGRESS_INTERVAL
+        self._drawn = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _write_chunks(self):
+        while True:
+            chunk = self._queue.get()
+            if chunk is None:
+                return
+            if self._failed is not None:
+                continue        # keep taking chunks, so no producer blocks on the full queue
+            try:
+                rep = [text for target, text in chunk if target is self._rep]
+                if rep:
+                    self._rep.write("".join(rep))
+                if self._json is not None:
+                    lines = [text for target, text in chunk if target is self._json]
+                    if lines:
+                        self._json.write("".join(lines))
+            except Exception as e:
+                self._failed = e
+
+    def _check(self):
+        if self._failed is not None:
+            raise self._failed
+
+    def _put(self, target, text):
+        self._check()
+        with self._lock:
+            self._pending.append((target, text))
+            if len(self._pending) < FLUSH_EVERY:
+                return
+            chunk, self._pending = self._pending, []
+        self._queue.put(chunk)
+
+    def _event(self, event, **fields):
+        if self._json is not None:
+            fields["event"] = event
+            self._put(self._json, json.dumps(fields, ensure_ascii=False) + "\n")
+
+    def write(self, text):
+        if self.level == 2:
+            self._put(self._rep, text)
+
+    def file(self, path, status, **fields):
+        """The outcome of one file, for the json lines."""
+        self.statuses[status] = self.statuses.get(status, 0) + 1
+        if self._json is not None:
+            self._event("file", path=path, status=status, **fields)
+
+    def error(self, text, **fields):
+        if self.level >= 1:
+            self._put(self._rep, text)
+        self._event("error", message=text.strip(), **fields)
+
+    def summary(self, text):
+        self._put(self._rep, text)
+        self._event("summary", message=text.strip())
+        self._clear_progress()
+        if self._print:
+            try:
+                print(text, flush=True)
+            except BrokenPipeError:
+                # the reader of a pipe went away (| head): the report file still gets everything, and
+                # stdout points at devnull so the interpreter does not fail flushing it at exit
+                self._print = False
+                devnull = os.open(os.devnull, os.O_WRONLY)
+                os.dup2(devnull, sys.stdout.fileno())
+                os.close(devnull)
+
+    def merge(self, text, json_lines, files=0):
+        """Add the report of a shard that was processed elsewhere, see BufferedLog."""
+        if text:
+            self._put(self._rep, text)
+        if json_lines and self._json is not None:
+            self._put(self._json, json_lines)
+        self.tick(files)
+
+    def set_total(self, total):
+        self.total = total
+
+    def tick(self, n=1):
+        self.files += n
+        if self._progress:
+            now = time.monotonic()
+            if now >= self._next_draw:
+                self._next_draw = now + PROGRESS_INTERVAL
+                self._draw(now)
+
+    def _draw(self, now):
+        elapsed = now - self._start
+        rate = self.files / elapsed if elapsed > 0 else 0.0
+        line = f"  {self.files} files, {rate:.0f} files/s, {_format_seconds(elapsed)} elapsed"
+        if self.total and rate > 0:
+            line += f", ETA {_format_seconds(max(self.total - self.files, 0) / rate)}"
+        self._stream.write("\r" + line.ljust(78))
+        self._stream.flush()
+        self._drawn = True
+
+    def _clear_progress(self):
+        if self._drawn:
+            self._stream.write("\r" + " " * 78 + "\r")
+            self._stream.flush()
+            self._drawn = False
+
+    def flush(self):
+        self._check()
+        with self._lock:
+            chunk, self._pending = self._pending, []
+        if chunk:
+            self._queue.put(chunk)
+
+    def close(self):
+        if self._rep.closed:
+            return
+        self._clear_progress()
+        with self._lock:
+            chunk, self._pending = self._pending, []
+        if chunk:
+            self._queue.put(chunk)
+        self._queue.put(None)
+        self._writer.join()
+        try:
+            self._rep.close()
+        finally:
+            if self._json is not None:
+                self._json.close()
+        self._check()
+
+
+class BufferedLog:
+    """
+    Stand-in for a Reporter in a worker process: keeps the report text and json events of one shard
+    in memory, at the level of the Reporter they are merged into, and counts the file statuses.
+    """
+
+    def __init__(self, level="files", json_lines=False, **ignored):
+        self.level = LEVELS.index(level)
+        self.json_lines = json_lines
+        self._rep = []
+        self._json = []
+        self.files = 0
+        self.statuses = {}
+
+    def write(self, text):
+        if self.level == 2:
+            self._rep.append(text)
+
+    def file(self, path, status, **fields):
+        self.statuses[status] = self.statuses.get(status, 0) + 1
+        if self.json_lines:
+            self._event("file", path=path, status=status, **fields)
+
+    def error(self, text, **fields):
+        if self.level >= 1:
+            self._rep.append(text)
+        self._event("error", message=text.strip(), **fields)
+
+    def _event(self, event, **fields):
+        if self.json_lines:
+            fields["event"] = event
+            self._json.append(json.dumps(fields, ensure_ascii=False) + "\n")
+
+    def summary(self, text):
+        self._rep.append(text)
+
+    def tick(self, n=1):
+        self.files += n
+
+    def flush(self):
+        pass
+
+    def result(self, extra=None):
+        """(report text, json lines, files, statuses, extra counters), for Reporter.merge() and run_shards()."""
+        return "".join(self._rep), "".join(self._json), self.files, self.statuses, extra or {}
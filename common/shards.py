@@ -0,0 +1,187 @@
+"""
+Sharded execution of the per-file work of a script on a process pool (--workers N).
+
+The walk stays in the main process and cuts the tree into small shards: the files of one directory,
+at most SHARD_SIZE of them, so a huge directory becomes several shards and a tree of many small
+directories gives many small ones. Shards are fed to a ProcessPoolExecutor through a window of a few
+shards per worker, an idle worker takes the next shard from the shared queue, so a worker stuck on
+a slow shard never holds up work that another one could do.
+
+A worker reports into a BufferedLog, the text and events of a finished shard are merged into the
+Reporter of the main process, with the totals of the file statuses. A shard that raises, or whose
+worker died, is reported as an error and its files count as failed. Workers ignore SIGINT (and so
+do the programs they start), on Ctrl-C the main process stops the walk, cancels the shards that did
+not start, waits for the running ones and merges what finished. With --instrument the workers measure
+as well, what they measured comes back with every shard and is added to the main process.
+"""
+
+import os
+import signal
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
+
+import treewalker
+import instrument
+
+SHARD_SIZE = 500
+WINDOW = 4      # shards in flight per worker
+
+
+def add_worker_arguments(parser, what):
+    parser.add_argument("--workers", type=int, default=0,
+                        help=f"number of processes {what}, the tree is split into shards of at most {SHARD_SIZE} "
+                             "files of one directory (default 0, all in this process)")
+
+
+class ShardEntry:
+    """The part of os.DirEntry the scripts use, rebuilt in the worker from a directory and a name."""
+    __slots__ = ("path", "name", "_stat")
+
+    def __init__(self, directory, name):
+        self.path = os.path.join(directory, name)
+        self.name = name
+        self._stat = None
+
+    def stat(self):
+        if self._stat is None:
+            self._stat = os.stat(self.path)
+        return self._stat
+
+
+def walk_shards(directory, walk_options={}, shard_size=SHARD_SIZE):
+    """Yield (directory, [names]) shards of the files below directory, in walk order."""
+    current = None
+    names = []
+    for entry in treewalker.walk_files(directory, **walk_options):
+        parent = os.path.dirname(entry.path)
+        if parent != current or len(names) >= shard_size:
+            if names:
+                yield current, names
+            current = parent
+            names = []
+        names.append(entry.name)
+    if names:
+        yield current, names
+
+
+def ignore_sigint(measure=False, initializer=None, *initargs):
+    """
+    Worker initializer: Ctrl-C is handled by the main process only, measure when the main process
+    does (a spawned worker does not inherit that), then run the script's own initializer.
+    """
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    if measure:
+        instrument.enable()
+        instrument.take()       # a forked worker starts with a copy of what the main process measured so far
+    if initializer is not None:
+        initializer(*initargs)
+
+
+def _measured_shard(process_shard, *args):
+    """Run a shard in a worker, returns (its result, what the worker measured meanwhile)."""
+    return process_shard(*args), instrument.take() if instrument.enabled() else None
+
+
+class ShardRun:
+    """Result of run_shards: summed statuses and extra counters, shards merged and whether Ctrl-C stopped the run."""
+
+    def __init__(self):
+        self.statuses = {}
+        self.extra = {}
+        self.shards = 0
+        self.files = 0
+        self.cancelled = 0
+        self.failed = 0         # shards that raised instead of returning a result
+        self.walked = False
+        self.interrupted = False
+
+    def add(self, statuses, extra, files):
+        self.shards += 1
+        self.files += files
+        for totals, counts in ((self.statuses, statuses), (self.extra, extra)):
+            for key, value in counts.items():
+                totals[key] = totals.get(key, 0) + value
+
+
+def run_shards(shards, process_shard, args, log, workers, ordered=False, initializer=None, initargs=()):
+    """
+    Run process_shard(directory, names, *args) on a pool of workers for every shard, it returns
+    (report text, json lines, files, statuses, extra counters), see BufferedLog.result(). The results
+    are merged into log as shards finish, in shard order when ordered. Returns a ShardRun.
+    """
+    run = ShardRun()
+    pending = []
+    shard_of = {}       # future -> (directory, number of files)
+    executor = ProcessPoolExecutor(max_workers=workers, initializer=ignore_sigint,
+                                   initargs=(instrument.enabled(), initializer) + tuple(initargs))
+
+    def merge(future):
+        directory, count = shard_of.pop(future)
+        try:
+            (text, json_lines, files, statuses, extra), measurements = future.result()
+        except Exception as e:
+            run.failed += 1
+            log.error(f"\n  Error, the shard of {count} files in {directory} failed: {e!r}\n", path=directory)
+            log.tick(count)
+            run.add({"failed": count}, {}, count)
+            return
+        if measurements is not None:
+            instrument.merge(measurements)
+        log.merge(text, json_lines, files)
+        run.add(statuses, extra, files)
+
+    def collect(block):
+        """Merge the finished shards, with block wait for at least one."""
+        if ordered:
+            while pending and (block or pending[0].done()):
+                merge(pending.pop(0))
+                block = False
+            return
+        if block:
+            wait(pending, return_when=FIRST_COMPLETED)
+        for future in [future for future in pending if future.done()]:
+            pending.remove(future)
+            merge(future)
+
+    try:
+        for directory, names in shards:
+            while len(pending) >= workers * WINDOW:
+                collect(block=True)
+            future = executor.submit(_measured_shard, process_shard, directory, names, *args)
+            shard_of[future] = (directory, len(names))
+            pending.append(future)
+            collect(block=False)
+        run.walked = True
+        while pending:
+            collect(block=True)
+        executor.shutdown(wait=True)
+    except BrokenProcessPool as e:
+        # a worker process died (killed, out of memory): nothing more can be submitted
+        log.error(f"\n  Error, a worker process died, the rest of the tree is not processed: {e}\n")
+        if hasattr(shards, "close"):
+            shards.close()
+        executor.shutdown(wait=True)
+        for future in pending:
+            merge(future)
+    except KeyboardInterrupt:
+        run.interrupted = True
+        if hasattr(shards, "close"):
+            shards.close()      # stops the walker threads
+        executor.shutdown(wait=True, cancel_futures=True)
+        for future in pending:
+            if future.cancelled():
+                run.cancelled += 1
+            else:
+                merge(future)
+    return run
+
+
+def interrupted_summary(run):
+    return "\n\n  Interrupted by Ctrl-C, the report holds the shards that finished:" \
+        + f"\n   .......... shards finished: {run.shards} ({run.files} files)" \
+        + f"\n   .......... shards cancelled before they started: {run.cancelled}" \
+        + ("" if run.walked else "\n   .......... the rest of the tree was not walked")
+
+
+def failed_summary(run):
+    return f"\n\n  Shards that failed with an error (see the report), their files count as failed: {run.failed}"
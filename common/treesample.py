@@ -0,0 +1,188 @@
+"""
+Estimates the number of files and bytes per extension of a huge tree from a partial, randomized walk
+(Knuth's estimator for the size of a search tree).
+
+A probe descends from the root to a leaf directory, choosing one subdirectory at every level. A
+subdirectory is chosen with a probability weighted by its fan-out, read from its link count
+(st_nlink of a directory is 2 + its number of subdirectories on most Unix filesystems; where it is
+not, every subdirectory weighs the same). Every directory on the path contributes its files divided
+by the probability of reaching it, which makes every probe an unbiased estimate of the totals; the
+mean of many probes and its standard error give the estimate with a 95% confidence interval.
+
+Within a directory the names (and so the counts per extension) come from the streamed listing,
+sizes are only read (stat) for a reservoir sample of the files when a directory holds more of them,
+and scaled up per extension. Listings are remembered, so the upper levels are read only once.
+"""
+
+import os
+import math
+import time
+import random
+
+import treewalker
+
+Z95 = 1.96
+
+
+def _relative(width, value):
+    if value:
+        return width / value
+    return 0.0 if width == 0 else math.inf
+
+
+class _Directory:
+    """What a probe needs of a listed directory: its subdirectories with their weights and its files per extension."""
+    __slots__ = ("subdirs", "weights", "total_weight", "counts", "bytes")
+
+    def __init__(self, subdirs, weights, counts, sizes):
+        self.subdirs = subdirs
+        self.weights = weights
+        self.total_weight = sum(weights)
+        self.counts = counts        # extension -> files
+        self.bytes = sizes          # extension -> (estimated) bytes
+
+
+class TreeSampler:
+
+    def __init__(self, root, sample_entries=200, seed=None):
+        self.root = root
+        self.sample_entries = sample_entries
+        self.random = random.Random(seed)
+        self.listed = {}        # path -> _Directory
+        self.stats = 0
+        self.probes = 0
+        self.sums = {}          # extension -> [sum files, sum files², sum bytes, sum bytes²] over the probes
+        self.totals = [0.0, 0.0, 0.0, 0.0]
+
+    def _list(self, path):
+        directory = self.listed.get(path)
+        if directory is not None:
+            return directory
+        subdirs = []
+        weights = []
+        counts = {}
+        reservoir = []      # (extension, entry) of at most sample_entries files
+        seen = 0
+        try:
+            with os.scandir(path) as it:
+                for entry in it:
+                    try:
+                        if entry.is_dir():
+                            if not entry.is_symlink():
+                                subdirs.append(entry.path)
+                                try:
+                                    weights.append(max(1, entry.stat().st_nlink - 1))
+                                    self.stats += 1
+                                except OSError:
+                                    weights.append(1)
+                            continue
+                        if not entry.is_file() or entry.name in treewalker.REPORT_FILES:
+                            continue
+                    except OSError:
+                        continue
+                    ext = os.path.splitext(entry.name)[1]
+                    counts[ext] = counts.get(ext, 0) + 1
+                    seen += 1
+                    # reservoir sampling (algorithm R), only the sampled files are stat'ed
+                    if len(reservoir) < self.sample_entries:
+                        reservoir.append((ext, entry))
+                    else:
+                        i = self.random.randrange(seen)
+                        if i < self.sample_entries:
+                            reservoir[i] = (ext, entry)
+        except OSError:
+            pass
+        sampled = {}        # extension -> [files, bytes] in the reservoir
+        for ext, entry in reservoir:
+            try:
+                size = entry.stat().st_size
+                self.stats += 1
+            except OSError:
+                continue
+            counts_sizes = sampled.setdefault(ext, [0, 0])
+            counts_sizes[0] += 1
+            counts_sizes[1] += size
+        files = sum(value[0] for value in sampled.values())
+        mean = sum(value[1] for value in sampled.values()) / files if files else 0.0
+        sizes = {}
+        for ext, count in counts.items():
+            if ext in sampled:
+                sizes[ext] = count * sampled[ext][1] / sampled[ext][0]
+            else:
+                sizes[ext] = count * mean       # not in the sample, sized like the average file of the directory
+        directory = _Directory(subdirs, weights, counts, sizes)
+        self.listed[path] = directory
+        return directory
+
+    def probe(self):
+        """One random descent from the root to a leaf, adds its estimate of the totals."""
+        estimate = {}       # extension -> [files, bytes]
+        path = self.root
+        scale = 1.0         # 1 / probability of reaching path
+        while True:
+            directory = self._list(path)
+            for ext, count in directory.counts.items():
+                values = estimate.setdefault(ext, [0.0, 0.0])
+                values[0] += count * scale
+                values[1] += directory.bytes[ext] * scale
+            if not directory.subdirs:
+                break
+            pick = self.random.random() * directory.total_weight
+            for subdir, weight in zip(directory.subdirs, directory.weights):
+                pick -= weight
+                if pick < 0:
+                    break
+            scale *= directory.total_weight / weight
+            path = subdir
+        self.probes += 1
+        files = 0.0
+        size = 0.0
+        for ext, (count, ext_bytes) in estimate.items():
+            sums = self.sums.setdefault(ext, [0.0, 0.0, 0.0, 0.0])
+            sums[0] += count
+            sums[1] += count * count
+            sums[2] += ext_bytes
+            sums[3] += ext_bytes * ext_bytes
+            files += count
+            size += ext_bytes
+        self.totals[0] += files
+        self.totals[1] += files * files
+        self.totals[2] += size
+        self.totals[3] += size * size
+
+    def _interval(self, total, total_squares):
+        """(mean, half width of the 95% confidence interval) of a sum and sum of squares over the probes."""
+        n = self.probes
+        mean = total / n
+        if n < 2:
+            return mean, math.inf
+        variance = max(0.0, (total_squares - total * total / n) / (n - 1))
+        return mean, Z95 * math.sqrt(variance / n)
+
+    def estimates(self):
+        """{extension: (files, ± files, bytes, ± bytes)}, by estimated bytes."""
+        result = {}
+        for ext, (count, count_squares, size, size_squares) in self.sums.items():
+            result[ext] = self._interval(count, count_squares) + self._interval(size, size_squares)
+        return dict(sorted(result.items(), key=lambda item: -item[1][2]))
+
+    def total(self):
+        """(files, ± files, bytes, ± bytes) of the whole tree."""
+        return self._interval(self.totals[0], self.totals[1]) + self._interval(self.totals[2], self.totals[3])
+
+    def precision(self):
+        """The larger relative half width of the confidence intervals of the total files and bytes."""
+        files, files_width, size, size_width = self.total()
+        return max(_relative(files_width, files), _relative(size_width, size))
+
+    def run(self, precision=0.05, time_budget=60.0, min_probes=30, max_probes=1_000_000):
+        """Probe until the total is known within precision (relative, 95%), the time budget is spent or max_probes."""
+        deadline = time.monotonic() + time_budget
+        while self.probes < max_probes:
+            self.probe()
+            if self.probes >= min_probes and self.probes % 10 == 0:
+                if self.precision() <= precision:
+                    return "precision reached"
+            if time.monotonic() >= deadline:
+                return "time budget spent"
+        return "maximum number of probes"
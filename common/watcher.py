@@ -0,0 +1,269 @@
+"""
+Watches a directory tree for files that are ready to be processed, for the long running watch mode
+of the pipeline. On Linux the tree is watched with inotify (through ctypes) for IN_CLOSE_WRITE and
+IN_MOVED_TO, new subdirectories are watched as they appear. Where inotify is not available or its
+limits are hit (fs.inotify.max_user_watches, max_user_instances) the watcher falls back to listing
+the tree every poll interval and diffing it against the previous listing.
+
+Uploads are debounced: a file is only handed out once no event came in for it during the settle
+time and its size and modification time did not change meanwhile.
+"""
+
+import os
+import sys
+import time
+import errno
+import select
+import struct
+import ctypes
+import ctypes.util
+
+import treewalker
+
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR
+EVENT = struct.Struct("iIII")       # wd, mask, cookie, length of the name that follows
+# running out of watches or instances, the errors after which the watcher falls back to polling
+LIMIT_ERRNOS = {errno.ENOSPC, errno.ENOMEM, errno.EMFILE, errno.ENFILE}
+# names of files that are still being written by an uploader or editor
+PARTIAL_SUFFIXES = (".part", ".partial", ".tmp", ".crdownload", ".download", "_exiftool_tmp")
+
+
+def is_partial(name):
+    return name.startswith(".") or name.endswith(PARTIAL_SUFFIXES) or name in treewalker.REPORT_FILES
+
+
+class Inotify:
+    """A thin ctypes wrapper around one inotify instance, raises OSError where inotify fails."""
+
+    def __init__(self):
+        if not sys.platform.startswith("linux"):
+            raise OSError(errno.ENOSYS, "inotify is only available on Linux")
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self._add_watch = libc.inotify_add_watch
+        self._add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            error = ctypes.get_errno()
+            raise OSError(error, os.strerror(error))
+
+    def add_watch(self, path, mask=WATCH_MASK):
+        wd = self._add_watch(self.fd, os.fsencode(path), mask)
+        if wd < 0:
+            error = ctypes.get_errno()
+            raise OSError(error, os.strerror(error), path)
+        return wd
+
+    def read(self, timeout):
+        """The events that arrive within timeout seconds, as (wd, mask, name) tuples."""
+        if not select.select([self.fd], [], [], timeout)[0]:
+            return []
+        try:
+            data = os.read(self.fd, 256 * 1024)
+        except BlockingIOError:
+            return []
+        events = []
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = EVENT.unpack_from(data, offset)
+            offset += EVENT.size
+            name = os.fsdecode(data[offset:offset + length].rstrip(b"\0"))
+            offset += length
+            events.append((wd, mask, name))
+        return events
+
+    def close(self):
+        os.close(self.fd)
+
+
+class TreeWatcher:
+    """
+    Yields the paths of files below directory that were written or moved in, with inotify or by
+    periodic listings. exclude holds directories below directory that are never watched (eg. the
+    destination of the sort stage), poll=True skips inotify altogether (network filesystems).
+    """
+
+    def __init__(self, directory, exclude=(), poll=False, poll_interval=30.0, walk_options={}):
+        self.directory = directory
+        self.exclude = {os.path.realpath(path) for path in exclude}
+        self.poll_interval = poll_interval
+        self.walk_options = walk_options
+        self.inotify = None
+        self.fallback_reason = None
+        self.dirs = {}          # wd -> directory path
+        self.snapshot = {}      # path -> (size, mtime_ns), in polling mode
+        self.next_scan = 0.0
+        self.rescan = True      # on start and after a queue overflow every file is reported once
+        if not poll:
+            try:
+                self.inotify = Inotify()
+                self._watch_tree(directory)
+            except OSError as e:
+                self._fall_back(e)
+        if self.inotify is None and self.fallback_reason is None:
+            self.fallback_reason = "polling was asked for"
+
+    @property
+    def mode(self):
+        return "inotify" if self.inotify is not None else "poll"
+
+    def _fall_back(self, error):
+        self.fallback_reason = f"inotify failed ({error.strerror}), falling back to listing the tree " \
+                               f"every {self.poll_interval:g} seconds"
+        if self.inotify is not None:
+            self.inotify.close()
+            self.inotify = None
+        self.dirs = {}
+
+    def _excluded(self, path):
+        real = os.path.realpath(path)
+        return any(real == excluded or real.startswith(excluded + os.sep) for excluded in self.exclude)
+
+    def _watch_tree(self, directory):
+        """Watch directory and its subdirectories, raises OSError only when a watch limit is hit."""
+        stack = [directory]
+        while stack:
+            path = stack.pop()
+            if self._excluded(path):
+                continue
+            try:
+                self.dirs[self.inotify.add_watch(path)] = path
+            except OSError as e:
+                if e.errno in LIMIT_ERRNOS:
+                    raise
+                continue        # gone or unreadable meanwhile
+            try:
+                with os.scandir(path) as it:
+                    for entry in it:
+                        if entry.is_dir(follow_symlinks=False):
+                            stack.append(entry.path)
+            except OSError:
+                continue
+
+    def _walk(self, directory, stat=False):
+        """The files below directory, the excluded trees are not listed at all."""
+        prune = self._excluded if self.exclude else None
+        return treewalker.walk_files(directory, stat=stat, prune=prune, **self.walk_options)
+
+    def _listing(self):
+        files = {}
+        for entry in self._walk(self.directory, stat=True):
+            stat = entry.stat()
+            files[entry.path] = (stat.st_size, stat.st_mtime_ns)
+        return files
+
+    def _all_files(self):
+        """Every file below the tree, for the first pass and after a lost event queue."""
+        return [path for path in self._listing() if not is_partial(os.path.basename(path))]
+
+    def _new_files_in(self, directory):
+        """Files already in a directory that was just created or moved in, they raise no events of their own."""
+        paths = []
+        for entry in self._walk(directory):
+            if not is_partial(entry.name):
+                paths.append(entry.path)
+        return paths
+
+    def poll(self, timeout):
+        """The paths that changed, waits at most timeout seconds for them."""
+        if self.inotify is not None:
+            if self.rescan:
+                self.rescan = False
+                return self._all_files()
+            try:
+                return self._read_events(timeout)
+            except OSError as e:
+                if e.errno not in LIMIT_ERRNOS:
+                    raise
+                self._fall_back(e)
+                self.rescan = True
+        now = time.monotonic()
+        if now < self.next_scan:
+            time.sleep(min(timeout, self.next_scan - now))
+            return []
+        self.next_scan = now + self.poll_interval
+        listing = self._listing()
+        if self.rescan:
+            self.rescan = False
+            changed = list(listing)
+        else:
+            changed = [path for path, state in listing.items() if self.snapshot.get(path) != state]
+        self.snapshot = listing
+        return [path for path in changed if not is_partial(os.path.basename(path))]
+
+    def _read_events(self, timeout):
+        paths = []
+        for wd, mask, name in self.inotify.read(timeout):
+            if mask & IN_Q_OVERFLOW:
+                paths.extend(self._all_files())
+                continue
+            if mask & (IN_IGNORED | IN_DELETE_SELF | IN_MOVE_SELF):
+                self.dirs.pop(wd, None)
+                continue
+            directory = self.dirs.get(wd)
+            if directory is None:
+                continue
+            path = os.path.join(directory, name)
+            if mask & IN_ISDIR:
+                if mask & (IN_CREATE | IN_MOVED_TO) and not self._excluded(path):
+                    self._watch_tree(path)
+                    paths.extend(self._new_files_in(path))
+            elif mask & (IN_CLOSE_WRITE | IN_MOVED_TO) and not is_partial(name):
+                paths.append(path)
+        return paths
+
+    def close(self):
+        if self.inotify is not None:
+            self.inotify.close()
+            self.inotify = None
+
+
+class Debouncer:
+    """Holds back touched files until they were quiet for settle seconds and their stat stayed the same."""
+
+    def __init__(self, settle=2.0):
+        self.settle = settle
+        self.pending = {}       # path -> (deadline, (size, mtime_ns))
+
+    def touch(self, path, now=None):
+        try:
+            stat = os.stat(path)
+        except OSError:
+            self.pending.pop(path, None)
+            return
+        now = time.monotonic() if now is None else now
+        self.pending[path] = (now + self.settle, (stat.st_size, stat.st_mtime_ns))
+
+    def ready(self, now=None):
+        """The (path, stat) of the files that settled, the others stay pending."""
+        now = time.monotonic() if now is None else now
+        ready = []
+        for path, (deadline, state) in list(self.pending.items()):
+            if deadline > now:
+                continue
+            try:
+                stat = os.stat(path)
+            except OSError:
+                del self.pending[path]
+                continue
+            if (stat.st_size, stat.st_mtime_ns) != state:
+                # still growing without closing, eg. an upload that keeps the file open
+                self.pending[path] = (now + self.settle, (stat.st_size, stat.st_mtime_ns))
+                continue
+            del self.pending[path]
+            ready.append((path, stat))
+        return ready
+
+    def next_deadline(self):
+        return min((deadline for deadline, _ in self.pending.values()), default=None)
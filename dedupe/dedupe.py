@@ -0,0 +1,89 @@
+"""
+    Recursively traverses a directory and lists the files with identical content, by size first,
+    then by a hash of their first and last 64 KB and only then by a hash of the whole file.
+    With --archive the files are also checked against a hash index of an archive tree.
+"""
+
+import os
+import time
+import sys
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "common"))
+import treewalker
+import instrument
+from duplicates import HashIndex, find_duplicate_groups
+from reporter import Reporter, add_report_arguments, report_options
+
+INDEX_FILE = "orderbydate.hashes"       # the same index orderbydate --dedupe keeps of its destination
+
+
+def find_duplicates(directory, archive=None, workers=4, walk_options={}, report_options={}):
+
+    start = time.time()
+    with Reporter(os.path.join(directory, "./dedupe.rep"), **report_options) as log:
+
+        message = "\n===================== dedupe.py =====================\n" \
+                            + "\n     Processing directory: " + directory +"\n"
+        if archive:
+            message += "     Archive: " + archive + "\n"
+        log.summary(message)
+
+        files = []
+        for entry in treewalker.walk_files(directory, stat=True, **walk_options):
+            files.append((entry.path, entry.stat().st_size))
+            log.tick()
+
+        index = None
+        if archive:
+            index = HashIndex(os.path.join(archive, INDEX_FILE), archive)
+            index.refresh(walk_options)
+        sizes = dict(files)
+        groups = find_duplicate_groups(files, workers, index)
+        if index is not None:
+            index.close()
+
+        duplicates = 0
+        wasted = 0
+        for archive_paths, paths in groups:
+            size = sizes[paths[0]]
+            log.write(f"\n\n  » {len(archive_paths) + len(paths)} identical files of {size} bytes:")
+            for path in archive_paths:
+                log.write(f"\n     ...in the archive: {path}")
+            for path in paths:
+                log.write(f"\n     ...{path}")
+            extra = len(paths) if archive_paths else len(paths) - 1
+            duplicates += extra
+            wasted += extra * size
+            log.file(paths[0], "duplicate", size=size, paths=paths, archive=archive_paths)
+
+        message = f"\n\n  Script finished, scanned {len(files)} files:" \
+                            + f"\n   .......... groups of identical files: {len(groups)}" \
+                            + f"\n   .......... duplicate files: {duplicates}" \
+                            + f"\n   .......... bytes taken by duplicates: {wasted}"
+        log.summary(message)
+
+        message = f"\n\n    Script runtime: {round(time.time()-start)} seconds" \
+                            + "\n======================= end of script =======================\n"
+        log.summary(message)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="List the files with identical content in a directory tree.")
+    parser.add_argument("directory", help="targed directory")
+    parser.add_argument("--archive", help=f"also compare with the files of this tree, indexed in its {INDEX_FILE}")
+    parser.add_argument("--workers", type=int, default=4, help="number of processes hashing whole files")
+    treewalker.add_walk_arguments(parser)
+    add_report_arguments(parser)
+    instrument.add_instrument_arguments(parser)
+    args = parser.parse_args()
+    instrument.start_run(args)
+
+    if not os.path.isdir(args.directory):
+        print(f"Error, '{args.directory}' is not a valid directory. Exiting...")
+        sys.exit(2)
+    elif args.archive and not os.path.isdir(args.archive):
+        print(f"Error, '{args.archive}' is not a valid directory. Exiting...")
+        sys.exit(2)
+    else:
+        find_duplicates(args.directory, args.archive, args.workers, treewalker.walk_options(args), report_options(args))
@@ -5,58 +5,278 @@
 import os
 import time
 import sys
+import argparse
+from concurrent.futures import ThreadPoolExecutor
 
-def list_filetypes(directory):
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "common"))
+import treewalker
+import instrument
+import filemagic
+from physorder import PhysicalOrder
+from treesample import TreeSampler
+from catalog import Catalog, CATALOG_FILE
+from reporter import Reporter, add_report_arguments, report_options
 
+CHUNK_SIZE = 1000       # files whose heads are read concurrently, bounds the memory for any tree size
+
+
+def sniff_file(path):
+    head, size = filemagic.read_head(path)
+    if head is None:
+        return None, size       # size holds the error
+    return filemagic.sniff(head), size
+
+
+class ContentCensus:
+    """Counts and bytes per real type, overall and per top-level directory, and the extension mismatches."""
+
+    def __init__(self, directory, max_mismatches=100):
+        self.prefix = len(os.path.join(directory, ""))
+        self.types = {}             # type -> [files, bytes]
+        self.tops = {}              # top-level directory -> {type: [files, bytes]}
+        self.mismatch_pairs = {}    # (extension, type) -> files
+        self.mismatches = []        # the first max_mismatches paths
+        self.max_mismatches = max_mismatches
+        self.errors = 0
+
+    def add(self, path, ext, filetype, size):
+        name = filetype or "unknown"
+        counts = self.types.setdefault(name, [0, 0])
+        counts[0] += 1
+        counts[1] += size
+        parts = path[self.prefix:].split(os.sep, 1)
+        top = parts[0] if len(parts) > 1 else "."
+        counts = self.tops.setdefault(top, {}).setdefault(name, [0, 0])
+        counts[0] += 1
+        counts[1] += size
+        if filemagic.is_mismatch(ext, filetype):
+            pair = (ext, filetype)
+            self.mismatch_pairs[pair] = self.mismatch_pairs.get(pair, 0) + 1
+            if len(self.mismatches) < self.max_mismatches:
+                self.mismatches.append((path, filetype))
+
+    def process_chunk(self, entries, executor, log, scheduler=None):
+        if scheduler is not None:
+            order = {path: i for i, path in enumerate(scheduler.order([entry.path for entry in entries]))}
+            entries = sorted(entries, key=lambda entry: order[entry.path])
+        for entry, (filetype, size) in zip(entries, executor.map(sniff_file, [entry.path for entry in entries])):
+            if isinstance(size, OSError):
+                self.errors += 1
+                log.error(f"\nError, could not read file: {entry.path}: {size}", path=entry.path)
+                continue
+            ext = os.path.splitext(entry.name)[1]
+            self.add(entry.path, ext, filetype, size)
+            log.file(entry.path, filetype or "unknown", ext=ext, size=size)
+        log.tick(len(entries))
+
+    def summary(self):
+        files = sum(counts[0] for counts in self.types.values())
+        message = f"\n\n  Script finished, read the heads of {files} files and found these types:"
+        for name, (count, size) in sorted(self.types.items(), key=lambda item: -item[1][1]):
+            message += f"\n   .......... {name}: {count} ({size} bytes)"
+        if self.errors:
+            message += f"\n   .......... unreadable: {self.errors}"
+        message += "\n\n  Per top-level directory:"
+        for top in sorted(self.tops):
+            message += f"\n   {top}"
+            for name, (count, size) in sorted(self.tops[top].items(), key=lambda item: -item[1][1]):
+                message += f"\n   .......... {name}: {count} ({size} bytes)"
+        total = sum(self.mismatch_pairs.values())
+        message += f"\n\n  Extension/content mismatches: {total}"
+        for (ext, name), count in sorted(self.mismatch_pairs.items(), key=lambda item: -item[1]):
+            message += f"\n   .......... '{ext}' holding {name}: {count}"
+        if self.mismatches:
+            message += f"\n\n  First {len(self.mismatches)} mismatched files:"
+            for path, name in self.mismatches:
+                message += f"\n   {path}  ({name})"
+        return message
+
+
+def sniff_filetypes(directory, walk_options={}, report_options={}, threads=16, max_mismatches=100,
+                    physical_order=False):
+    """Like list_filetypes, but by the magic number in the first bytes of every file instead of the extension."""
+    start = time.time()
+    with Reporter(os.path.join(directory, "./listfiletypes.rep"), **report_options) as log:
+
+        message = "\n===================== listfiletypes.py =====================\n" \
+                            + "\n     Processing directory: " + directory \
+                            + "\n     Detecting the file types by content\n"
+        log.summary(message)
+
+        census = ContentCensus(directory, max_mismatches)
+        scheduler = PhysicalOrder(filemagic.HEAD_SIZE) if physical_order else None
+        # opening and reading a file is a round trip on network storage, so many heads are read at once
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            chunk = []
+            for entry in treewalker.walk_files(directory, **walk_options):
+                chunk.append(entry)
+                if len(chunk) >= CHUNK_SIZE:
+                    census.process_chunk(chunk, executor, log, scheduler)
+                    chunk = []
+            if chunk:
+                census.process_chunk(chunk, executor, log, scheduler)
+
+        log.summary(census.summary())
+        if scheduler is not None:
+            log.summary(scheduler.summary())
+
+        message = f"\n\n    Script runtime: {round(time.time()-start)} seconds" \
+                            + "\n======================= end of script =======================\n"
+        log.summary(message)
+
+
+def catalog_filetypes(directory, date=None, ext=None, refresh=True, rebuild=False, walk_options={},
+                      report_options={}):
+    """Like list_filetypes, but answered from the catalog of the directory, optionally for a date and extension."""
     start = time.time()
-    log = open(os.path.join(directory, "./listfiletypes.rep"), 'w') 
+    with Reporter(os.path.join(directory, "./listfiletypes.rep"), **report_options) as log:
+
+        message = "\n===================== listfiletypes.py =====================\n" \
+                            + "\n     Processing directory: " + directory \
+                            + "\n     Answering from the catalog: " + os.path.join(directory, CATALOG_FILE) + "\n"
+        if date or ext:
+            message += "     Files" + (f" dated {date}" if date else "") + (f" with extension {ext}" if ext else "") + "\n"
+        log.summary(message)
+
+        catalog = Catalog(os.path.join(directory, CATALOG_FILE), directory, rebuild)
+        if refresh:
+            t = time.perf_counter()
+            checked, listed = catalog.refresh(walk_options.get("threads", treewalker.DEFAULT_THREADS))
+            log.summary(f"     Refreshed the catalog in {(time.perf_counter() - t) * 1000:.0f} ms, "
+                        f"{listed} of {checked} directories changed")
+
+        t = time.perf_counter()
+        counts = catalog.extensions(date, ext)
+        message = f"\n\n  Found {sum(row[1] for row in counts)} files with these extensions:"
+        for ftype, count, size in counts:
+            message = message + f"\n   .......... {ftype}: {count} ({size} bytes)"
+        message += f"\n\n  Query time: {(time.perf_counter() - t) * 1000:.1f} ms"
+        if date or ext:
+            for path, size, file_date in catalog.files(date, ext):
+                log.write(f"\n  {file_date or '-':<19}  {path}")
+                log.file(path, "cataloged", size=size, date=file_date)
+        catalog.close()
+        log.summary(message)
+
+        message = f"\n\n    Script runtime: {round(time.time()-start)} seconds" \
+                            + "\n======================= end of script =======================\n"
+        log.summary(message)
+
+
+def sample_filetypes(directory, precision=0.05, time_budget=60.0, sample_entries=200, seed=None, report_options={}):
+    """Like list_filetypes, but estimated from random descents into the tree, see common/treesample.py."""
+    start = time.time()
+    with Reporter(os.path.join(directory, "./listfiletypes.rep"), **report_options) as log:
+
+        message = "\n===================== listfiletypes.py =====================\n" \
+                            + "\n     Processing directory: " + directory \
+                            + f"\n     Estimating from a sample, until ±{precision:.1%} (95% confidence) " \
+                            + f"or {time_budget:g} seconds\n"
+        log.summary(message)
 
+        sampler = TreeSampler(directory, sample_entries, seed)
+        reason = sampler.run(precision, time_budget)
+        files, files_width, size, size_width = sampler.total()
 
-    message = "\n===================== listfiletypes.py =====================\n" \
-                        + "\n     Processing directory: " + directory +"\n"
-    log.write(message)
-    print(message)
+        message = f"\n\n  Script finished ({reason}) after {sampler.probes} probes, {len(sampler.listed)} directories listed" \
+                            + f" and {sampler.stats} files and directories stat'ed." \
+                            + f"\n  Estimated {files:.0f} ± {files_width:.0f} files and {size:.0f} ± {size_width:.0f} bytes" \
+                            + " (95% confidence), per extension:"
+        for ftype, (count, count_width, ext_bytes, bytes_width) in sampler.estimates().items():
+            message = message + f"\n   .......... {ftype}: {count:.0f} ± {count_width:.0f} " \
+                                + f"({ext_bytes:.0f} ± {bytes_width:.0f} bytes)"
+            log.file(ftype, "estimated", files=round(count), files_ci=round(count_width), bytes=round(ext_bytes),
+                     bytes_ci=round(bytes_width))
+        log.summary(message)
 
-    ext_dict = {}
-    i = 0
+        message = f"\n\n    Script runtime: {round(time.time()-start)} seconds" \
+                            + "\n======================= end of script =======================\n"
+        log.summary(message)
 
-    for root, _, files in os.walk(directory):
-        for filename in files:
+
+def list_filetypes(directory, walk_options={}, report_options={}):
+
+    start = time.time()
+    with Reporter(os.path.join(directory, "./listfiletypes.rep"), **report_options) as log:
+
+
+        message = "\n===================== listfiletypes.py =====================\n" \
+                            + "\n     Processing directory: " + directory +"\n"
+        log.summary(message)
+
+        ext_dict = {}
+        i = 0
+
+        for entry in treewalker.walk_files(directory, **walk_options):
+            filename = entry.name
             i += 1
+            log.tick()
             try:
                 ext =  os.path.splitext(filename)[1] #os.path.splitext returns a tuple (filename without extension, extension)
             except IndexError: # catches errors that might occur if the filename is empty.
-                print(f"Error, file extension could not be identified of file: {filename}")
+                log.error(f"\nError, file extension could not be identified of file: {filename}", path=entry.path)
                 continue
-            
+        
             if ext in ext_dict:
                 ext_dict [ext] += 1
             else:
                 ext_dict [ext] = 1
 
 
-    message = f"\n\n  Script finished, scanned {i} files and found these extensions:"
-    for ftype in ext_dict:
-        message = message + f"\n   .......... {ftype}: {ext_dict[ftype]}"
+        message = f"\n\n  Script finished, scanned {i} files and found these extensions:"
+        for ftype in ext_dict:
+            message = message + f"\n   .......... {ftype}: {ext_dict[ftype]}"
     
-    log.write(message)
-    print(message)
+        log.summary(message)
 
-    message = f"\n\n    Script runtime: {round(time.time()-start)} seconds" \
-                        + "\n======================= end of script =======================\n"
-    log.write(message)
-    print(message)
-    log.close()
+        message = f"\n\n    Script runtime: {round(time.time()-start)} seconds" \
+                            + "\n======================= end of script =======================\n"
+        log.summary(message)
 
 
 if __name__ == "__main__":
-    if len(sys.argv) != 2:
-        print("Error, provide a targed directory as argument.")
-        sys.exit(1)
+    parser = argparse.ArgumentParser(description="List and count the filetypes in a directory tree.")
+    parser.add_argument("directory", help="targed directory")
+    parser.add_argument("--sniff", action="store_true",
+                        help="detect the real file types from the first bytes of every file instead of the extension")
+    parser.add_argument("--threads", type=int, default=16, help="number of threads reading file heads with --sniff")
+    parser.add_argument("--physical-order", action="store_true",
+                        help="with --sniff, read the heads of every chunk in the order of the files on disk, on "
+                             "spinning disks (other disks keep the walk order)")
+    parser.add_argument("--mismatches", type=int, default=100,
+                        help="number of mismatched files listed by name with --sniff (all are counted)")
+    parser.add_argument("--sample", action="store_true",
+                        help="estimate the counts and bytes per extension from random descents instead of a full walk")
+    parser.add_argument("--precision", type=float, default=0.05,
+                        help="with --sample, stop once the totals are known within this fraction (95%% confidence)")
+    parser.add_argument("--time-budget", type=float, default=60.0, help="with --sample, stop after this many seconds")
+    parser.add_argument("--sample-entries", type=int, default=200,
+                        help="with --sample, files stat'ed per directory, larger directories are sampled")
+    parser.add_argument("--seed", type=int, help="with --sample, seed of the random descents (repeatable estimates)")
+    parser.add_argument("--catalog", action="store_true",
+                        help=f"answer from the catalog ({CATALOG_FILE} in the directory), refreshed by directory mtimes")
+    parser.add_argument("--date", help="with --catalog, only the files of a date, eg. 2019 or 2021/07 (listed in the report)")
+    parser.add_argument("--ext", help="with --catalog, only the files with this extension, eg. .heic (listed in the report)")
+    parser.add_argument("--no-refresh", action="store_true", help="with --catalog, answer without checking the tree")
+    parser.add_argument("--rebuild-catalog", action="store_true",
+                        help="with --catalog, list every directory again (also picks up files rewritten in place)")
+    treewalker.add_walk_arguments(parser)
+    add_report_arguments(parser)
+    instrument.add_instrument_arguments(parser)
+    args = parser.parse_args()
+    instrument.start_run(args)
+
+    if not os.path.isdir(args.directory):
+        print(f"Error, '{args.directory}' is not a valid directory. Exiting...")
+        sys.exit(2)
+    elif args.sample:
+        sample_filetypes(args.directory, args.precision, args.time_budget, args.sample_entries, args.seed,
+                         report_options(args))
+    elif args.catalog:
+        catalog_filetypes(args.directory, args.date, args.ext, not args.no_refresh, args.rebuild_catalog,
+                          treewalker.walk_options(args), report_options(args))
+    elif args.sniff:
+        sniff_filetypes(args.directory, treewalker.walk_options(args), report_options(args), args.threads,
+                        args.mismatches, args.physical_order)
     else:
-        target_directory = sys.argv[1]
-        if not os.path.isdir(target_directory):
-            print(f"Error, '{target_directory}' is not a valid directory. Exiting...")
-            sys.exit(2)
-        else:
-            list_filetypes(target_directory)
\ No newline at end of file
+        list_filetypes(args.directory, treewalker.walk_options(args), report_options(args))
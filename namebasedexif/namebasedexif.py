@@ -5,171 +5,376 @@ based on the first 14 characters of their filenames. (thanks Gemini for the init
 """
 
 import os
-import datetime
 import time
-import platform
 import sys
-import subprocess
-import json
-import re
+import argparse
+import multiprocessing.util
 
-def modify_creation_date(directory):
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "common"))
+import treewalker
+import filenamedate
+from exiftoolpool import ExifToolPool, ExifToolError, default_exiftool_path
+from metacache import MetadataCache, file_stat
+from physorder import PhysicalOrder
+import exifreader
+import mp4reader
+import instrument
+from reporter import Reporter, BufferedLog, add_report_arguments, report_options
+from shards import ShardEntry, add_worker_arguments, walk_shards, run_shards, interrupted_summary, failed_summary
 
-    start = time.time()
-    log = open(os.path.join(directory, "./namebasedexif.rep"), 'w') 
+CACHE_FILE = "namebasedexif.cache"
+_worker = {}        # the exiftool pool and cache of a worker process
+
+
+def read_fast_metadata(filepath):
+    """Read the date tags in-process, returns None when exiftool is needed for this file."""
+    t = instrument.start()
+    metadata = None
+    try:
+        with open(filepath, "rb") as f:
+            head = f.read(12)
+            if exifreader.is_exif_container(head):
+                metadata = exifreader.read_exif_dates(f)
+            elif mp4reader.is_mp4(head):
+                metadata = mp4reader.read_mp4_dates(f)
+    except OSError:
+        pass        # let exiftool report the problem
+    instrument.stop("metadata.read", t)
+    return metadata
 
-    message = "\n===================== namebasedexif.py  version 1.0 =====================\n" \
-                        + "\n     Processing directory: " + directory +"\n"
-    log.write(message)
-    print(message)
 
-    for root, _, files in os.walk(directory):
-        for filename in files:
-            f=re.sub("[^\d]", "", filename) + " "     # strip all non-numeric characters to account for all sorts of weird date/time representations, add extra character for slicing
-            message = f"\n\n  » processing file: {filename}\n"
-            log.write(message)
-            print(message)
+def resolve_date(filename, metadata, log):
+    """Decide which date to write for one file, returns (exif date string, source) or None to skip."""
+    f = filenamedate.normalize(filename, filenamedate.DIGITS)     # strip all non-numeric characters to account for all sorts of weird date/time representations
+
+    #### OPTION 1: EXTRACT DATES FROM METADATA
+    creation_date = metadata.get("CreateDate")
+    modification_date = metadata.get("ModifyDate")
+    quicktime_create_date = metadata.get("QuickTime:CreateDate")
+    quicktime_modify_date = metadata.get("QuickTime:ModifyDate")
+
+    if creation_date!=None:
+        use_date = creation_date
+        source = "CreateDate"
+    elif modification_date!=None:
+        use_date = modification_date
+        source = "ModifyDate"
+    elif quicktime_create_date!=None:
+        use_date = quicktime_create_date
+        source = "QuickTime:CreateDate"
+    elif quicktime_modify_date!=None:
+        use_date = quicktime_modify_date
+        source = "QuickTime:ModifyDate"
+    else:
+        use_date = None
 
-            filepath = os.path.join(root, filename)
+    if use_date!=None:
+        year = use_date[:4]
+        if len(f) >= 4 and year.isdecimal() and int(year) > int(f[:4]):      # some files have aquired false metadata tags
+            log.write("     ...inconsistency: date in filename is older then metadata date, manual intervention required.")
+            return None
+        month = use_date[5:7]
+        day = use_date[8:10]
+        hour = use_date[11:13]
+        minute = use_date[14:16]
+        second = use_date[17:19]
+
+    else:   #  OPTION 2: EXTRACT DATES FROM FILENAME
+        source = "Filename"
+        t = instrument.start()
+        fields = filenamedate.parse_name(filename, filenamedate.DIGITS)
+        instrument.stop("filename.parse", t)
+        if fields is None:   # no valid year found -> no mutations to the file
+            log.write("     ...no valid dates found, skipping file.\n")
+            return None
+        year, month, day, hour, minute, second = fields
+
+    try:
+        exif_date_string = f"{int(year):04d}:{int(month):02d}:{int(day):02d} {int(hour):02d}:{int(minute):02d}:{int(second):02d}"
+    except ValueError:
+        log.write(f"     ...exception: unreadable metadata date {use_date}, skipping file.\n")
+        return None
+    return exif_date_string, source
+
+
+def read_metadata(paths, pool, log, scheduler=None):
+    """
+    Returns {path: metadata} for a batch of files, in-process where possible, else in one exiftool call.
+    With a PhysicalOrder scheduler the files are read in their order on disk.
+    """
+    metadata = {}
+    slow_paths = []
+    if scheduler is not None:
+        paths = scheduler.order(paths)
+    for filepath in paths:
+        fast = read_fast_metadata(filepath)
+        if fast is None:
+            slow_paths.append(filepath)
+        else:
+            metadata[filepath] = fast
 
-            #### OPTION 1: EXTRACT DATES FROM METADATA
+    if slow_paths:
+        try:
+            slow_metadata, errors = pool.read_metadata(slow_paths)
+        except (ExifToolError, ValueError) as e:
+            log.error(f"     ...exception: an error occurred while attemting to read metadata: {e}\n")
+            slow_metadata, errors = {}, []
+        metadata.update(slow_metadata)
+        for error in errors:
+            log.error(f"\n     ...exiftool: {error}\n")
+    return metadata
+
+
+def apply_dates(paths, metadata, pool, log, write_mode="auto"):
+    """Resolve and write the new dates of a batch of files, returns {path: date string} of the files written."""
+    written = {}
+    jobs = []
+    sources = {}
+    for filepath in paths:
+        filename = os.path.basename(filepath)
+        message = f"\n\n  » processing file: {filename}\n"
+
+        if filepath not in metadata:
+            log.error(message + "     ...exception: an error occurred while attemting to read metadata: no metadata returned\n",
+                      path=filepath)
+            log.file(filepath, "failed")
+            continue        # assuming reading, and thus writing, metadata fails on this file
+        log.write(message)
+
+        resolved = resolve_date(filename, metadata[filepath], log)
+        if resolved is None:
+            log.file(filepath, "skipped")
+            continue
+        exif_date_string, source = resolved
+        message = f"     ...using source: {source}\n"  \
+                            + f"     ...use date: {exif_date_string}"
+        log.write(message)
+        if write_mode == "auto":
             try:
-                if platform.system() == "Windows":
-                    exiftool_path = "exiftool.exe"
-                else:
-                    exiftool_path = "exiftool.exe"
-
-                result = subprocess.run([exiftool_path, "-json", filepath], capture_output=True, text=True, check=True)
-                metadata = json.loads(result.stdout)[0]  # ExifTool returns a list of dictionaries
-
-                creation_date = metadata.get("CreateDate")
-                modification_date = metadata.get("ModifyDate")
-                quicktime_create_date = metadata.get("QuickTime:CreateDate")
-                quicktime_modify_date = metadata.get("QuickTime:ModifyDate")
-                file_modify_date = metadata.get("FileModifyDate") #Filesystem modify date
-
-                
-
-                if creation_date!=None:
-                    use_date = creation_date
-                    source = "CreateDate"
-                elif modification_date!=None:
-                    use_date = modification_date
-                    source = "ModifyDate"
-                elif quicktime_create_date!=None:
-                    use_date = quicktime_create_date
-                    source = "QuickTime:CreateDate"
-                elif quicktime_modify_date!=None:
-                    use_date = quicktime_modify_date
-                    source = "QuickTime:ModifyDate"
-                else:
-                    use_date = None
-
-            except Exception as e:
-                message = f"     ...exception: an error occurred while attemting to read metadata: {e}\n"
-                log.write(message)
-                print(message)
-                continue        # assuming reading, and thus writing, metadata fails on this file
-
-            if use_date!=None:
-                year = use_date[:4]
-                if int(year) > int(f[:4]):      # some files have aquired false metadata tags
-                    log.write("     ...inconsistency: date in filename is older then metadata date, manual intervention required.")
-                    continue
-                month = use_date[5:7]
-                day = use_date[8:10]
-                hour = use_date[11:13]
-                minute = use_date[14:16]
-                second = use_date[17:19]
-
-            else:   #  OPTION 2: EXTRACT DATES FROM FILENAME
-                source = "Filename"
-                
-                year = 0
-                month = 1
-                day = 1
-                hour = 0
-                minute = 0
-                second = 0
-
-                if len(f) > 4:      # year
-                    tmp = f[:4]
-                    if tmp.isdigit():
-                        tmp = int(tmp)
-                        if tmp <= datetime.date.today().year:
-                            year = tmp
-
-                if year == 0:   # no valid year found -> no mutations to the file
-                    log.write("     ...no valid dates found, skipping file.\n")
+                t = instrument.start()
+                patched = exifreader.patch_exif_dates(filepath, exif_date_string)
+                instrument.stop("metadata.write", t)
+                if patched:
+                    log.write("\n     ...dates patched in place")
+                    log.file(filepath, "written", date=exif_date_string, source=source, method="patch")
+                    written[filepath] = exif_date_string
                     continue
+            except OSError as e:
+                log.write(f"\n     ...in place patching failed, falling back to exiftool: {e}")
+        jobs.append((filepath, exif_date_string))
+        sources[filepath] = source
 
-                if len(f) > 6:      # month
-                    tmp = f[4:6]
-                    if tmp.isdigit():
-                        tmp = int(tmp)
-                        if tmp >= 1 and tmp <= 12:
-                            month = tmp
-                if len(f) > 8:      # day
-                    tmp = f[6:8]
-                    if tmp.isdigit():
-                        tmp = int(tmp)
-                        if tmp >= 1 and tmp <= 31:
-                            day = tmp
-                if len(f) > 10:      # hour
-                    tmp = f[8:10]
-                    if tmp.isdigit():
-                        tmp = int(tmp)
-                        if tmp >= 0 and tmp <= 23:
-                            hour = tmp
-                if len(f) > 12:      # minute
-                    tmp = f[10:12]
-                    if tmp.isdigit():
-                        tmp = int(tmp)
-                        if tmp >= 0 and tmp <= 59:
-                            minute = tmp
-                if len(f) > 14:      # seconds
-                    tmp = f[12:14]
-                    if tmp.isdigit():
-                        tmp = int(tmp)
-                        if tmp >= 0 and tmp <= 59:
-                            second = tmp
-
-
-            exif_date_string = f"{year}:{month}:{day} {hour}:{minute}:{second}"
-            message = f"     ...using source: {source}\n"  \
-                                + f"     ...use date: {exif_date_string}"
-            log.write(message)
-        
-            try:
-                subprocess.run([exiftool_path,
-                                f"-ModifyDate={exif_date_string}",
-                                f"-DateTimeOriginal={exif_date_string}",
-                                f"-DateTimeDigitized={exif_date_string}",
-                                "-overwrite_original",
-                                filepath], check=True)
-            except Exception as e:
-                log.write(f"     ...exeption, failed to write metadata: {e}")
+    if not jobs:
+        return written
+    try:
+        results = pool.write_dates(jobs)
+    except ExifToolError as e:
+        log.error(f"\n     ...exeption, failed to write metadata: {e}")
+        for filepath, _ in jobs:
+            log.file(filepath, "failed")
+        return written
+    dates = dict(jobs)
+    for filepath, ok, message in results:
+        if ok:
+            written[filepath] = dates[filepath]
+            log.file(filepath, "written", date=dates[filepath], source=sources[filepath], method="exiftool")
+        else:
+            log.error(f"\n     ...exeption, failed to write metadata of {os.path.basename(filepath)}: {message}",
+                      path=filepath)
+            log.file(filepath, "failed")
+    return written
+
+
+def process_batch(batch, pool, log, write_mode="auto", cache=None, scheduler=None):
+    """Read the metadata of a batch of file entries in one go, then write the new dates in one go."""
+    if cache is None:
+        paths = [entry.path for entry in batch]
+        apply_dates(paths, read_metadata(paths, pool, log, scheduler), pool, log, write_mode)
+        return
+
+    paths = []
+    metadata = {}
+    to_read = {}
+    stats = {}      # path -> stat result with the identity the cache is keyed on
+    for entry in batch:
+        try:
+            stats[entry.path] = file_stat(entry)
+            cached = cache.lookup(stats[entry.path], entry.name)
+        except OSError as e:        # gone (or unreadable) since the walk
+            log.error(f"\n\n  » processing file: {entry.name}\n     ...exception: {e}\n", path=entry.path)
+            log.file(entry.path, "failed")
+            continue
+        if cached is None:
+            to_read[entry.path] = entry
+        else:
+            fields, written = cached
+            if written is not None:
+                log.write(f"\n\n  » processing file: {entry.name}\n"
+                          + "     ...unchanged since its dates were written on a previous run, skipping file.\n")
+                log.file(entry.path, "unchanged")
                 continue
+            metadata[entry.path] = fields
+        paths.append(entry.path)
+
+    if to_read:
+        read = read_metadata(list(to_read), pool, log, scheduler)
+        for path, fields in read.items():
+            cache.store(stats[path], to_read[path].name, fields)
+        metadata.update(read)
+
+    names = {entry.path: entry.name for entry in batch}
+    for path, date in apply_dates(paths, metadata, pool, log, write_mode).items():
+        try:
+            cache.record_write(stats[path], os.stat(path), names[path], date)
+        except OSError:
+            pass
+    cache.commit()
+
+
+def _init_worker(exiftool_path, sessions, batch_size, cache_path, physical_order=False):
+    pool = ExifToolPool(exiftool_path, sessions=sessions, batch_size=batch_size)
+    # run when the worker process exits, so the exiftool processes are closed and the cache counters saved
+    multiprocessing.util.Finalize(pool, pool.close, exitpriority=10)
+    _worker["pool"] = pool
+    _worker["batch"] = batch_size * sessions
+    _worker["cache"] = None
+    _worker["scheduler"] = PhysicalOrder() if physical_order else None
+    if cache_path:
+        cache = MetadataCache(cache_path, timeout=60)
+        multiprocessing.util.Finalize(cache, cache.close, exitpriority=10)
+        _worker["cache"] = cache
+
 
+def process_shard(directory, names, write_mode, report_options):
+    """Process the files of one shard in a worker process, returns the result of its BufferedLog."""
+    log = BufferedLog(**report_options)
+    pool = _worker["pool"]
+    cache = _worker["cache"]
+    scheduler = _worker["scheduler"]
+    hits, misses = (cache.hits, cache.misses) if cache is not None else (0, 0)
+    by_extent, by_inode, unordered = (scheduler.by_extent, scheduler.by_inode, scheduler.unordered) \
+        if scheduler is not None else (0, 0, 0)
+    entries = [ShardEntry(directory, name) for name in names]
+    for i in range(0, len(entries), _worker["batch"]):
+        batch = entries[i:i + _worker["batch"]]
+        process_batch(batch, pool, log, write_mode, cache, scheduler)
+        log.tick(len(batch))
+    extra = {}
+    if cache is not None:
+        extra = {"cache hits": cache.hits - hits, "cache misses": cache.misses - misses}
+    if scheduler is not None:
+        extra.update({"by extent": scheduler.by_extent - by_extent, "by inode": scheduler.by_inode - by_inode,
+                      "unordered": scheduler.unordered - unordered})
+    return log.result(extra)
 
-    message = f"\n\n    Script runtime: {round(time.time()-start)} seconds" \
-                        + "\n======================= end of script =======================\n"
-    log.write(message)
-    print(message)
-    log.close()
+
+def totals_summary(statuses, extra={}):
+    """The totals of a run from the file statuses (of the Reporter, or of the merged shards with their counters)."""
+    message = f"\n\n  Script finished, processed {sum(statuses.values())} files:" \
+                        + f"\n   .......... dates written: {statuses.get('written', 0)}" \
+                        + f"\n   .......... unchanged since a previous run: {statuses.get('unchanged', 0)}" \
+                        + f"\n   .......... no date found: {statuses.get('skipped', 0)}" \
+                        + f"\n   .......... failed: {statuses.get('failed', 0)}"
+    if "cache hits" in extra:
+        hits = extra["cache hits"]
+        misses = extra["cache misses"]
+        rate = 100 * hits / (hits + misses) if hits + misses else 0
+        message += f"\n\n     cache lookups: {hits + misses}, hits: {hits}, misses: {misses}, hit rate: {rate:.1f}%"
+    if "by extent" in extra:
+        message += f"\n     physical order: {extra['by extent']} files by first extent, " \
+                   f"{extra['by inode']} by inode number, {extra['unordered']} not on a spinning disk (walk order)"
+    return message
+
+
+def modify_creation_date(directory, exiftool_path=None, sessions=2, batch_size=100, write_mode="auto", walk_options={},
+                         cache_path=None, rebuild_cache=False, report_options={}, workers=0, physical_order=False):
+
+    start = time.time()
+    # closed even when the run fails halfway, so the report written so far is not lost
+    with Reporter(os.path.join(directory, "./namebasedexif.rep"), **report_options) as log:
+
+        message = "\n===================== namebasedexif.py  version 1.0 =====================\n" \
+                            + "\n     Processing directory: " + directory +"\n"
+        log.summary(message)
+
+        if workers:
+            if cache_path and rebuild_cache:
+                MetadataCache(cache_path, rebuild_cache).close()
+            run = run_shards(walk_shards(directory, walk_options), process_shard, (write_mode, report_options), log,
+                             workers, walk_options.get("ordered", False), _init_worker,
+                             (exiftool_path, sessions, batch_size, cache_path, physical_order))
+            if run.interrupted:
+                log.summary(interrupted_summary(run))
+            if run.failed:
+                log.summary(failed_summary(run))
+            log.summary(totals_summary(run.statuses, run.extra))
+        else:
+            cache = MetadataCache(cache_path, rebuild_cache) if cache_path else None
+            scheduler = PhysicalOrder() if physical_order else None
+            with ExifToolPool(exiftool_path, sessions=sessions, batch_size=batch_size) as pool:
+                batch = []
+                # with a cache the stat results are needed for every file, let the walker threads fetch them
+                for entry in treewalker.walk_files(directory, stat=cache is not None, **walk_options):
+                    batch.append(entry)
+                    if len(batch) >= batch_size * sessions:     # enough work to keep every session busy
+                        process_batch(batch, pool, log, write_mode, cache, scheduler)
+                        log.tick(len(batch))
+                        batch = []
+                if batch:
+                    process_batch(batch, pool, log, write_mode, cache, scheduler)
+                    log.tick(len(batch))
+
+            log.summary(totals_summary(log.statuses))
+            if cache is not None:
+                log.summary("\n\n" + cache.run_summary())
+                cache.close()
+            if scheduler is not None:
+                log.summary(scheduler.summary())
+
+
+        message = f"\n\n    Script runtime: {round(time.time()-start)} seconds" \
+                            + "\n======================= end of script =======================\n"
+        log.summary(message)
 
 
 if __name__ == "__main__":
-    if len(sys.argv) != 2:
-        print("Error, provide a targed directory as argument.")
-        sys.exit(1)
-    else:
-        target_directory = sys.argv[1]
-        if not os.path.isdir(target_directory):
-            print(f"Error, '{target_directory}' is not a valid directory. Exiting...")
+    parser = argparse.ArgumentParser(description="Set the metadata dates of files from their metadata or filename.")
+    parser.add_argument("directory", help="targed directory")
+    parser.add_argument("--exiftool", default=default_exiftool_path(), help="path of the exiftool executable")
+    parser.add_argument("--sessions", type=int, default=2,
+                        help="number of exiftool processes kept open (per worker with --workers)")
+    parser.add_argument("--batch-size", type=int, default=100, help="number of files per exiftool command")
+    parser.add_argument("--write-mode", choices=["auto", "exiftool"], default="auto",
+                        help="auto: overwrite existing EXIF date entries in place when possible, exiftool: always let exiftool rewrite the file")
+    parser.add_argument("--cache", help="metadata cache file (default: namebasedexif.cache in the targed directory)")
+    parser.add_argument("--no-cache", action="store_true", help="do not use a metadata cache")
+    parser.add_argument("--rebuild", action="store_true", help="empty the metadata cache before the run")
+    parser.add_argument("--stats", action="store_true", help="only report the statistics of the metadata cache")
+    add_worker_arguments(parser, "reading and writing metadata")
+    parser.add_argument("--physical-order", action="store_true",
+                        help="read the metadata of every batch in the order of the files on disk, on spinning "
+                             "disks (other disks keep the walk order)")
+    treewalker.add_walk_arguments(parser)
+    add_report_arguments(parser)
+    instrument.add_instrument_arguments(parser)
+    args = parser.parse_args()
+    instrument.start_run(args)
+
+    if not os.path.isdir(args.directory):
+        print(f"Error, '{args.directory}' is not a valid directory. Exiting...")
+        sys.exit(2)
+    cache_path = None if args.no_cache else args.cache or os.path.join(args.directory, CACHE_FILE)
+    if args.stats:
+        if cache_path is None or not os.path.isfile(cache_path):
+            print("Error, there is no metadata cache to report on.")
             sys.exit(2)
-        else:
-            modify_creation_date(target_directory)
+        cache = MetadataCache(cache_path)
+        print(cache.summary())
+        cache.db.close()
+    else:
+        modify_creation_date(args.directory, args.exiftool, args.sessions, args.batch_size, args.write_mode,
+                             treewalker.walk_options(args), cache_path, args.rebuild, report_options(args),
+                             args.workers, args.physical_order)
 
 
 
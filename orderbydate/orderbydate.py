@@ -4,19 +4,380 @@ Script to order files with dates in their names (yyyymm...) into subsequent dire
 
 import os
 import sys
-import shutil
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "common"))
+import treewalker
+import instrument
+from moveengine import MoveEngine
+from journal import Journal, read_journal
+from duplicates import HashIndex, find_duplicate_groups, originals
+from reporter import Reporter, add_report_arguments, report_options
+from catalog import Catalog, CATALOG_FILE
+
+JOURNAL_FILE = "orderbydate.journal"
+STAGING_METHODS = ("link", "symlink", "reflink")
+HASH_INDEX_FILE = "orderbydate.hashes"
+
+
+def destination_dir(fname, ddir, edir, vy_start, vy_end, log):
+    """Returns the directory a file belongs in and whether it is "full"y, "part"ially or not ("except") dated."""
+    fyear = fname[:4]
+    fmonth = fname[4:6]
+    if fyear.isdigit():
+        if int(fyear) >= int(vy_start) and int(fyear)<=int(vy_end):
+            movedir = os.path.join(ddir, fyear)
+            if fmonth.isdigit() and int(fmonth) > 0 and int(fmonth) < 13:
+                return os.path.join(movedir, fmonth), "full"
+            log.write(f"  Invalid month for file: {fname}\n")
+            return movedir, "part"
+        log.write(f"  File year is outside of selected valid range: {fname}\n")
+    return edir, "except"
+
+
+def report_moves(results, log, counts, journal=None, journal_op="done", catalog=None):
+    """
+    Write the finished moves of the move engine to the log (and journal and catalog), counts renames,
+    copies and failures.
+    """
+    for movefile, destination, method, error in results:
+        if error is None:
+            counts[method] = counts.get(method, 0) + 1
+            message = "File [" + movefile + "] moved to " + os.path.dirname(destination)
+            log.write(message + '\n\n')  # Write the logmessage
+            if journal is not None:
+                journal.write(journal_op, src=os.path.abspath(movefile), dst=os.path.abspath(destination),
+                              method=method)
+            if catalog is not None:
+                catalog.record(destination)
+            log.file(movefile, method, destination=destination)
+        else:
+            counts["failed"] += 1
+            log.error(f"Error moving '{movefile}': {error}" + '\n\n', path=movefile)
+            log.file(movefile, "failed", destination=destination)
+
+
+def unique_name(name, taken):
+    """First of name_1.ext, name_2.ext, ... that is not in taken."""
+    stem, ext = os.path.splitext(name)
+    i = 1
+    while f"{stem}_{i}{ext}" in taken:
+        i += 1
+    return f"{stem}_{i}{ext}"
+
+
+def plan_moves(sdir, ddir, edir, vy_start, vy_end, log, on_collision="skip", walk_options={},
+               dedupe=None, index=None, hash_workers=4, staged=None):
+    """
+    Walk sdir once and decide where every file goes, without moving anything.
+    Returns (plan, kinds, collisions): plan is a list of (destination, source, size, st_dev) sorted by
+    destination so the moves of one directory are done together, kinds counts the fully/partially/not
+    dated and the duplicate files, collisions lists (source, destination, reason) of the files that
+    will not be moved. With dedupe "skip" or "exceptions", files identical to another source file or
+    to a file in the hash index of the destination are left alone or sent to the exceptions directory.
+    staged maps the (absolute) sources an earlier staging run linked to their destination, those are
+    skipped while their destination exists and counted as "staged".
+    """
+    kinds = {"full": 0, "part": 0, "except": 0, "duplicate": 0, "staged": 0}
+    ops = []
+    for entry in treewalker.walk_files(sdir, stat=True, **walk_options):
+        if staged:
+            destination = staged.get(os.path.abspath(entry.path))
+            if destination is not None and os.path.lexists(destination):
+                kinds["staged"] += 1
+                continue
+        t = instrument.start()
+        movedir, kind = destination_dir(entry.name, ddir, edir, vy_start, vy_end, log)
+        instrument.stop("filename.parse", t)
+        kinds[kind] += 1
+        st = entry.stat()
+        ops.append((os.path.join(movedir, entry.name), entry.path, st.st_size, st.st_dev))
+    ops.sort()
+
+    duplicates = {}
+    if dedupe:
+        groups = find_duplicate_groups([(source, size) for _, source, size, _ in ops], hash_workers, index)
+        duplicates = originals(groups)
+        kinds["duplicate"] = len(duplicates)
+
+    plan = []
+    collisions = []
+    existing = {}   # destination directory -> names already in it, listed once per directory
+    planned = {}    # destination directory -> names the plan puts in it
+    for destination, source, size, dev in ops:
+        if source in duplicates:
+            if dedupe == "skip":
+                collisions.append((source, duplicates[source], "duplicate of"))
+                continue
+            log.write(f"  Duplicate of {duplicates[source]}, {source} goes to the exceptions directory\n")
+            destination = os.path.join(edir, os.path.basename(source))
+        movedir, name = os.path.split(destination)
+        if movedir not in existing:
+            try:
+                existing[movedir] = set(os.listdir(movedir))
+            except OSError:
+                existing[movedir] = set()
+            planned[movedir] = set()
+        if os.path.abspath(source) == os.path.abspath(destination):
+            continue        # already in place
+        if name in existing[movedir] or name in planned[movedir]:
+            reason = "exists in the destination" if name in existing[movedir] else "duplicate name in the source"
+            if on_collision != "rename":
+                collisions.append((source, destination, reason))
+                continue
+            name = unique_name(name, existing[movedir] | planned[movedir])
+            destination = os.path.join(movedir, name)
+            log.write(f"  Name collision ({reason}), {source} will be moved as {name}\n")
+        planned[movedir].add(name)
+        plan.append((destination, source, size, dev))
+    if dedupe == "exceptions":
+        plan.sort()
+    return plan, kinds, collisions
+
+
+class _SourceStat:
+    """The two stat fields the move engine needs, kept for every planned move instead of a full stat result."""
+    __slots__ = ("st_size", "st_dev")
+
+    def __init__(self, size, dev):
+        self.st_size = size
+        self.st_dev = dev
+
+
+def execute_plan(plan, engine, log, counts, journal, catalog=None):
+    for destination, source, size, dev in plan:
+        engine.move(source, destination, _SourceStat(size, dev))
+        report_moves(engine.completed(), log, counts, journal, catalog=catalog)
+        log.tick()
+    report_moves(engine.finish(), log, counts, journal, catalog=catalog)
+
+
+def journal_state(path):
+    """
+    Returns (planned moves in order, set of moves done and not undone, finished flag, mode) of the last run
+    in a journal, mode is "move" or the staging mode of the run.
+    """
+    planned = []
+    done = set()
+    finished = False
+    mode = "move"
+    for record in read_journal(path):
+        op = record.get("op")
+        if op == "run":     # every run appends to the journal, only the last one counts
+            planned = []
+            done = set()
+            finished = False
+            mode = record.get("mode", "move")
+        elif op == "plan":
+            planned.append((record["src"], record["dst"]))
+        elif op == "done":
+            done.add((record["src"], record["dst"]))
+        elif op == "undone":
+            done.discard((record["dst"], record["src"]))
+        elif op == "finished":
+            finished = True
+    return planned, done, finished, mode
+
+
+def staged_files(path):
+    """{source: destination} of every file the runs in a journal staged and did not undo, both absolute."""
+    staged = {}
+    mode = "move"
+    for record in read_journal(path):
+        op = record.get("op")
+        if op == "run":
+            mode = record.get("mode", "move")
+        elif op == "done" and mode != "move":
+            staged[record["src"]] = record["dst"]
+        elif op == "undone":
+            if staged.get(record["dst"]) == record["src"]:
+                del staged[record["dst"]]
+    return staged
+
+
+def is_staged(source, destination, mode):
+    """True if destination is what a staging run made of source, and not some other file that took its name."""
+    try:
+        if mode == "symlink":
+            return os.readlink(destination) == os.path.abspath(source)
+        src_st = os.stat(source)
+        dst_st = os.lstat(destination)
+    except OSError:
+        return False
+    if mode == "link":
+        return os.path.samestat(src_st, dst_st)
+    # a clone or copy carries the size and modification time of its source
+    return dst_st.st_size == src_st.st_size and dst_st.st_mtime_ns == src_st.st_mtime_ns
+
+
+def report_collision(log, counts, source, destination):
+    """A resume or undo finds another file at the target of a move, it is left alone and reported."""
+    counts["collision"] += 1
+    log.error(f"  Name collision (exists in the destination), not moved: {source} -> {destination}\n", path=source)
+    log.file(source, "collision", destination=destination, reason="exists in the destination")
+
+
+def resume_journal(path, args):
+    """Execute the planned moves of an interrupted run that are not done yet."""
+    planned, done, _, mode = journal_state(path)
+    counts = {"rename": 0, "copy": 0, "collision": 0, "failed": 0}
+    already = 0
+    with Reporter(os.path.join(os.path.dirname(path), "./orderbydate.rep"), append=True, total=len(planned),
+                  **report_options(args)) as f, \
+            MoveEngine(args.copy_workers, args.inflight_mb * 1024 * 1024, mode, args.reflink_copy) as engine:
+        journal = Journal(path)
+        f.summary(f"\n\n=================== orderbydate.py resume of {path} ===================\n\n")
+        for source, destination in planned:
+            if (source, destination) in done:
+                f.tick()
+                continue
+            if os.path.lexists(destination):
+                if is_staged(source, destination, mode) if mode != "move" else not os.path.lexists(source):
+                    # moved (or staged) just before the crash, the journal line did not make it to disk
+                    journal.write("done", src=source, dst=destination, method="unknown")
+                    already += 1
+                else:
+                    report_collision(f, counts, source, destination)
+                f.tick()
+                continue
+            engine.move(source, destination)
+            report_moves(engine.completed(), f, counts, journal)
+            f.tick()
+        report_moves(engine.finish(), f, counts, journal)
+        journal.write("finished")
+        journal.close()
+        footer = "\n  Resumed run, planned moves:  " + str(len(planned)) \
+            + "\n  ...done before the resume:  " + str(len(done) + already) \
+            + method_counts(counts, mode) \
+            + "\n  ...not moved (name collisions):  " + str(counts["collision"]) \
+            + "\n  ...failed:  " + str(counts["failed"]) \
+            + "\n======================================================"
+        f.summary('\n\n\n' + footer)
+
+
+def method_counts(counts, mode):
+    """Report lines of the files moved per method, or staged per method in a staging mode."""
+    if mode == "move":
+        return "\n  ...renamed on the same device:  " + str(counts["rename"]) \
+            + "\n  ...copied across devices:  " + str(counts["copy"])
+    lines = {"link": "hard linked", "symlink": "symbolically linked", "reflink": "cloned (reflink)",
+             "copy": "copied, the filesystem cannot clone (--reflink-copy)"}
+    return "".join(f"\n  ...{lines[method]}:  {counts.get(method, 0)}"
+                   for method in (mode, "copy") if method == mode or counts.get(method))
+
+
+def undo_journal(path, args):
+    """
+    Move every file a journaled run moved back to where it came from, newest first. Files a staging run
+    linked are removed from the destination, or moved back where their source is gone meanwhile.
+    """
+    planned, done, _, mode = journal_state(path)
+    moves = [op for op in planned if op in done]
+    counts = {"rename": 0, "copy": 0, "removed": 0, "collision": 0, "failed": 0}
+    with Reporter(os.path.join(os.path.dirname(path), "./orderbydate.rep"), append=True, total=len(moves),
+                  **report_options(args)) as f, \
+            MoveEngine(args.copy_workers, args.inflight_mb * 1024 * 1024) as engine:
+        journal = Journal(path)
+        f.summary(f"\n\n=================== orderbydate.py undo of {path} ===================\n\n")
+        for source, destination in reversed(moves):
+            if mode != "move" and os.path.lexists(source):
+                if not is_staged(source, destination, mode):
+                    report_collision(f, counts, destination, source)
+                    f.tick()
+                    continue
+                try:
+                    os.unlink(destination)
+                    counts["removed"] += 1
+                    f.write(f"File [{destination}] removed, its source {source} is still there\n\n")
+                    journal.write("undone", src=destination, dst=source, method="unlink")
+                    f.file(destination, "removed", source=source)
+                except OSError as e:
+                    counts["failed"] += 1
+                    f.error(f"Error removing '{destination}': {e}" + '\n\n', path=destination)
+                    f.file(destination, "failed", source=source)
+            elif os.path.lexists(source):
+                report_collision(f, counts, destination, source)
+            else:
+                engine.move(destination, source)
+            report_moves(engine.completed(), f, counts, journal, "undone")
+            f.tick()
+        report_moves(engine.finish(), f, counts, journal, "undone")
+        journal.close()
+        footer = "\n  Undone moves:  " + str(counts["rename"] + counts["copy"] + counts["removed"]) \
+            + "\n  ...not moved back (name collisions):  " + str(counts["collision"]) \
+            + "\n  ...failed:  " + str(counts["failed"]) \
+            + "\n======================================================"
+        f.summary('\n\n\n' + footer)
+
 
 def main_func (path='/home/user'):
-   
-    if len(sys.argv) != 5:
+
+    parser = argparse.ArgumentParser(description="Order files with dates in their names (yyyymm...) into yyyy/mm directories.")
+    parser.add_argument("sourcedir", nargs="?")
+    parser.add_argument("destinationdir", nargs="?")
+    parser.add_argument("exceptionsdir", nargs="?")
+    parser.add_argument("validyears", nargs="?", help="range of valid years, eg. 1990-2011")
+    parser.add_argument("--copy-workers", type=int, default=4,
+                        help="number of parallel copies when source and destination are on different devices")
+    parser.add_argument("--inflight-mb", type=int, default=256,
+                        help="maximum number of megabytes being copied at the same time")
+    staging = parser.add_mutually_exclusive_group()
+    staging.add_argument("--link", dest="mode", action="store_const", const="link", default="move",
+                         help="leave the sources and hard link them into the destination tree")
+    staging.add_argument("--symlink", dest="mode", action="store_const", const="symlink",
+                         help="leave the sources and put symbolic links to them in the destination tree")
+    staging.add_argument("--reflink", dest="mode", action="store_const", const="reflink",
+                         help="leave the sources and clone them copy-on-write into the destination tree "
+                              "(btrfs, XFS), files the filesystem cannot clone fail")
+    parser.add_argument("--reflink-copy", action="store_true",
+                        help="with --reflink, copy the files the filesystem cannot clone (takes the space twice)")
+    parser.add_argument("--incremental", action="store_true",
+                        help="with --link, --symlink or --reflink, only add the sources the journal does not "
+                             "show as staged yet")
+    parser.add_argument("--plan-only", action="store_true",
+                        help="only report what would be moved and the name collisions, touch nothing")
+    parser.add_argument("--on-collision", choices=["skip", "rename"], default="skip",
+                        help="skip: leave files whose name is taken in the destination, rename: add a _1, _2... suffix")
+    parser.add_argument("--dedupe", choices=["skip", "exceptions"],
+                        help="find files with identical content among the sources and in the destination, "
+                             "skip them or move them to the exceptions directory")
+    parser.add_argument("--no-hash-index", action="store_true",
+                        help=f"with --dedupe only compare the sources with each other, do not keep {HASH_INDEX_FILE} "
+                             "of the destination tree")
+    parser.add_argument("--hash-workers", type=int, default=4, help="number of processes hashing files with --dedupe")
+    parser.add_argument("--catalog", action="store_true",
+                        help=f"keep the catalog of the destination tree ({CATALOG_FILE}, see listfiletypes --catalog) "
+                             "up to date with the moves")
+    parser.add_argument("--journal", help=f"journal file (default: {JOURNAL_FILE} in the destination directory)")
+    parser.add_argument("--resume", metavar="JOURNAL", help="finish the moves of an interrupted run")
+    parser.add_argument("--undo", metavar="JOURNAL", help="move the files of a journaled run back")
+    treewalker.add_walk_arguments(parser)
+    add_report_arguments(parser)
+    instrument.add_instrument_arguments(parser)
+    args = parser.parse_args()
+    instrument.start_run(args)
+
+    for journal_path in (args.resume, args.undo):
+        if journal_path is not None:
+            if not os.path.isfile(journal_path):
+                print("Error, journal does not exist: ", journal_path)
+                sys.exit(2)
+            if args.resume:
+                resume_journal(journal_path, args)
+            else:
+                undo_journal(journal_path, args)
+            return
+
+    if args.validyears is None:
         print("Error, not enough arguments passed. Usage: orderbydate [sourcedir] [destinationdir] [exceptionsdir] [validyears]")
         sys.exit(1)  # Exit with error status 1
 
-    sdir = sys.argv[1]
-    ddir = sys.argv[2]
-    edir = sys.argv[3]
-    vy_start = sys.argv[4][:4]
-    vy_end = sys.argv[4][5:]
+    sdir = args.sourcedir
+    ddir = args.destinationdir
+    edir = args.exceptionsdir
+    vy_start = args.validyears[:4]
+    vy_end = args.validyears[5:]
+    journal_path = args.journal or os.path.join(ddir, JOURNAL_FILE)
 
 # PRECHECKS
     if not os.path.exists(sdir):
@@ -28,9 +389,21 @@ def main_func (path='/home/user'):
     if not os.path.exists(edir):
         print("Error, exceptions folder does not exist: ", edir)
         sys.exit(2)  # Exit with error status 1
-    if len(sys.argv[4])!=9 or not vy_start.isdigit() or not vy_end.isdigit() or vy_end<vy_start:
+    if len(args.validyears)!=9 or not vy_start.isdigit() or not vy_end.isdigit() or vy_end<vy_start:
         print("Error, use correct validyear format (eg. 1990-2011)")
         sys.exit(2)  # Exit with error status 1
+    if args.incremental and args.mode == "move":
+        print("Error, --incremental needs --link, --symlink or --reflink")
+        sys.exit(2)
+    if args.reflink_copy and args.mode != "reflink":
+        print("Error, --reflink-copy needs --reflink")
+        sys.exit(2)
+    staged = staged_files(journal_path) if args.incremental and os.path.isfile(journal_path) else None
+    if not args.plan_only and os.path.isfile(journal_path):
+        planned, done, finished, _ = journal_state(journal_path)
+        if not finished and len(done) < len(planned):
+            print(f"Error, the journal {journal_path} belongs to an unfinished run, use --resume or remove it")
+            sys.exit(2)
 
 
 # LETS GO
@@ -40,64 +413,92 @@ def main_func (path='/home/user'):
         + "\n  Exceptions directory:  " + edir \
         + "\n  Valid years start:  " + vy_start \
         + "\n  Valid years end:  " + vy_end
-    print(header)
-    nfulldated = 0
-    npartdated = 0
-    nexcept = 0
-
-    with open(os.path.join(ddir, "./orderbydate.rep"), 'w') as f:  # Open the file in write mode ('w')
-        f.write(header + '\n\n')  # Write the logmessage
-        for root, _, files in os.walk(sdir):
-            for fname in files:
-                fyear = fname[:4]
-                fmonth = fname[4:6]
-                if fyear.isdigit():
-                    if int(fyear) >= int(vy_start) and int(fyear)<=int(vy_end):
-                        movedir = os.path.join(ddir, fyear)
-                        if fmonth.isdigit() and int(fmonth) > 0 and int(fmonth) < 13:
-                            nfulldated+=1
-                            movedir = os.path.join(movedir, fmonth)
-                        else:
-                            npartdated+=1
-                            f.write(f"  Invalid month for file: {fname}\n")
-                    else:
-                        f.write(f"  File year is outside of selected valid range: {fname}\n")
-                        nexcept+=1
-                        movedir = edir
-                else:
-                    nexcept+=1
-                    movedir = edir
+    if args.mode != "move":
+        header += "\n  Staging mode:  " + args.mode + (", incremental" if args.incremental else "")
 
-                try:
-                    if not os.path.exists(movedir):
-                        os.makedirs(movedir) #create destination if it doesn't exist.
-                except FileNotFoundError:
-                    print(f"Error: Source path '{movedir}' not found.")
-                except PermissionError:
-                    print(f"Error: Permission denied to access '{movedir}'.")
-                except OSError as e:
-                    print(f"An OS error occured: {e}")
+    if args.plan_only:
+        print(header)
+        # a plan writes nothing: the hash index is refreshed and extended in a copy in memory
+        index = None
+        if args.dedupe and not args.no_hash_index:
+            index = HashIndex(os.path.join(ddir, HASH_INDEX_FILE), ddir, readonly=True)
+            index.refresh(treewalker.walk_options(args))
+        with open(os.devnull, 'w') as f:
+            plan, kinds, collisions = plan_moves(sdir, ddir, edir, vy_start, vy_end, f,
+                                                 args.on_collision, treewalker.walk_options(args),
+                                                 args.dedupe, index, args.hash_workers, staged)
+        if index is not None:
+            index.close()
+        footer = "\n  Planned moves:  " + str(len(plan)) \
+            + "\n  ...fully dated:  " + str(kinds["full"]) \
+            + "\n  ...partially dated files:  " + str(kinds["part"]) \
+            + "\n  ...exception files:  " + str(kinds["except"]) \
+            + "\n  ...destination directories:  " + str(len({os.path.dirname(op[0]) for op in plan})) \
+            + "\n  ...duplicates:  " + str(kinds["duplicate"]) \
+            + "\n  ...not moved (name collisions, duplicates):  " + str(len(collisions)) \
+            + ("\n  ...staged by an earlier run:  " + str(kinds["staged"]) if staged is not None else "") \
+            + "\n======================================================"
+        print(footer)
+        return
 
-                try:
-                    movefile=os.path.join(root, fname)
-                    shutil.move(movefile, os.path.join(movedir, fname))
-                    message = "File [" + movefile + "] moved to " + movedir
-                    f.write(message + '\n\n')  # Write the logmessage
-                except shutil.Error as e:
-                    print(f"Error moving '{movefile}': {e}")
-                except PermissionError as e:
-                    print(f"Permissions error moving '{movefile}': {e}")
-                except OSError as e:
-                    print(f"OS error moving '{movefile}': {e}")
+    counts = {"rename": 0, "copy": 0, "failed": 0}
+
+    with Reporter(os.path.join(ddir, "./orderbydate.rep"), **report_options(args)) as f, \
+            MoveEngine(args.copy_workers, args.inflight_mb * 1024 * 1024, args.mode, args.reflink_copy) as engine:
+        f.summary(header + '\n\n')  # Write the logmessage
+        index = None
+        if args.dedupe and not args.no_hash_index:
+            index = HashIndex(os.path.join(ddir, HASH_INDEX_FILE), ddir)
+            index.refresh(treewalker.walk_options(args))
+        plan, kinds, collisions = plan_moves(sdir, ddir, edir, vy_start, vy_end, f,
+                                             args.on_collision, treewalker.walk_options(args),
+                                             args.dedupe, index, args.hash_workers, staged)
+        if index is not None:
+            index.close()
+        f.set_total(len(plan))
+        for source, destination, reason in collisions:
+            if reason == "duplicate of":
+                f.error(f"  Duplicate, not moved: {source} is identical to {destination}\n", path=source)
+                f.file(source, "duplicate", original=destination)
+            else:
+                f.error(f"  Name collision ({reason}), not moved: {source} -> {destination}\n", path=source)
+                f.file(source, "collision", destination=destination, reason=reason)
 
+        catalog = None
+        if args.catalog:
+            # brought up to date before the moves, afterwards it only needs the moved files
+            catalog = Catalog(os.path.join(ddir, CATALOG_FILE), ddir)
+            catalog.refresh(args.walk_threads)
 
-        footer = "\n  Total number of files moved:  " + str(nfulldated+npartdated+nexcept) \
-            + "\n  ...fully dated:  " + str(nfulldated) \
-            + "\n  ...partially dated files:  " + str(npartdated) \
-            + "\n  ...exception files:  " + str(nexcept) \
+        if plan:        # an empty run leaves the journal alone, so --undo still undoes the last real one
+            journal = Journal(journal_path)
+            # absolute paths, so --resume and --undo work from any directory
+            journal.write("run", source=os.path.abspath(sdir), destination=os.path.abspath(ddir),
+                          exceptions=os.path.abspath(edir), validyears=args.validyears, mode=args.mode)
+            for destination, source, _, _ in plan:
+                journal.write("plan", src=os.path.abspath(source), dst=os.path.abspath(destination))
+            journal.sync()      # the whole plan is on disk before the first file moves
+
+            execute_plan(plan, engine, f, counts, journal, catalog)
+            journal.write("finished")
+            journal.close()
+        if catalog is not None:
+            catalog.settle()
+            catalog.close()
+
+        done = sum(counts.get(method, 0) for method in ("rename", "copy") + STAGING_METHODS)
+        footer = "\n  Total number of files " + ("moved" if args.mode == "move" else "staged") + ":  " + str(done) \
+            + "\n  ...fully dated:  " + str(kinds["full"]) \
+            + "\n  ...partially dated files:  " + str(kinds["part"]) \
+            + "\n  ...exception files:  " + str(kinds["except"]) \
+            + method_counts(counts, args.mode) \
+            + "\n  ...duplicates:  " + str(kinds["duplicate"]) \
+            + "\n  ...not moved (name collisions, duplicates):  " + str(len(collisions)) \
+            + ("\n  ...staged by an earlier run:  " + str(kinds["staged"]) if staged is not None else "") \
+            + "\n  ...failed:  " + str(counts["failed"]) \
+            + "\n  Journal:  " + journal_path \
             + "\n======================================================"
-        print(footer)
-        f.write('\n\n\n' + message)  # Write the final logmessage
+        f.summary('\n\n\n' + footer)  # Write the final logmessage
 
 
 if __name__ == "__main__":
@@ -0,0 +1,361 @@
+"""
+Runs the stages of listfiletypes, renamelowercase, namebasedexif, changemodificationdate and orderbydate
+in a single traversal of a directory, instead of walking the same tree once per script.
+Every file is pushed through the configured stages as a small FileRecord, metadata is read once
+and shared by all stages, and everything is written to one combined pipeline.rep.
+
+With --watch the pipeline keeps running and pushes the files that arrive in the directory through the
+stages in micro batches (see common/watcher.py), eg. --watch --stages exif,sort for an upload inbox.
+"""
+
+import os
+import sys
+import time
+import signal
+import argparse
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+for tool in ("common", "listfiletypes", "renamelowercase", "namebasedexif", "changemodificationdate", "orderbydate"):
+    sys.path.insert(0, os.path.join(HERE, "..", tool))
+import treewalker
+import instrument
+import renamelowercase
+import namebasedexif
+import changemodificationdate
+import orderbydate
+from exiftoolpool import ExifToolPool, default_exiftool_path
+from moveengine import MoveEngine
+from reporter import Reporter, add_report_arguments, report_options
+from watcher import TreeWatcher, Debouncer
+
+STAGES = ["census", "lowercase", "exif", "datefix", "sort"]
+BATCH_SIZE = 500
+MAX_WAIT = 1.0      # longest sleep of the watch loop between checks for settled files
+HANDLED_LIMIT = 100_000     # processed files the watch loop remembers, the oldest are forgotten first
+
+
+class FileRecord:
+    """One file travelling through the stages, stat is the walker's cached stat result (None once stale)."""
+    __slots__ = ("path", "name", "stat", "date", "metadata")
+
+    def __init__(self, entry):
+        self.path = entry.path
+        self.name = entry.name
+        self.stat = entry.stat()
+        self.date = None        # exif date string once the exif stage wrote one
+        self.metadata = None    # shared metadata, read at most once
+
+    @classmethod
+    def from_path(cls, path, stat):
+        record = cls.__new__(cls)
+        record.path = path
+        record.name = os.path.basename(path)
+        record.stat = stat
+        record.date = None
+        record.metadata = None
+        return record
+
+    def moved(self, path):
+        self.path = path
+        self.name = os.path.basename(path)
+
+
+class Stage:
+    """A stage processes batches of records in place and reports a summary at the end."""
+    name = ""
+
+    def process(self, records, log):
+        return records
+
+    def summary(self):
+        return ""
+
+    def close(self):
+        pass
+
+
+class CensusStage(Stage):
+    name = "census"
+
+    def __init__(self, args):
+        self.ext_count = {}
+        self.ext_bytes = {}
+        self.files = 0
+
+    def process(self, records, log):
+        for record in records:
+            self.files += 1
+            ext = os.path.splitext(record.name)[1]
+            self.ext_count[ext] = self.ext_count.get(ext, 0) + 1
+            self.ext_bytes[ext] = self.ext_bytes.get(ext, 0) + record.stat.st_size
+        return records
+
+    def summary(self):
+        message = f"\n  census: scanned {self.files} files and found these extensions:"
+        for ext in sorted(self.ext_count):
+            message += f"\n   .......... {ext}: {self.ext_count[ext]} ({self.ext_bytes[ext]} bytes)"
+        return message
+
+
+class LowercaseStage(Stage):
+    name = "lowercase"
+
+    def __init__(self, args):
+        self.renamed = 0
+
+    def process(self, records, log):
+        for record in records:
+            new_path = renamelowercase.rename_file(record.path, log)
+            if new_path != record.path:
+                self.renamed += 1
+                record.moved(new_path)
+        return records
+
+    def summary(self):
+        return f"\n  lowercase: {self.renamed} files renamed"
+
+
+class ExifStage(Stage):
+    name = "exif"
+
+    def __init__(self, args):
+        self.pool = ExifToolPool(args.exiftool, sessions=args.sessions)
+        self.write_mode = args.write_mode
+        self.written = 0
+
+    def process(self, records, log):
+        todo = [record for record in records if record.metadata is None]
+        if todo:
+            metadata = namebasedexif.read_metadata([record.path for record in todo], self.pool, log)
+            for record in todo:
+                record.metadata = metadata.get(record.path)
+        by_path = {record.path: record for record in records}
+        metadata = {record.path: record.metadata for record in records if record.metadata is not None}
+        written = namebasedexif.apply_dates(list(by_path), metadata, self.pool, log, self.write_mode)
+        for path, date in written.items():
+            by_path[path].date = date
+            by_path[path].stat = None       # the write changed the file
+        self.written += len(written)
+        return records
+
+    def summary(self):
+        return f"\n  exif: dates written to {self.written} files"
+
+    def close(self):
+        self.pool.close()
+
+
+class DatefixStage(Stage):
+    name = "datefix"
+
+    def __init__(self, args):
+        self.counts = {"applied": 0, "unchanged": 0, "failed": 0, "skipped": 0}
+
+    def process(self, records, log):
+        for record in records:
+            status = changemodificationdate.process_file(record.path, log, record.stat)
+            if status == "applied":
+                record.stat = None
+            self.counts[status] += 1
+        return records
+
+    def summary(self):
+        return f"\n  datefix: {sum(self.counts.values())} files processed" \
+            + "".join(f"\n  ...{status}:  {count}" for status, count in self.counts.items())
+
+
+class SortStage(Stage):
+    name = "sort"
+
+    def __init__(self, args):
+        self.ddir = args.destination
+        self.edir = args.exceptions
+        self.vy_start = args.valid_years[:4]
+        self.vy_end = args.valid_years[5:]
+        self.counts = {"full": 0, "part": 0, "except": 0}
+        self.moves = {"rename": 0, "copy": 0, "failed": 0}
+        self.engine = MoveEngine(args.copy_workers)
+        self.log = None
+
+    def process(self, records, log):
+        self.log = log
+        for record in records:
+            movedir, kind = orderbydate.destination_dir(record.name, self.ddir, self.edir,
+                                                        self.vy_start, self.vy_end, log)
+            self.counts[kind] += 1
+            self.engine.move(record.path, os.path.join(movedir, record.name), record.stat)
+        orderbydate.report_moves(self.engine.completed(), log, self.moves)
+        return records
+
+    def close(self):
+        if self.log is not None:
+            orderbydate.report_moves(self.engine.finish(), self.log, self.moves)
+
+    def summary(self):
+        return "\n  sort: " + str(sum(self.counts.values())) + " files sorted" \
+            + "\n  ...fully dated:  " + str(self.counts["full"]) \
+            + "\n  ...partially dated files:  " + str(self.counts["part"]) \
+            + "\n  ...exception files:  " + str(self.counts["except"]) \
+            + "\n  ...renamed on the same device:  " + str(self.moves["rename"]) \
+            + "\n  ...copied across devices:  " + str(self.moves["copy"]) \
+            + "\n  ...failed moves:  " + str(self.moves["failed"])
+
+
+STAGE_CLASSES = {stage.name: stage for stage in (CensusStage, LowercaseStage, ExifStage, DatefixStage, SortStage)}
+
+
+def run_pipeline(directory, stages, args, walk_options={}, report_options={}):
+
+    start = time.time()
+    with Reporter(os.path.join(directory, "./pipeline.rep"), **report_options) as log:
+
+        message = "\n===================== pipeline.py =====================\n" \
+                            + "\n     Processing directory: " + directory \
+                            + "\n     Stages: " + ", ".join(stages) + "\n"
+        log.summary(message)
+
+        stages = [STAGE_CLASSES[name](args) for name in stages]
+        batch = []
+        # stat is fetched on the walker threads, so the census needs no extra syscalls
+        for entry in treewalker.walk_files(directory, stat=True, **walk_options):
+            batch.append(FileRecord(entry))
+            if len(batch) >= BATCH_SIZE:
+                for stage in stages:
+                    stage.process(batch, log)
+                log.tick(len(batch))
+                batch = []
+        if batch:
+            for stage in stages:
+                stage.process(batch, log)
+            log.tick(len(batch))
+
+        for stage in stages:
+            stage.close()
+        message = "\n\n  Script finished:" + "".join(stage.summary() for stage in stages)
+        log.summary(message)
+
+        message = f"\n\n    Script runtime: {round(time.time()-start)} seconds" \
+                            + "\n======================= end of script =======================\n"
+        log.summary(message)
+
+
+def _interrupt(signum, frame):
+    raise KeyboardInterrupt
+
+
+def watch_pipeline(directory, stages, args, walk_options={}, report_options={}):
+
+    start = time.time()
+    with Reporter(os.path.join(directory, "./pipeline.rep"), **report_options) as log:
+        # the sort stage moving files into a watched directory would feed them back in
+        exclude = [path for path in (getattr(args, "destination", None), getattr(args, "exceptions", None)) if path]
+        watcher = TreeWatcher(directory, exclude, args.poll, args.poll_interval, walk_options)
+
+        message = "\n===================== pipeline.py --watch =====================\n" \
+                            + "\n     Watching directory: " + directory + f" ({watcher.mode})" \
+                            + "\n     Stages: " + ", ".join(stages) + "\n"
+        if watcher.fallback_reason:
+            message += "     " + watcher.fallback_reason + "\n"
+        log.summary(message)
+
+        stages = [STAGE_CLASSES[name](args) for name in stages]
+        debouncer = Debouncer(args.settle)
+        # path -> (size, mtime_ns) after the stages, so the stages' own writes are not picked up again; an entry
+        # is dropped when that write comes back, as a file gone from the tree never does it is bounded as well
+        handled = {}
+        batches = 0
+        files = 0
+        signal.signal(signal.SIGTERM, _interrupt)
+        try:
+            while True:
+                mode = watcher.mode
+                deadline = debouncer.next_deadline()
+                timeout = MAX_WAIT if deadline is None else min(MAX_WAIT, max(0.0, deadline - time.monotonic()))
+                for path in watcher.poll(timeout):
+                    debouncer.touch(path)
+                if watcher.mode != mode:
+                    log.summary("\n  " + watcher.fallback_reason)
+                ready = [(path, stat) for path, stat in debouncer.ready()
+                         if handled.pop(path, None) != (stat.st_size, stat.st_mtime_ns)]
+                for i in range(0, len(ready), BATCH_SIZE):
+                    batch = [FileRecord.from_path(path, stat) for path, stat in ready[i:i + BATCH_SIZE]]
+                    for stage in stages:
+                        stage.process(batch, log)
+                    for record in batch:
+                        try:
+                            stat = os.stat(record.path)
+                        except OSError:
+                            continue        # moved away by the sort stage
+                        handled[record.path] = (stat.st_size, stat.st_mtime_ns)
+                        if len(handled) > HANDLED_LIMIT:
+                            del handled[next(iter(handled))]
+                    batches += 1
+                    files += len(batch)
+                    log.tick(len(batch))
+                    log.flush()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            watcher.close()
+
+        for stage in stages:
+            stage.close()
+        message = f"\n\n  Watch stopped, {files} files processed in {batches} batches, " \
+                            + f"{len(debouncer.pending)} files were not settled yet:" \
+                            + "".join(stage.summary() for stage in stages)
+        log.summary(message)
+
+        message = f"\n\n    Script runtime: {round(time.time()-start)} seconds" \
+                            + "\n======================= end of script =======================\n"
+        log.summary(message)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run several of the scripts in one traversal of a directory tree.")
+    parser.add_argument("directory", help="targed directory")
+    parser.add_argument("--stages", default=",".join(STAGES),
+                        help=f"comma separated stages to run, in this order (default {','.join(STAGES)})")
+    parser.add_argument("--destination", help="destination directory of the sort stage")
+    parser.add_argument("--exceptions", help="exceptions directory of the sort stage")
+    parser.add_argument("--valid-years", default="", help="range of valid years of the sort stage, eg. 1990-2011")
+    parser.add_argument("--copy-workers", type=int, default=4, help="parallel cross-device copies of the sort stage")
+    parser.add_argument("--exiftool", default=default_exiftool_path(), help="path of the exiftool executable")
+    parser.add_argument("--sessions", type=int, default=2, help="number of exiftool processes kept open")
+    parser.add_argument("--write-mode", choices=["auto", "exiftool"], default="auto",
+                        help="how the exif stage writes dates, see namebasedexif")
+    parser.add_argument("--watch", action="store_true",
+                        help="keep running and process the files that are written or moved into the directory")
+    parser.add_argument("--settle", type=float, default=2.0,
+                        help="seconds a file must stay unchanged before --watch processes it")
+    parser.add_argument("--poll", action="store_true",
+                        help="with --watch, list the tree periodically instead of using inotify (network filesystems)")
+    parser.add_argument("--poll-interval", type=float, default=30.0,
+                        help="seconds between listings when polling, also when inotify is not available")
+    treewalker.add_walk_arguments(parser)
+    add_report_arguments(parser)
+    instrument.add_instrument_arguments(parser)
+    args = parser.parse_args()
+    instrument.start_run(args)
+
+    stages = [name.strip() for name in args.stages.split(",") if name.strip()]
+    unknown = [name for name in stages if name not in STAGE_CLASSES]
+    if unknown:
+        print(f"Error, unknown stages: {', '.join(unknown)}. Valid stages: {', '.join(STAGES)}")
+        sys.exit(1)
+    if not os.path.isdir(args.directory):
+        print(f"Error, '{args.directory}' is not a valid directory. Exiting...")
+        sys.exit(2)
+    if "sort" in stages:
+        vy = args.valid_years
+        if not args.destination or not os.path.isdir(args.destination) \
+                or not args.exceptions or not os.path.isdir(args.exceptions):
+            print("Error, the sort stage needs an existing --destination and --exceptions directory")
+            sys.exit(2)
+        if len(vy)!=9 or not vy[:4].isdigit() or not vy[5:].isdigit() or vy[5:]<vy[:4]:
+            print("Error, use correct --valid-years format (eg. 1990-2011)")
+            sys.exit(2)
+    if args.watch:
+        watch_pipeline(args.directory, stages, args, treewalker.walk_options(args), report_options(args))
+    else:
+        run_pipeline(args.directory, stages, args, treewalker.walk_options(args), report_options(args))
@@ -1,56 +1,280 @@
 """
-    Recursively traverses a directory and renames all files lowercase (thanks Gemini for the initial direction ;-)
+    Recursively traverses a directory and renames all files and directories lowercase (thanks Gemini for the initial direction ;-)
 """
 
 import os
 import time
 import sys
+import queue
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
-def list_filetypes(directory):
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "common"))
+import treewalker
+import instrument
+from reporter import Reporter, add_report_arguments, report_options
+from journal import Journal, read_journal
+
+
+JOURNAL_FILE = "renamelowercase.journal"
+
+
+def safe_rename(old_path, new_path):
+    """
+    os.rename that never replaces another file: on Linux os.rename silently overwrites an existing
+    target. A target that is the same file (a case-only rename on a case-insensitive filesystem) is fine.
+    """
+    try:
+        target = os.lstat(new_path)
+    except FileNotFoundError:
+        pass
+    else:
+        if not os.path.samestat(target, os.lstat(old_path)):
+            raise FileExistsError(f"'{new_path}' already exists")
+    os.rename(old_path, new_path)
 
-    start = time.time()
-    log = open(os.path.join(directory, "./renamelowercase.rep"), 'w') 
 
+def rename_file(old_filepath, log):
+    """Rename one file lowercase, returns the path the file has afterwards."""
+    filename = os.path.basename(old_filepath)
+    new_filename = filename.lower()
+    new_filepath = os.path.join(os.path.dirname(old_filepath), new_filename)
 
-    message = "\n===================== renamelowercase.py =====================\n" \
-                        + "\n     Processing directory: " + directory +"\n"
-    log.write(message)
-    print(message)
+    if filename != new_filename: #only rename if needed.
+        log.write(f"\n      ...renaming file: {filename}")
+        try:
+            safe_rename(old_filepath, new_filepath)
+            log.file(new_filepath, "renamed", old=old_filepath)
+            return new_filepath
+        except FileExistsError:
+            log.error(f"\n Error: File '{new_filepath}' already exists.", path=old_filepath)
+        except Exception as e:
+            log.error(f"\n An unexpected error occurred: {e}", path=old_filepath)
+    return old_filepath
 
 
-    for root, _, files in os.walk(directory):
-        for filename in files:
+def plan_renames(names):
+    """
+    Returns [(old name, new name)] that makes the entries of one directory lowercase.
+    Every entry holds the casefolded slot of its current name, so a new name never lands on another
+    entry, also not on a case-insensitive filesystem. Entries are planned in sorted order and a taken
+    name gets a _1, _2... suffix, so the same directory always gets the same plan.
+    """
+    slots = {}      # casefolded name -> names of the entries holding it
+    for name in names:
+        slots.setdefault(name.casefold(), set()).add(name)
+    renames = []
+    for name in sorted(names):
+        new_name = name.lower()
+        if new_name == name:
+            continue
+        stem, ext = os.path.splitext(new_name)
+        i = 0
+        while not slots.get(new_name.casefold(), set()) <= {name}:
+            i += 1
+            new_name = f"{stem}_{i}{ext}"
+        slots.setdefault(new_name.casefold(), set()).add(name)
+        renames.append((name, new_name))
+    return renames
 
-            old_filepath = os.path.join(root, filename)
-            new_filename = filename.lower()
-            new_filepath = os.path.join(root, new_filename)
 
-            if os.path.isfile(old_filepath) and filename != new_filename: #only rename if needed.
-                log.write("\n      ...renaming file: ", filename)
+def _scan(path):
+    """Returns (names of the entries, subdirectory paths) of one directory."""
+    names = []
+    subdirs = []
+    try:
+        with os.scandir(path) as it:
+            for entry in it:
                 try:
-                    os.rename(old_filepath, new_filepath)
-                    print(f"\n Renamed '{old_filepath}' to '{new_filepath}'")
-                except FileExistsError:
-                    print(f"\n Error: File '{new_filepath}' already exists.")
-                except Exception as e:
-                    print(f"\n An unexpected error occurred: {e}")
+                    if entry.is_dir(follow_symlinks=False):
+                        subdirs.append(entry.path)
+                    elif entry.name in treewalker.REPORT_FILES:
+                        continue
+                except OSError:
+                    pass
+                names.append(entry.name)
+    except OSError:
+        pass        # like os.walk, unreadable directories are skipped
+    return names, subdirs
+
+
+class RenameEngine:
+    """
+    Makes all file and directory names below a directory lowercase. Directories are listed on a
+    thread pool; the entries of a directory are renamed once all its subdirectories are done, so a
+    rename never changes a path another thread is still working under, and independent directories
+    are renamed in parallel. Every rename is written to the journal before the next one in that directory.
+    """
+
+    def __init__(self, directory, log, journal, threads=8):
+        self.directory = directory
+        self.log = log
+        self.journal = journal
+        self.threads = threads
+        self.counts = {"files": 0, "dirs": 0, "suffixed": 0, "failed": 0, "entries": 0}
+        self._lock = threading.Lock()
+
+    def _rename_dir(self, path, names, subdirs):
+        subdirs = {os.path.basename(subdir) for subdir in subdirs}
+        counts = {"files": 0, "dirs": 0, "suffixed": 0, "failed": 0}
+        for name, new_name in plan_renames(names):
+            old_path = os.path.join(path, name)
+            new_path = os.path.join(path, new_name)
+            kind = "dirs" if name in subdirs else "files"
+            try:
+                safe_rename(old_path, new_path)
+            except OSError as e:
+                counts["failed"] += 1
+                self.log.error(f"\n Error renaming '{old_path}': {e}", path=old_path)
+                continue
+            # absolute, so --undo works from any directory
+            self.journal.write("rename", src=os.path.abspath(old_path), dst=os.path.abspath(new_path))
+            counts[kind] += 1
+            message = f"\n      ...renaming {'directory' if kind == 'dirs' else 'file'}: {name}"
+            if new_name != name.lower():
+                counts["suffixed"] += 1
+                message += f" -> {new_name} (lowercase name taken)"
+            self.log.write(message)
+            self.log.file(new_path, "renamed", old=old_path)
+        with self._lock:
+            for key, value in counts.items():
+                self.counts[key] += value
+            self.counts["entries"] += len(names)
+        self.log.tick(len(names))
+
+    def run(self):
+        done = queue.Queue()        # the workers report here, only this thread touches nodes
+        nodes = {}                  # directory -> [parent, subdirectories not done yet, names, subdirectories]
+        errors = []                 # unexpected exceptions of the workers, raised once the tree is done
+
+        # both tasks always report back, also when they fail, or the loop below would wait forever
+        def scan(path, parent):
+            names, subdirs = [], []
+            try:
+                names, subdirs = _scan(path)
+            except BaseException as e:
+                errors.append(e)
+            finally:
+                done.put(("scanned", path, parent, names, subdirs))
+
+        def rename(path, names, subdirs):
+            try:
+                self._rename_dir(path, names, subdirs)
+            except BaseException as e:
+                errors.append(e)
+            finally:
+                done.put(("renamed", path, None, None, None))
+
+        with ThreadPoolExecutor(max_workers=self.threads) as executor:
+            executor.submit(scan, self.directory, None)
+            while True:
+                event, path, parent, names, subdirs = done.get()
+                if event == "scanned":
+                    nodes[path] = [parent, len(subdirs), names, subdirs]
+                    for subdir in subdirs:
+                        executor.submit(scan, subdir, path)
+                    if not subdirs:
+                        executor.submit(rename, path, names, subdirs)
+                    continue
+                parent = nodes.pop(path)[0]
+                if parent is None:
+                    break
+                node = nodes[parent]
+                node[1] -= 1
+                if node[1] == 0:
+                    executor.submit(rename, parent, node[2], node[3])
+        if errors:
+            raise errors[0]
+        return self.counts
+
 
-                
-    message = f"\n\n    Script runtime: {round(time.time()-start)} seconds" \
-                        + "\n======================= end of script =======================\n"
-    log.write(message)
-    print(message)
-    log.close()
+def journal_renames(path):
+    """The renames of the last run in a journal that are not undone yet, in the order they were done."""
+    renames = []
+    undone = set()
+    for record in read_journal(path):
+        op = record.get("op")
+        if op == "run":
+            renames = []
+            undone = set()
+        elif op == "rename":
+            renames.append((record["src"], record["dst"]))
+        elif op == "undone":
+            undone.add((record["dst"], record["src"]))
+    return [rename for rename in renames if rename not in undone]
+
+
+def undo_renames(path, report_options={}):
+    """Rename everything the last run in a journal renamed back, newest first."""
+    renames = journal_renames(path)
+    with Reporter(os.path.join(os.path.dirname(path), "./renamelowercase.rep"), append=True, total=len(renames),
+                  **report_options) as log:
+        log.summary(f"\n\n===================== renamelowercase.py undo of {path} =====================\n")
+        journal = Journal(path)
+        undone = failed = 0
+        for old_path, new_path in reversed(renames):
+            try:
+                safe_rename(new_path, old_path)
+                journal.write("undone", src=new_path, dst=old_path)
+                log.write(f"\n      ...renamed back: {new_path} -> {os.path.basename(old_path)}")
+                undone += 1
+            except OSError as e:
+                log.error(f"\n Error renaming back '{new_path}': {e}", path=new_path)
+                failed += 1
+            log.tick()
+        journal.close()
+        log.summary(f"\n\n  Undone renames: {undone}\n  ...failed: {failed}\n")
+
+
+def list_filetypes(directory, walk_options={}, report_options={}, journal_path=None):
+
+    start = time.time()
+    with Reporter(os.path.join(directory, "./renamelowercase.rep"), **report_options) as log:
+
+
+        message = "\n===================== renamelowercase.py =====================\n" \
+                            + "\n     Processing directory: " + directory +"\n"
+        log.summary(message)
+
+        journal = Journal(journal_path or os.path.join(directory, JOURNAL_FILE))
+        journal.write("run", directory=os.path.abspath(directory))
+        # --ordered renames one directory at a time, so the report comes out in the same order every run
+        threads = 1 if walk_options.get("ordered") else walk_options.get("threads", treewalker.DEFAULT_THREADS)
+        counts = RenameEngine(directory, log, journal, threads).run()
+        journal.write("finished")
+        journal.close()
+
+        message = f"\n\n  Script finished, looked at {counts['entries']} names:" \
+                            + f"\n   .......... files renamed: {counts['files']}" \
+                            + f"\n   .......... directories renamed: {counts['dirs']}" \
+                            + f"\n   .......... given a suffix because the lowercase name was taken: {counts['suffixed']}" \
+                            + f"\n   .......... failed: {counts['failed']}"
+        log.summary(message)
+
+        message = f"\n\n    Script runtime: {round(time.time()-start)} seconds" \
+                            + "\n======================= end of script =======================\n"
+        log.summary(message)
 
 
 if __name__ == "__main__":
-    if len(sys.argv) != 2:
-        print("Error, provide a targed directory as argument.")
-        sys.exit(1)
-    else:
-        target_directory = sys.argv[1]
-        if not os.path.isdir(target_directory):
-            print(f"Error, '{target_directory}' is not a valid directory. Exiting...")
+    parser = argparse.ArgumentParser(description="Rename all files in a directory tree lowercase.")
+    parser.add_argument("directory", nargs="?", help="targed directory")
+    parser.add_argument("--journal", help=f"rename journal (default: {JOURNAL_FILE} in the targed directory)")
+    parser.add_argument("--undo", metavar="JOURNAL", help="rename everything the last run in a journal renamed back")
+    treewalker.add_walk_arguments(parser)
+    add_report_arguments(parser)
+    instrument.add_instrument_arguments(parser)
+    args = parser.parse_args()
+    instrument.start_run(args)
+
+    if args.undo:
+        if not os.path.isfile(args.undo):
+            print(f"Error, journal does not exist: {args.undo}")
             sys.exit(2)
-        else:
-            list_filetypes(target_directory)
\ No newline at end of file
+        undo_renames(args.undo, report_options(args))
+    elif args.directory is None or not os.path.isdir(args.directory):
+        print(f"Error, '{args.directory}' is not a valid directory. Exiting...")
+        sys.exit(2)
+    else:
+        list_filetypes(args.directory, treewalker.walk_options(args), report_options(args), args.journal)
@@ -0,0 +1,62 @@
+"""The library catalog: dates resolved from folders and names, and settle() after files were moved in."""
+
+import os
+import time
+
+import pytest
+
+import catalog
+from catalog import Catalog, resolve_date
+
+
+@pytest.mark.parametrize("directory, name, expected", [
+    (os.path.join("2019", "07"), "20190704_101500.jpg", "2019-07-04 10:15:00"),
+    (os.path.join("2019", "07"), "20200101_000000.jpg", "2019-07"),     # the folder wins a disagreement
+    ("", "20190704.jpg", "2019-07-04 00:00:00"),
+    (os.path.join("2019", "07"), "0001.jpg", "2019-07"),
+    ("", "0001.jpg", None),             # counters are no dates
+    ("", "1234.jpg", None),
+    ("", "1969-12-31.png", "1969-12-31 00:00:00"),
+    ("", "DSC01234.JPG", None),
+])
+def test_resolve_date(directory, name, expected):
+    assert resolve_date(directory, name) == expected
+
+
+def test_settle_catalogs_files_added_by_others(tmp_path, monkeypatch):
+    root = tmp_path / "library"
+    (root / "2019" / "07").mkdir(parents=True)
+    (root / "2019" / "07" / "20190701_000000.jpg").write_bytes(b"a")
+    monkeypatch.setattr(catalog, "RACY_SECONDS", 0)
+    library = Catalog(str(tmp_path / "library.catalog"), str(root))
+    library.refresh()
+
+    # a move into the tree, recorded, and a file another process adds meanwhile
+    moved = root / "2019" / "07" / "20190702_000000.jpg"
+    moved.write_bytes(b"bb")
+    library.record(str(moved))
+    (root / "2019" / "07" / "20190703_000000.jpg").write_bytes(b"ccc")
+    (root / "2020" / "01").mkdir(parents=True)
+    (root / "2020" / "01" / "20200101_000000.jpg").write_bytes(b"d")
+    library.record(str(root / "2020" / "01" / "20200101_000000.jpg"))
+    time.sleep(0.01)
+    library.settle()
+
+    names = sorted(os.path.basename(path) for path, _, _ in library.files())
+    assert names == ["20190701_000000.jpg", "20190702_000000.jpg", "20190703_000000.jpg", "20200101_000000.jpg"]
+    assert library.refresh() == (5, 0)      # everything settled, nothing to list again
+    library.close()
+
+
+def test_settle_keeps_no_mtime_for_a_directory_that_just_changed(tmp_path):
+    root = tmp_path / "library"
+    (root / "2019" / "07").mkdir(parents=True)
+    library = Catalog(str(tmp_path / "library.catalog"), str(root))
+    library.refresh()
+    moved = root / "2019" / "07" / "20190702_000000.jpg"
+    moved.write_bytes(b"bb")
+    library.record(str(moved))
+    library.settle()
+    mtime, = library.db.execute("SELECT mtime_ns FROM dirs WHERE path=?", (os.path.join("2019", "07"),)).fetchone()
+    assert mtime is None
+    library.close()
@@ -0,0 +1,43 @@
+"""Duplicate detection against the hash index of an archive, and dry runs that leave the index alone."""
+
+import os
+
+from duplicates import HashIndex, find_duplicate_groups
+
+
+def test_readonly_index_is_unchanged_by_a_plan(tmp_path):
+    archive = tmp_path / "archive"
+    archive.mkdir()
+    (archive / "a.jpg").write_bytes(b"a" * 300_000)
+    index_path = str(archive / "orderbydate.hashes")
+    HashIndex(index_path, str(archive)).close()
+    # added after the index was last refreshed, a plan still has to see it
+    (archive / "b.jpg").write_bytes(b"b" * 300_000)
+    new = tmp_path / "new"
+    new.mkdir()
+    (new / "b.jpg").write_bytes(b"b" * 300_000)
+    before = open(index_path, "rb").read()
+
+    index = HashIndex(index_path, str(archive), readonly=True)
+    index.refresh()
+    groups = find_duplicate_groups([(str(new / "b.jpg"), 300_000)], 1, index)
+    index.close()
+
+    assert groups == [([str(archive / "b.jpg")], [str(new / "b.jpg")])]
+    assert open(index_path, "rb").read() == before
+    assert not os.path.exists(index_path + "-journal")
+
+
+def test_hashes_are_kept_by_close(tmp_path):
+    archive = tmp_path / "archive"
+    archive.mkdir()
+    (archive / "a.jpg").write_bytes(b"a" * 1000)
+    (tmp_path / "a.jpg").write_bytes(b"a" * 1000)
+    index_path = str(tmp_path / "orderbydate.hashes")
+    index = HashIndex(index_path, str(archive))
+    index.refresh()
+    find_duplicate_groups([(str(tmp_path / "a.jpg"), 1000)], 1, index)
+    index.close()
+    index = HashIndex(index_path, str(archive))
+    assert index.lookup(1000)[0][1] is not None
+    index.close()
@@ -0,0 +1,84 @@
+"""
+The exiftool driver against common/fakeexiftool.py: stay_open batching, error replies and replacing
+a session whose process died.
+"""
+
+import os
+
+import pytest
+
+from exiftoolpool import ExifToolPool, ExifToolSession
+
+FAKE_EXIFTOOL = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "common", "fakeexiftool.py")
+
+
+@pytest.fixture
+def files(tmp_path, monkeypatch):
+    monkeypatch.setenv("FAKE_EXIFTOOL_DB", str(tmp_path / "db"))
+    paths = []
+    for i in range(7):
+        path = tmp_path / f"2023010{i}_120000.jpg"
+        path.write_bytes(b"not really a jpeg")
+        paths.append(str(path))
+    return paths
+
+
+def test_session_runs_many_commands_in_one_process(files):
+    session = ExifToolSession(FAKE_EXIFTOOL)
+    try:
+        pid = session.process.pid
+        outputs = session.execute_many([["-json", path] for path in files])
+        assert len(outputs) == len(files)
+        for path, (stdout, stderr) in zip(files, outputs):
+            assert path in stdout
+            assert stderr == ""
+        metadata, stderr = session.read_metadata(files)
+        assert sorted(metadata) == sorted(files)
+        assert session.process.pid == pid
+        assert session.process.poll() is None
+    finally:
+        session.close()
+    assert session.process.poll() is not None
+
+
+def test_pool_batches_reads_and_writes(files):
+    with ExifToolPool(FAKE_EXIFTOOL, sessions=2, batch_size=3) as pool:
+        results = pool.write_dates([(path, "2023:01:01 12:00:00") for path in files])
+        assert [ok for _, ok, _ in results] == [True] * len(files)
+        metadata, errors = pool.read_metadata(files)
+        assert errors == []
+        assert {path: fields["CreateDate"] for path, fields in metadata.items()} \
+            == {path: "2023:01:01 12:00:00" for path in files}
+        assert 1 <= len(pool._sessions) <= 2
+        # 7 files in batches of 3: three -json commands and seven write commands in all
+        assert sum(session._counter for session in pool._sessions) == 3 + len(files)
+
+
+def test_error_replies(files, tmp_path):
+    missing = str(tmp_path / "missing.jpg")
+    with ExifToolPool(FAKE_EXIFTOOL, sessions=1, batch_size=10) as pool:
+        metadata, errors = pool.read_metadata([files[0], missing])
+        assert list(metadata) == [files[0]]
+        assert len(errors) == 1 and "File not found" in errors[0] and missing in errors[0]
+
+        results = pool.write_dates([(missing, "2023:01:01 12:00:00"), (files[1], "2023:01:01 12:00:00")])
+        (path, ok, message), (other, other_ok, _) = results
+        assert (path, ok) == (missing, False)
+        assert "File not found" in message
+        assert (other, other_ok) == (files[1], True)
+        # the session survives the errors
+        assert pool._sessions[0].process.poll() is None
+
+
+def test_dead_session_is_replaced(files):
+    with ExifToolPool(FAKE_EXIFTOOL, sessions=1, batch_size=10) as pool:
+        pool.read_metadata(files[:1])
+        dead = pool._sessions[0]
+        dead.process.kill()
+        dead.process.wait()
+        metadata, errors = pool.read_metadata(files)
+        assert sorted(metadata) == sorted(files)
+        assert errors == []
+        assert len(pool._sessions) == 1
+        assert pool._sessions[0] is not dead
+        assert pool._sessions[0].process.poll() is None
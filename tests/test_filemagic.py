@@ -0,0 +1,24 @@
+"""File types from the first bytes: signatures that need more than their magic to be trusted."""
+
+import struct
+
+import pytest
+
+from filemagic import sniff
+
+
+def bmp_head(dib_size=40, pixel_offset=54):
+    return b"BM" + struct.pack("<IHHII", 70, 0, 0, pixel_offset, dib_size) + bytes(46)
+
+
+@pytest.mark.parametrize("head, expected", [
+    (bmp_head(), "BMP"),
+    (bmp_head(dib_size=12, pixel_offset=26), "BMP"),
+    (bmp_head(dib_size=124, pixel_offset=138), "BMP"),
+    (b"BMW service history 2019\n" * 3, None),      # text that starts with BM
+    (bmp_head(dib_size=41), None),
+    (bmp_head(pixel_offset=20), None),              # pixel data inside the DIB header
+    (b"BM", None),
+])
+def test_bmp_needs_a_dib_header(head, expected):
+    assert sniff(head[:64]) == expected
@@ -0,0 +1,207 @@
+"""
+Parity of common/filenamedate.py with the per-script date ladders it replaced (changemodificationdate
+and namebasedexif as they were before the shared parser), which are kept here as the reference.
+"""
+
+import re
+import math
+import time
+import random
+import datetime
+import zoneinfo
+
+import pytest
+
+import filenamedate
+
+
+def ladder_changemodificationdate(filename):
+    f = filename.replace("-", "")
+    f = f.replace("_", "")
+    f = f.replace(".", "")
+    year = 0
+    month = 1
+    day = 1
+    hour = 0
+    minute = 0
+    second = 0
+    if len(f) > 4:
+        tmp = f[:4]
+        if tmp.isdigit():
+            tmp = int(tmp)
+            if tmp < 1970:
+                year = 1970
+            elif tmp >= 1970 and tmp <= datetime.date.today().year:
+                year = tmp
+    if year == 0:
+        return None
+    if len(f) > 6:
+        tmp = f[4:6]
+        if tmp.isdigit() and 1 <= int(tmp) <= 12:
+            month = int(tmp)
+    if len(f) > 8:
+        tmp = f[6:8]
+        if tmp.isdigit() and 1 <= int(tmp) <= 31:
+            day = int(tmp)
+    if len(f) > 10:
+        tmp = f[8:10]
+        if tmp.isdigit() and 0 <= int(tmp) <= 23:
+            hour = int(tmp)
+    if len(f) > 12:
+        tmp = f[10:12]
+        if tmp.isdigit() and 0 <= int(tmp) <= 59:
+            minute = int(tmp)
+    if len(f) > 14:
+        tmp = f[12:14]
+        if tmp.isdigit() and 0 <= int(tmp) <= 59:
+            second = int(tmp)
+    return year, month, day, hour, minute, second
+
+
+def ladder_namebasedexif(filename):
+    f = re.sub(r"[^\d]", "", filename) + " "
+    year = 0
+    month = 1
+    day = 1
+    hour = 0
+    minute = 0
+    second = 0
+    if len(f) > 4:
+        tmp = f[:4]
+        if tmp.isdigit():
+            tmp = int(tmp)
+            if tmp <= datetime.date.today().year:
+                year = tmp
+    if year == 0:
+        return None
+    if len(f) > 6:
+        tmp = f[4:6]
+        if tmp.isdigit() and 1 <= int(tmp) <= 12:
+            month = int(tmp)
+    if len(f) > 8:
+        tmp = f[6:8]
+        if tmp.isdigit() and 1 <= int(tmp) <= 31:
+            day = int(tmp)
+    if len(f) > 10:
+        tmp = f[8:10]
+        if tmp.isdigit() and 0 <= int(tmp) <= 23:
+            hour = int(tmp)
+    if len(f) > 12:
+        tmp = f[10:12]
+        if tmp.isdigit() and 0 <= int(tmp) <= 59:
+            minute = int(tmp)
+    if len(f) > 14:
+        tmp = f[12:14]
+        if tmp.isdigit() and 0 <= int(tmp) <= 59:
+            second = int(tmp)
+    return year, month, day, hour, minute, second
+
+
+def ladder_timestamp(fields):
+    return time.mktime(datetime.datetime(*fields).timetuple())
+
+
+def valid_timestamps(fields, tz):
+    """
+    The timestamps a local time can stand for: one, or two for a time that is repeated or skipped
+    when the offset changes (mktime picks one of them depending on its earlier calls).
+    """
+    local = datetime.datetime(*fields, tzinfo=zoneinfo.ZoneInfo(tz))
+    return {local.replace(fold=0).timestamp(), local.replace(fold=1).timestamp()}
+
+
+NAMES = ["20230101_120000.jpg", "IMG-20190203-WA0001.jpg", "2021-07-04 10.00.00.mp4", "20230101.jpg",
+         "20230101", "2023", "20231", "1969-12-31.png", "0000.jpg", "0001.jpg", "1234.jpg", "99991231.jpg",
+         "20231332_256161.jpg", "2023ab01_1a2b3c.jpg", "20230229_000000.jpg", "20240229_235959.heic",
+         "DSC01234.JPG", "Scan (3).jpg", "", ".", "-_.", "2023-02-31.txt", "19700101000000"]
+
+
+def random_names(count, seed):
+    rng = random.Random(seed)
+    alphabets = ["0123456789", "0123456789-_.", "0123456789-_. abcXYZ", "0123456789" * 4 + "-_ab"]
+    names = []
+    for _ in range(count):
+        alphabet = rng.choice(alphabets)
+        prefix = rng.choice(["", "", str(rng.randint(1900, 2100)), f"{rng.randint(1960, 2030)}{rng.randint(0, 1399):04d}"])
+        names.append(prefix + "".join(rng.choice(alphabet) for _ in range(rng.randint(0, 18))))
+    return names
+
+
+@pytest.mark.parametrize("profile, ladder", [(filenamedate.SEPARATORS, ladder_changemodificationdate),
+                                             (filenamedate.DIGITS, ladder_namebasedexif)])
+def test_fields_match_the_old_ladders(profile, ladder):
+    for name in NAMES + random_names(20000, seed=7):
+        assert filenamedate.parse_name(name, profile) == ladder(name), name
+
+
+@pytest.mark.parametrize("tz", ["UTC", "Europe/Amsterdam", "America/New_York", "Australia/Lord_Howe"])
+def test_timestamps_match_mktime(tz, monkeypatch):
+    if not hasattr(time, "tzset"):
+        pytest.skip("time.tzset is not available on this platform")
+    monkeypatch.setenv("TZ", tz)
+    time.tzset()
+    filenamedate._hour_start.cache_clear()
+    try:
+        for name in NAMES + random_names(5000, seed=11):
+            fields = filenamedate.parse_name(name, filenamedate.SEPARATORS)
+            if fields is None:
+                continue
+            try:
+                expected = ladder_timestamp(fields)
+            except (ValueError, OverflowError):
+                with pytest.raises((ValueError, OverflowError)):
+                    filenamedate.to_timestamp(fields)
+                continue
+            assert filenamedate.to_timestamp(fields) in valid_timestamps(fields, tz) | {expected}, name
+    finally:
+        monkeypatch.undo()
+        time.tzset()
+        filenamedate._hour_start.cache_clear()
+
+
+def test_half_hour_offset_change(monkeypatch):
+    """Lord Howe Island moves its clock by 30 minutes, in the middle of an hour."""
+    if not hasattr(time, "tzset"):
+        pytest.skip("time.tzset is not available on this platform")
+    monkeypatch.setenv("TZ", "Australia/Lord_Howe")
+    time.tzset()
+    filenamedate._hour_start.cache_clear()
+    try:
+        for day in ((2023, 4, 2), (2023, 10, 1)):       # end and start of daylight saving time
+            for hour in range(0, 4):
+                for minute in range(60):
+                    fields = day + (hour, minute, 15)
+                    assert filenamedate.to_timestamp(fields) in valid_timestamps(fields, "Australia/Lord_Howe"), fields
+    finally:
+        monkeypatch.undo()
+        time.tzset()
+        filenamedate._hour_start.cache_clear()
+
+
+def test_year_after_the_current_year_is_no_date():
+    next_year = str(datetime.date.today().year + 1)
+    assert filenamedate.parse_name(next_year + "0101_000000.jpg") is None
+    assert filenamedate.parse_name(next_year + "0101_000000.jpg", filenamedate.DIGITS) is None
+
+
+def test_invalid_day_of_month():
+    with pytest.raises(ValueError):
+        filenamedate.to_timestamp((2023, 2, 30, 0, 0, 0))
+
+
+@pytest.mark.parametrize("profile", [filenamedate.SEPARATORS, filenamedate.DIGITS])
+def test_parse_batch_matches_to_timestamp(profile):
+    names = NAMES + random_names(5000, seed=13)
+    fields = []
+    timestamps = filenamedate.parse_batch(names, profile, fields)
+    assert timestamps.typecode == "d" and len(timestamps) == len(names) == len(fields)
+    for name, timestamp, parsed in zip(names, timestamps, fields):
+        expected = filenamedate.parse_name(name, profile)
+        assert parsed == expected, name
+        if expected is None:
+            assert math.isnan(timestamp), name
+            continue
+        try:
+            assert timestamp == filenamedate.to_timestamp(expected), name
+        except (ValueError, OverflowError):
+            assert math.isnan(timestamp), name
@@ -0,0 +1,37 @@
+"""Instrumentation: the exact maximum beyond the reservoir, and measurements merged from workers."""
+
+import pytest
+
+import instrument
+
+
+@pytest.fixture
+def measuring(monkeypatch):
+    monkeypatch.setattr(instrument, "_enabled", True)
+    instrument.take()
+    yield
+    instrument.take()
+
+
+def test_max_is_exact_beyond_the_reservoir(measuring, monkeypatch):
+    monkeypatch.setattr(instrument, "MAX_SAMPLES", 10)
+    monkeypatch.setattr(instrument.time, "perf_counter_ns", lambda: 1_000_000_000)
+    for elapsed in [1000] * 500 + [900_000_000] + [1000] * 500:
+        instrument.stop("metadata.read", 1_000_000_000 - elapsed, histogram=True)
+    timer = instrument.summary()["timers"]["metadata.read"]
+    assert timer["count"] == 1001
+    assert timer["max_ms"] == 900.0
+
+
+def test_worker_measurements_are_merged(measuring, monkeypatch):
+    monkeypatch.setattr(instrument.time, "perf_counter_ns", lambda: 10_000_000)
+    instrument.stop("utime", 10_000_000 - 2_000_000, histogram=True)
+    instrument.count("files", 3)
+    worker = instrument.take()
+    assert instrument.summary()["timers"] == {}
+    instrument.stop("utime", 10_000_000 - 1_000_000, histogram=True)
+    instrument.merge(worker)
+    summary = instrument.summary()
+    assert summary["timers"]["utime"]["count"] == 2
+    assert summary["timers"]["utime"]["max_ms"] == 2.0
+    assert summary["counters"] == {"files": 3}
@@ -0,0 +1,51 @@
+"""The metadata cache: rows are only reused for the same file identity and name."""
+
+import os
+
+from metacache import MetadataCache, file_stat
+
+FIELDS = {"DateTimeOriginal": "2019:07:04 10:15:00"}
+
+
+class NoInodeEntry:
+    """A DirEntry as Windows lists it: stat() without st_ino and st_dev."""
+
+    def __init__(self, path):
+        self.path = path
+        self.name = os.path.basename(path)
+
+    def stat(self):
+        st = os.stat(self.path)
+        return os.stat_result((st.st_mode, 0, 0) + tuple(st)[3:7] + (st.st_atime, st.st_mtime, st.st_ctime),
+                              {"st_mtime_ns": st.st_mtime_ns})
+
+
+def test_file_stat_fills_in_the_identity(tmp_path):
+    path = tmp_path / "a.jpg"
+    path.write_bytes(b"a")
+    entry = NoInodeEntry(str(path))
+    assert entry.stat().st_ino == 0
+    assert file_stat(entry).st_ino == os.stat(path).st_ino
+
+
+def test_row_of_another_name_is_a_miss(tmp_path):
+    path = tmp_path / "a.jpg"
+    path.write_bytes(b"a")
+    cache = MetadataCache(str(tmp_path / "test.cache"))
+    st = os.stat(path)
+    cache.store(st, "a.jpg", FIELDS)
+    assert cache.lookup(st, "a.jpg") == (FIELDS, None)
+    assert cache.lookup(st, "b.jpg") is None
+    assert (cache.hits, cache.misses) == (1, 1)
+    cache.close()
+
+
+def test_no_identity_is_never_cached(tmp_path):
+    path = tmp_path / "a.jpg"
+    path.write_bytes(b"a")
+    cache = MetadataCache(str(tmp_path / "test.cache"))
+    st = NoInodeEntry(str(path)).stat()
+    cache.store(st, "a.jpg", FIELDS)
+    assert cache.lookup(st, "a.jpg") is None
+    assert cache.db.execute("SELECT COUNT(*) FROM files").fetchone()[0] == 0
+    cache.close()
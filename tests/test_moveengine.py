@@ -0,0 +1,33 @@
+"""Cross-device moves: the source is only deleted once the copy is read back and found identical."""
+
+import os
+
+import pytest
+
+import moveengine
+from moveengine import MoveError, copy_and_delete
+
+
+def test_copy_and_delete(tmp_path):
+    data = os.urandom(3_000_001)
+    (tmp_path / "a.jpg").write_bytes(data)
+    copy_and_delete(str(tmp_path / "a.jpg"), str(tmp_path / "b.jpg"), len(data))
+    assert (tmp_path / "b.jpg").read_bytes() == data
+    assert not (tmp_path / "a.jpg").exists()
+
+
+def test_corrupt_copy_keeps_the_source(tmp_path, monkeypatch):
+    data = os.urandom(300_000)
+    (tmp_path / "a.jpg").write_bytes(data)
+    kernel_copy = moveengine.kernel_copy
+
+    def corrupting_copy(src_fd, dst_fd, size):
+        copied = kernel_copy(src_fd, dst_fd, size)
+        os.pwrite(dst_fd, b"X", 1000)       # the size is right, the content is not
+        return copied
+
+    monkeypatch.setattr(moveengine, "kernel_copy", corrupting_copy)
+    with pytest.raises(MoveError):
+        copy_and_delete(str(tmp_path / "a.jpg"), str(tmp_path / "b.jpg"), len(data))
+    assert (tmp_path / "a.jpg").read_bytes() == data
+    assert not (tmp_path / "b.jpg").exists()
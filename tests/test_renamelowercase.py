@@ -0,0 +1,45 @@
+"""renamelowercase: undo from another directory, and a failing directory listing that must not hang the run."""
+
+import os
+import sys
+import subprocess
+
+import pytest
+
+SCRIPT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "renamelowercase")
+sys.path.insert(0, SCRIPT_DIR)
+import renamelowercase      # noqa: E402
+from reporter import Reporter       # noqa: E402
+from journal import Journal     # noqa: E402
+
+SCRIPT = os.path.join(SCRIPT_DIR, "renamelowercase.py")
+
+
+def test_undo_from_another_directory(tmp_path):
+    (tmp_path / "photos" / "Trip").mkdir(parents=True)
+    (tmp_path / "photos" / "Trip" / "IMG_1.JPG").write_bytes(b"a")
+    subprocess.run([sys.executable, SCRIPT, "photos", "--no-progress"], cwd=tmp_path, check=True,
+                   capture_output=True)
+    assert os.listdir(tmp_path / "photos" / "trip") == ["img_1.jpg"]
+    elsewhere = tmp_path / "elsewhere"
+    elsewhere.mkdir()
+    subprocess.run([sys.executable, SCRIPT, "--undo", str(tmp_path / "photos" / "renamelowercase.journal"),
+                    "--no-progress"], cwd=elsewhere, check=True, capture_output=True)
+    assert os.listdir(tmp_path / "photos" / "Trip") == ["IMG_1.JPG"]
+
+
+def test_unexpected_scan_error_is_raised(tmp_path, monkeypatch):
+    (tmp_path / "A" / "B").mkdir(parents=True)
+    scan = renamelowercase._scan
+
+    def failing_scan(path):
+        if path.endswith("B"):
+            raise RuntimeError("listing failed")
+        return scan(path)
+
+    monkeypatch.setattr(renamelowercase, "_scan", failing_scan)
+    with Reporter(str(tmp_path / "test.rep"), progress=False) as log:
+        journal = Journal(str(tmp_path / "test.journal"))
+        with pytest.raises(RuntimeError):
+            renamelowercase.RenameEngine(str(tmp_path), log, journal, threads=2).run()
+        journal.close()
@@ -0,0 +1,57 @@
+"""The Reporter surfaces a failing writer thread instead of hanging, and survives a closed stdout pipe."""
+
+import os
+import sys
+import threading
+import subprocess
+
+import pytest
+
+from reporter import Reporter
+
+COMMON = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "common")
+
+
+@pytest.mark.skipif(not os.path.exists("/dev/full"), reason="needs /dev/full")
+def test_writer_failure_is_raised():
+    outcome = []
+
+    def produce():
+        log = Reporter("/dev/full", progress=False)
+        try:
+            for _ in range(200000):     # far more chunks than the queue holds
+                log.write("x" * 100 + "\n")
+            log.close()
+        except OSError as e:
+            outcome.append(e)
+
+    thread = threading.Thread(target=produce, daemon=True)
+    thread.start()
+    thread.join(timeout=30)
+    assert not thread.is_alive(), "the producer blocked on the queue of a dead writer"
+    assert outcome and isinstance(outcome[0], OSError)
+
+
+def test_summary_survives_a_closed_pipe(tmp_path):
+    script = "import sys; sys.path.insert(0, sys.argv[1]); from reporter import Reporter\n" \
+             "with Reporter(sys.argv[2], progress=False) as log:\n" \
+             "    for i in range(20000):\n" \
+             "        log.summary('summary line %d' % i)\n" \
+             "    log.summary('last')\n"
+    report = str(tmp_path / "test.rep")
+    writer = subprocess.Popen([sys.executable, "-c", script, COMMON, report],
+                              stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    writer.stdout.readline()
+    writer.stdout.close()       # the reader goes away, like | head -1
+    _, stderr = writer.communicate(timeout=60)
+    assert writer.returncode == 0, stderr.decode()
+    assert b"BrokenPipeError" not in stderr
+    with open(report) as f:
+        assert f.read().rstrip().endswith("last")
+
+
+def test_file_statuses_are_counted(tmp_path):
+    with Reporter(str(tmp_path / "test.rep"), level="summary", progress=False) as log:
+        for status in ("written", "written", "failed", "skipped"):
+            log.file("a.jpg", status)
+    assert log.statuses == {"written": 2, "failed": 1, "skipped": 1}
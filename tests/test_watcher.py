@@ -0,0 +1,21 @@
+"""The polling fallback of the watcher: excluded trees are pruned, not listed and filtered."""
+
+import os
+
+from watcher import TreeWatcher
+
+
+def test_polling_does_not_walk_excluded_trees(tmp_path):
+    (tmp_path / "upload").mkdir()
+    (tmp_path / "upload" / "a.jpg").write_bytes(b"a")
+    deep = tmp_path / "sorted" / "2019" / "07"
+    deep.mkdir(parents=True)
+    (deep / "b.jpg").write_bytes(b"b")
+    watcher = TreeWatcher(str(tmp_path), exclude=[str(tmp_path / "sorted")], poll=True)
+    checked = []
+    excluded = watcher._excluded
+    watcher._excluded = lambda path: checked.append(path) or excluded(path)
+    assert watcher.poll(0) == [str(tmp_path / "upload" / "a.jpg")]
+    assert str(tmp_path / "sorted") in checked
+    assert not [path for path in checked if path.startswith(str(tmp_path / "sorted") + os.sep)]
+    watcher.close()